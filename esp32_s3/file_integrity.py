@@ -0,0 +1,92 @@
+# file_integrity.py End to end checks of files sent by file sync
+# Used by mqtt_file_sender.py, file_async_receiver.py and the
+# sha256_simple test message checks.
+
+# Every transfer names its method in the Header "Integrity" field, the End
+# step carries the base64 digest of the whole file made with it:
+#   "sha256"   uhashlib, done in hardware on ports that have it
+#   "crc32"    binascii.crc32, a C loop on every port and the cheapest
+#   "simple32" the 32 bit checksum of sha256_simple (the C test client's
+#              hash), a viper loop, or plain Python where there is no viper
+# Each frame already carries its own crc32, so the file check only has to
+# catch blocks that were written out of place or lost.
+# The manifests keep using sha256 to tell file versions apart.
+
+import struct
+import uhashlib
+import ubinascii
+from binascii import crc32
+
+SIMPLE_SEED = 0x5A5A5A5A
+HASH_BLOCK = 4096
+
+
+class Crc32:
+    def __init__(self):
+        self.crc = 0
+
+    def update(self, data):
+        self.crc = crc32(data, self.crc)
+
+    def digest(self):
+        return struct.pack(">I", self.crc)
+
+
+def _mix_python(value, buf, n, mask):
+    for i in range(n):
+        value = (value * 33 + buf[i]) & mask
+        value ^= value >> 16
+    return value
+
+
+try:
+    # The mask keeps the sum 32 bits on 64 bit ports such as unix
+    @micropython.viper
+    def _mix(value: uint, buf: ptr8, n: int, mask: uint) -> uint:
+        for i in range(n):
+            value = ((value << 5) + value + uint(buf[i])) & mask
+            value ^= value >> 16
+        return value
+
+except NameError:  # Not MicroPython
+    _mix = _mix_python
+
+
+class Simple32:
+    def __init__(self):
+        self.sum = SIMPLE_SEED
+
+    def update(self, data):
+        self.sum = _mix(self.sum, data, len(data), 0xFFFFFFFF)
+
+    def digest(self):
+        return struct.pack("<I", self.sum)
+
+
+METHODS = {"sha256": uhashlib.sha256, "crc32": Crc32, "simple32": Simple32}
+
+
+def supported():
+    return list(METHODS)
+
+
+# Returns a hash object with update(data) and digest(), like uhashlib.
+def new(method="sha256"):
+    return METHODS[method]()
+
+
+def b64digest(h):
+    return ubinascii.b2a_base64(h.digest())[:-1].decode()
+
+
+def hash_file(method, file_name):
+    buf = bytearray(HASH_BLOCK)
+    mv = memoryview(buf)
+    h = new(method)
+    with open(file_name, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(mv[:n])
+    return b64digest(h)
@@ -1,6 +1,9 @@
 import uasyncio as asyncio
 import uerrno
 import ujson
+import uos
+import utime
+from ucollections import OrderedDict
 
 class HttpError(Exception):
     pass
@@ -14,6 +17,7 @@ class Request:
         self.body = {}    
         self.route = ""
         self.read = None
+        self.readinto = None
         self.write = None
         self.close = None
 
@@ -29,6 +33,50 @@ async def error(request, code, reason):
     await request.write("<h1>%s</h1>" % (reason))
 
 
+def parse_range(header, size):
+    """Parse a single `Range: bytes=...` header
+
+    Returns (start, end) with `end` inclusive, None when the header is absent
+    or not a single byte range, and raises ValueError when the range is not
+    satisfiable for a file of `size` bytes.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[6:].strip().partition('-')
+    if first == '':
+        # Suffix range: the last N bytes
+        start = max(0, size - int(last))
+        end = size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+async def send_file_range(request, filename, start, length, segment=512):
+    """Send `length` bytes of `filename` starting at `start`
+
+    Reads through one preallocated buffer instead of allocating per segment.
+    """
+    buf = bytearray(segment)
+    mv = memoryview(buf)
+    try:
+        with open(filename, 'rb') as f:
+            f.seek(start)
+            while length > 0:
+                n = f.readinto(mv[:min(length, segment)])
+                if not n:
+                    break
+                await request.write(mv[:n])
+                length -= n
+    except OSError as e:
+        if e.args[0] != uerrno.ENOENT:
+            raise
+        raise HttpError(request, 404, "File Not Found")
+
+
 async def send_file(request, filename, segment=64, binary=False):
     try:
         with open(filename, 'rb' if binary else 'r') as f:
@@ -43,9 +91,120 @@ async def send_file(request, filename, segment=64, binary=False):
         raise HttpError(request, 404, "File Not Found")
 
 
+CONTENT_TYPES = {
+    'html': 'text/html',
+    'css': 'text/css',
+    'js': 'application/javascript',
+    'json': 'application/json',
+    'ico': 'image/x-icon',
+    'png': 'image/png',
+}
+
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+           'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def http_date(secs):
+    t = utime.gmtime(secs)
+    return '%s, %02d %s %04d %02d:%02d:%02d GMT' % (
+        _DAYS[t[6]], t[2], _MONTHS[t[1] - 1], t[0], t[3], t[4], t[5])
+
+
+class StaticCache:
+    """LRU cache of static file contents, bounded by total size in bytes"""
+    def __init__(self, max_bytes=16384, max_file_size=4096):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, filename, mtime):
+        entry = self.entries.get(filename)
+        if entry is None:
+            return None
+        del self.entries[filename]
+        if entry[0] != mtime:
+            # File was replaced (e.g. by an upload) since it was cached
+            self.size -= len(entry[1])
+            return None
+        self.entries[filename] = entry
+        return entry[1]
+
+    def put(self, filename, mtime, data):
+        if len(data) > self.max_file_size:
+            return
+        old = self.entries.pop(filename, None)
+        if old is not None:
+            self.size -= len(old[1])
+        while self.entries and self.size + len(data) > self.max_bytes:
+            evicted = self.entries.pop(next(iter(self.entries)))
+            self.size -= len(evicted[1])
+        self.entries[filename] = (mtime, data)
+        self.size += len(data)
+
+
+async def send_static(request, filename, cache=None,
+                      cache_control='max-age=3600', segment=512):
+    """Send a static file including the response headers
+
+    A pre-compressed `<filename>.gz` is sent instead when the client accepts
+    gzip, small files are served from `cache` and `If-Modified-Since` is
+    answered with 304.
+    """
+    extension = filename.rsplit('.', 1)[-1]
+    encoding = None
+
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        try:
+            stat = uos.stat(filename + '.gz')
+            filename += '.gz'
+            encoding = 'gzip'
+        except OSError:
+            pass
+
+    if encoding is None:
+        try:
+            stat = uos.stat(filename)
+        except OSError:
+            raise HttpError(request, 404, "File Not Found")
+
+    size, mtime = stat[6], stat[8]
+    last_modified = http_date(mtime)
+
+    if request.headers.get('If-Modified-Since') == last_modified:
+        await request.write("HTTP/1.1 304 Not Modified\r\n")
+        await request.write("Last-Modified: %s\r\n\r\n" % last_modified)
+        return
+
+    await request.write("HTTP/1.1 200 OK\r\n")
+    await request.write("Content-Type: %s\r\n" % CONTENT_TYPES.get(
+        extension, 'application/octet-stream'))
+    await request.write("Content-Length: %d\r\n" % size)
+    await request.write("Cache-Control: %s\r\n" % cache_control)
+    await request.write("Last-Modified: %s\r\n" % last_modified)
+    if encoding is not None:
+        await request.write("Content-Encoding: %s\r\n" % encoding)
+    await request.write("Vary: Accept-Encoding\r\n\r\n")
+
+    data = cache.get(filename, mtime) if cache is not None else None
+    if data is None and cache is not None and size <= cache.max_file_size:
+        with open(filename, 'rb') as f:
+            data = f.read()
+        cache.put(filename, mtime, data)
+
+    if data is not None:
+        await request.write(data)
+    else:
+        await send_file_range(request, filename, 0, size, segment=segment)
+
+
 class Nanoweb:
-    extract_headers = ('Authorization', 'Content-Length', 'Content-Type')
+    extract_headers = ('Authorization', 'Content-Length', 'Content-Type',
+                       'Accept-Encoding', 'If-Modified-Since')
     routes = {}
+    # Routes that read their own body, e.g. uploads, from request.readinto
+    stream_routes = ()
     assets_extensions = ('html', 'css', 'js')
 
     callback_request = None
@@ -53,10 +212,23 @@ class Nanoweb:
 
     STATIC_DIR = './'
     INDEX_FILE = STATIC_DIR + 'index.html'
+    CACHE_CONTROL = 'max-age=3600'
 
     def __init__(self, port=80, address='0.0.0.0'):
         self.port = port
         self.address = address
+        self.static_cache = StaticCache()
+
+    async def send_asset(self, request, filename):
+        await send_static(request, filename, self.static_cache,
+                          self.CACHE_CONTROL)
+
+    def is_stream_route(self, url):
+        for route in self.stream_routes:
+            if route == url or (route[-1] == '*' and
+                                url.startswith(route[:-1])):
+                return True
+        return False
 
     def route(self, route):
         """Route decorator"""
@@ -121,6 +293,7 @@ class Nanoweb:
         #self.logMsg("new request...headers")
         #self.logMsg(request.headers)
         request.read = reader.read
+        request.readinto = reader.readinto
         request.write = writer.awrite
         request.close = writer.aclose
         request.method, request.url, version = items
@@ -155,8 +328,11 @@ class Nanoweb:
  #                       self.logMsg("request.headers: " + str(type(request.headers)))
                         self.logMsg(request.headers)
                        
+                        # Uploads are left on the stream for the handler,
+                        # whatever their Content-Type
                         if (request.headers.get('Content-Length') != None
-                                and request.headers.get('Content-Length') != '0'):
+                                and request.headers.get('Content-Length') != '0'
+                                and not self.is_stream_route(request.url)):
                             self.logMsg("Content-Length present... " + value)                            
                             bytesleft = int(request.headers.get('Content-Length', 0))
                             self.logMsg("Todo item bytes left..." + str(bytesleft))
@@ -194,18 +370,17 @@ class Nanoweb:
                     else:
                         # 3. Try to load index file
                         if request.url in ('', '/'):
-                            await send_file(request, self.INDEX_FILE)
+                            await self.send_asset(request, self.INDEX_FILE)
                         else:
                             # 4. Current url have an assets extension ?
                             for extension in self.assets_extensions:
                                 if request.url.endswith('.' + extension):
-                                    await send_file(
+                                    await self.send_asset(
                                         request,
                                         '%s/%s' % (
                                             self.STATIC_DIR,
                                             request.url,
                                         ),
-                                        binary=True,
                                     )
                                     break
                             else:
@@ -228,6 +403,7 @@ class Nanoweb:
 
         request = Request()
         request.read = reader.read
+        request.readinto = reader.readinto
         request.write = writer.awrite
         request.close = writer.aclose
 
@@ -271,18 +447,17 @@ class Nanoweb:
                     else:
                         # 3. Try to load index file
                         if request.url in ('', '/'):
-                            await send_file(request, self.INDEX_FILE)
+                            await self.send_asset(request, self.INDEX_FILE)
                         else:
                             # 4. Current url have an assets extension ?
                             for extension in self.assets_extensions:
                                 if request.url.endswith('.' + extension):
-                                    await send_file(
+                                    await self.send_asset(
                                         request,
                                         '%s/%s' % (
                                             self.STATIC_DIR,
                                             request.url,
                                         ),
-                                        binary=True,
                                     )
                                     break
                             else:
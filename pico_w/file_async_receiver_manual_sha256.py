@@ -4,6 +4,7 @@ import gc
 import ujson
 import uhashlib
 import ubinascii
+import file_integrity
 import machine
 import os, uos
 import time
@@ -36,17 +37,14 @@ def sha256_simple(input_data):
         input_data = input_data.encode('utf8')
     
     input_len = len(input_data)
-    # Use standard uctypes or struct module for C-like 32-bit operations 
-    # or ensure Python's default large integers don't cause issues.
-    # & 0xFFFFFFFF ensures 32-bit wrap-around behavior.
-    sum_val = 0x5A5A5A5A & 0xFFFFFFFF 
     
     # --- Custom Checksum Logic ---
     
-    # Mix all input bytes
-    for i in range(input_len):
-        sum_val = (((sum_val << 5) + sum_val) + input_data[i]) & 0xFFFFFFFF
-        sum_val = (sum_val ^ (sum_val >> 16)) & 0xFFFFFFFF
+    # Mix all input bytes, in a viper loop (see file_integrity.py) rather
+    # than a Python statement per byte
+    checksum = file_integrity.Simple32()
+    checksum.update(input_data)
+    sum_val = checksum.sum
     
     # Generate 32 bytes of "hash" from the checksum
     hash_bytes = bytearray(32)
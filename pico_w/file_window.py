@@ -0,0 +1,177 @@
+# file_window.py Sliding window for file blocks sent over MQTT
+# Used by mqtt_file_sender.py (SendWindow) and file_async_receiver.py
+# (ReceiveWindow), on top of the frames in file_frame.py.
+
+# The receiver acknowledges with a JSON Ack step:
+#   {"Category": "Files", "Step": "Ack", "FileId": id, "Base": n, "Bitmap": b}
+# Base is the highest sequence number received in order. Bit i of Bitmap is
+# set when block Base + 2 + i has also arrived; Base + 1 is always missing.
+# The sender treats a gap below a received block as a NACK and resends only
+# that block. Blocks not acknowledged within the retransmit timeout are
+# resent as well.
+
+import uasyncio as asyncio
+from utime import ticks_ms, ticks_diff
+
+MAX_WINDOW = 16
+RTO_MIN = 200
+RTO_MAX = 8000
+RTT_FAST = 100  # Blocks grow while the smoothed RTT stays below this
+RTT_SLOW = 1000  # and shrink when it goes above this
+
+
+class SendWindow:
+    def __init__(self, window=4, block_size=1024, min_block=256, max_block=4096, max_bytes=16384):
+        self.window = window
+        self.block_size = block_size
+        self.min_block = min_block
+        self.max_block = max_block
+        self.max_bytes = max_bytes
+        self.frames = {}  # seq -> [frame, sent ms, resent, nacked]
+        self.in_flight = 0
+        self.srtt = None
+        self.rttvar = 0
+        self.rto = 1000
+        self.acked_since_grow = 0
+        self.last_cut = ticks_ms()
+        self.resent = 0
+        self.timeouts = 0
+        self._evt = asyncio.Event()
+
+    def can_send(self):
+        return len(self.frames) < self.window and self.in_flight + self.block_size <= self.max_bytes
+
+    def done(self):
+        return len(self.frames) == 0
+
+    def sent(self, seq, frame):
+        entry = self.frames.get(seq)
+        if entry is None:
+            self.frames[seq] = [frame, ticks_ms(), False, False]
+            self.in_flight += len(frame)
+        else:
+            entry[1] = ticks_ms()
+            entry[2] = True
+            entry[3] = False
+            self.resent += 1
+
+    # Returns (seq, frame) of the blocks to resend now: NACKed ones first,
+    # then those that timed out.
+    def due(self):
+        now = ticks_ms()
+        nacked = []
+        expired = []
+        for seq, entry in self.frames.items():
+            if entry[3]:
+                nacked.append(seq)
+            elif ticks_diff(now, entry[1]) > self.rto:
+                expired.append(seq)
+        if expired:
+            self.timeouts += 1
+            self.rto = min(RTO_MAX, self.rto * 2)
+            self._cut(now, True)
+        result = [(seq, self.frames[seq][0]) for seq in sorted(nacked)]
+        result += [(seq, self.frames[seq][0]) for seq in sorted(expired)]
+        return result
+
+    def on_ack(self, base, bitmap):
+        now = ticks_ms()
+        acked = [seq for seq in self.frames if seq <= base or (seq > base + 1 and bitmap >> (seq - base - 2) & 1)]
+        highest = max(acked) if acked else base
+        for seq in acked:
+            frame, sent, resent, nacked = self.frames.pop(seq)
+            self.in_flight -= len(frame)
+            # Karn: resent blocks give no RTT sample
+            if seq == highest and not resent:
+                self._sample(ticks_diff(now, sent))
+        gap = False
+        for seq, entry in self.frames.items():
+            # A block sent before one that arrived is missing, unless it was
+            # resent less than an RTT ago
+            if seq < highest and not entry[3] and ticks_diff(now, entry[1]) > (self.srtt or 0):
+                entry[3] = True
+                gap = True
+        if gap:
+            self._cut(now, False)
+        elif acked:
+            self.acked_since_grow += len(acked)
+            # About one block more per round trip
+            if self.acked_since_grow >= self.window:
+                self.acked_since_grow = 0
+                self.window = min(MAX_WINDOW, self.window + 1)
+                if self.srtt is not None and self.srtt < RTT_FAST:
+                    self.block_size = min(self.max_block, self.block_size * 2)
+        self._evt.set()
+
+    def _sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt // 2
+        else:
+            self.rttvar += (abs(self.srtt - rtt) - self.rttvar) // 4
+            self.srtt += (rtt - self.srtt) // 8
+        self.rto = max(RTO_MIN, min(RTO_MAX, self.srtt + 4 * self.rttvar))
+        if self.srtt > RTT_SLOW:
+            self.block_size = max(self.min_block, self.block_size // 2)
+
+    def _cut(self, now, timeout):
+        # Halve the window at most once per round trip
+        if timeout or ticks_diff(now, self.last_cut) > (self.srtt or self.rto):
+            self.last_cut = now
+            self.window = max(1, self.window // 2)
+            self.block_size = max(self.min_block, self.block_size // 2)
+            self.acked_since_grow = 0
+
+    def wake(self):
+        self._evt.set()
+
+    # Waits for an Ack or until the oldest block times out.
+    async def wait(self):
+        try:
+            await asyncio.wait_for_ms(self._evt.wait(), self.rto)
+        except asyncio.TimeoutError:
+            pass
+        self._evt.clear()
+
+    def get_status(self):
+        return {
+            "window": self.window,
+            "block_size": self.block_size,
+            "srtt": self.srtt,
+            "rto": self.rto,
+            "resent": self.resent,
+            "timeouts": self.timeouts,
+        }
+
+
+class ReceiveWindow:
+    def __init__(self, max_bytes=32768):
+        self.max_bytes = max_bytes
+        self.base = 0
+        self.held = {}  # seq -> (offset, data) received ahead of a missing block
+        self.held_bytes = 0
+
+    # Returns the (offset, data) blocks that can now be written in order.
+    def add(self, seq, offset, data):
+        if seq <= self.base or seq in self.held:
+            return []  # Duplicate, the next Ack tells the sender
+        if seq == self.base + 1:
+            blocks = [(offset, data)]
+            self.base = seq
+            while self.base + 1 in self.held:
+                block = self.held.pop(self.base + 1)
+                self.held_bytes -= len(block[1])
+                blocks.append(block)
+                self.base += 1
+            return blocks
+        # Too far ahead or out of memory: drop it, the sender resends it
+        if seq - self.base - 2 < 2 * MAX_WINDOW and self.held_bytes + len(data) <= self.max_bytes:
+            self.held[seq] = (offset, bytes(data))
+            self.held_bytes += len(data)
+        return []
+
+    def ack(self):
+        bitmap = 0
+        for seq in self.held:
+            bitmap |= 1 << (seq - self.base - 2)
+        return self.base, bitmap
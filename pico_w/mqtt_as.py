@@ -31,6 +31,7 @@ VERSION = (0, 6, 3)
 # Default short delay for good SynCom throughput (avoid sleep(0) with SynCom).
 _DEFAULT_MS = const(20)
 _SOCKET_POLL_DELAY = const(5)  # 100ms added greatly to publish latency
+_OBUFSIZE = const(64)  # Initial publish header buffer, grown for long topics
 
 # Legitimate errors while waiting on a socket. See uasyncio __init__.py open_connection().
 ESP32 = platform == 'esp32' or platform == 'esp32_LoBo'
@@ -140,6 +141,12 @@ class MQTT_base:
         self.rcv_pids = set()  # PUBACK and SUBACK pids awaiting ACK response
         self.last_rx = ticks_ms()  # Time of last communication from broker
         self.lock = asyncio.Lock()
+        # Publish header scratch buffer, only used with .lock held
+        self._obuf = bytearray(_OBUFSIZE)
+        self._mvobuf = memoryview(self._obuf)
+        self._last_topic = None
+        self._topic_bytes = b''
+        self._puback = bytearray(b"\x40\x02\0\0")
 
     def _set_last_will(self, topic, msg, retain=False, qos=0):
         qos_check(qos)
@@ -375,25 +382,41 @@ class MQTT_base:
             count += 1
             self.REPUB_COUNT += 1
 
+    # Everything up to the payload is encoded into the reused ._obuf and sent
+    # in one write, the payload is then written straight from the caller's
+    # buffer. Caller holds .lock.
     async def _publish(self, topic, msg, retain, qos, dup, pid):
-        pkt = bytearray(b"\x30\0\0\0")
-        pkt[0] |= qos << 1 | retain | dup << 3
-        sz = 2 + len(topic) + len(msg)
+        if topic is not self._last_topic:  # Usually the same topic every time
+            self._last_topic = topic
+            self._topic_bytes = topic.encode() if isinstance(topic, str) else topic
+        topic = self._topic_bytes
+        tl = len(topic)
+        sz = 2 + tl + len(msg)
         if qos > 0:
             sz += 2
         if sz >= 2097152:
             raise MQTTException('Strings too long.')
+        if 5 + 2 + tl + 2 > len(self._obuf):
+            self._obuf = bytearray(tl + 24)
+            self._mvobuf = memoryview(self._obuf)
+        pkt = self._obuf
+        mv = self._mvobuf
+        pkt[0] = 0x30 | qos << 1 | retain | dup << 3
         i = 1
         while sz > 0x7f:
             pkt[i] = (sz & 0x7f) | 0x80
             sz >>= 7
             i += 1
         pkt[i] = sz
-        await self._as_write(pkt, i + 1)
-        await self._send_str(topic)
+        i += 1
+        struct.pack_into("!H", pkt, i, tl)
+        i += 2
+        mv[i:i + tl] = topic
+        i += tl
         if qos > 0:
-            struct.pack_into("!H", pkt, 0, pid)
-            await self._as_write(pkt, 2)
+            struct.pack_into("!H", pkt, i, pid)
+            i += 2
+        await self._as_write(pkt, i)
         await self._as_write(msg)
 
     # Can raise OSError if WiFi fails. Subclass traps
@@ -470,7 +493,7 @@ class MQTT_base:
         retained = op & 0x01
         self._cb(topic, msg, bool(retained))
         if op & 6 == 2:  # qos 1
-            pkt = bytearray(b"\x40\x02\0\0")  # Send PUBACK
+            pkt = self._puback  # Send PUBACK
             struct.pack_into("!H", pkt, 2, pid)
             await self._as_write(pkt)
         elif op & 6 == 4:  # qos 2 not supported
@@ -7,49 +7,90 @@ import os
 import uasyncio as asyncio
 from queue import Queue
 import gc
+import file_frame
+import file_window
+import file_manifest
+import file_compress
+import file_integrity
+import file_walk
 from mqtt_as_latest import MQTTClient, config
 
-_send_q = Queue()
-_file_wait_q = Queue()
-_file_in_progress_q = Queue()
+_file_queue_size = 8  # The directory walk waits while this many files are queued
+_file_wait_q = Queue(_file_queue_size)
 _qos = 1
-_data_block_size = 250
-_out_hash_sha256 = uhashlib.sha256()
-_file_block_sequence_nr = 0
+# Blocks go at QoS 0: the window's Acks already resend lost ones, and a
+# QoS 1 publish would wait for its PUBACK, one block per broker round trip
+_frame_qos = 0
+_data_block_size = 1024
+_max_transfers = 3
+_max_inflight_bytes = 16384
+_sessions = {}
+_file_id = 0
+_manifest_file = 'sync_manifest.json'
+_manifest = file_manifest.load(_manifest_file)
+_sync_root = ''  # '' is the current directory, e.g. '/sd/btree_storage'
+_sync_include = ['*']  # Globs, see file_walk.py
+_sync_exclude = [_manifest_file, _manifest_file + '.tmp']
+_done_timeout = 10000
+_resume_timeout = 30000  # The receiver reads back what it has before it answers
+_max_restarts = 3
+_compression = file_compress.best()  # None sends blocks as they are
+_integrity = 'crc32'  # End check of each file, see file_integrity.py
 _topic_files = 'pico2w_file_sync'
-_event_file_ready_for_backup = asyncio.Event()
-_event_file_backup_completed = asyncio.Event()
-_event_send_q_ready = asyncio.Event()
+_topic_ack = 'pico2w_file_sync/ack'
 SERVER = '192.168.10.174' #bbb
 
 _do_file_backup = True
 _msg_id = 1
-_do_selected_files = True
+_do_selected_files = False  # True sends only the files listed in get_all_files
 _do_test_messages = False
-_do_all_files = False
+_do_all_files = not _do_selected_files
+
+class SendSession:
+    # State of one file being sent, Acks find it by file_id
+    def __init__(self, file_name, file_size, file_hash, compression = None, integrity = 'sha256', integrity_hash = None):
+        self.file_id = get_file_id()
+        self.file_name = file_name
+        self.file_size = file_size
+        self.file_hash = file_hash
+        self.compression = compression
+        self.receiver_compression = None
+        self.integrity = integrity
+        # The End digest, the SHA256 file_hash unless another method is used
+        self.integrity_hash = integrity_hash if (integrity_hash != None) else file_hash
+        self.receiver_integrity = None
+        self.base_hash = None
+        self.seq = 1
+        self.offset = 0
+        self.reply = None
+        self.done = None
+        self.resume_offset = None
+        # The in-flight budget is shared by all transfers
+        self.window = file_window.SendWindow(block_size = _data_block_size, max_bytes = _max_inflight_bytes // _max_transfers)
 
 def callback(topic, msg_in, retained):
-    global _success_q, _error_q
     #print((topic, msg_in, retained))
     msg = ujson.loads(msg_in)
     
-    if ("Category" in msg.keys()):
-        category = msg["Category"]
-    
-        if (category == 'Files'):
-            step = msg["Step"]
-            
-            if (step == 'Start'):
-                print("starting sync...")
-                _success_q.clear()
-                _error_q.clear()
-            else:
-                print("processing file...")                
-                processFile(msg, _success_q, _error_q)
-                
-        if (category == 'Test'):
-            message = msg["Message"]
-            print("Test: " + message)
+    if (msg.get("Category") == 'Files'):
+        session = _sessions.get(msg.get("FileId"))
+        
+        if (session == None):
+            return
+        
+        if (msg["Step"] == 'Ack'):
+            session.window.on_ack(msg["Base"], msg["Bitmap"])
+        elif (msg["Step"] == 'Reject' or msg["Step"] == 'Full' or msg["Step"] == 'Unknown'):
+            session.reply = msg["Step"]
+            session.receiver_compression = msg.get("Compression")
+            session.receiver_integrity = msg.get("Integrity")
+            session.window.wake()
+        elif (msg["Step"] == 'Resume'):
+            session.resume_offset = msg["Offset"]
+            session.window.wake()
+        elif (msg["Step"] == 'Done'):
+            session.done = msg["Ok"]
+            session.window.wake()
     
 async def conn_han(client):
     await client.subscribe('pico1_files', 1)
@@ -58,16 +99,17 @@ async def conn_han(client):
     print("subscribed to pico1_test...")
     await client.subscribe('file_test', 1)
     print("subscribed to file_test...")
+    await client.subscribe(_topic_ack, 0)
+    print("subscribed to " + _topic_ack + "...")
 
-async def get_all_files(msg_q):
+async def get_all_files(mqtt_link):
     filenames = []
 
     print("Starting backup_all_files...")
-    await send_start(msg_q)    
+    await send_start(mqtt_link)    
+    # Drop the manifest lines superseded since the last run
+    file_manifest.save(_manifest_file, _manifest)
     
-    _event_file_ready_for_backup.clear()
-    _event_file_backup_completed.clear()
-
     if (_do_selected_files == True):
         filenames = []
         
@@ -85,14 +127,13 @@ async def get_all_files(msg_q):
     #    filenames.append('syncom_test_host.py')
      #   filenames.append('syncom_test_host_one_task.py')                                        
     elif (_do_all_files == True):
-        for filename in os.listdir():
-            filenames.append(filename)
+        # A generator: files are queued as the walk finds them, the bounded
+        # queue holds it up while the transfers catch up
+        filenames = file_walk.walk(_sync_root, _sync_include, _sync_exclude)
 
     for filename in filenames:
         await _file_wait_q.put(filename)
 
-    _event_file_backup_completed.set()                
-
 def get_msg_id():
     global _msg_id
 
@@ -101,6 +142,16 @@ def get_msg_id():
     
     return result
 
+def get_file_id():
+    global _file_id
+
+    _file_id = (_file_id + 1) & 0xFFFF
+    
+    while (_file_id in _sessions):
+        _file_id = (_file_id + 1) & 0xFFFF
+    
+    return _file_id
+
 def build_msg(msg_in):
     out_hash_md5 = uhashlib.sha256()
     
@@ -134,59 +185,176 @@ async def publish_test(mqtt_link):
         count += 1
         await asyncio.sleep_ms(500)
 
-async def sender(mqtt_link, msg_q):
-    print("sender start...")
-
-    while True:
-        if (msg_q.qsize() > 0):
-            msg = await msg_q.get()
-            print("publishing...:" + msg)            
-            
-            await mqtt_link.publish(_topic_files, msg, False, _qos)
-            await asyncio.sleep_ms(100)
-            
-        await asyncio.sleep_ms(500)            
-      
 def batch_strings(strings, batch_size):
     while strings:
         batch = strings[:batch_size]
         strings = strings[batch_size:]
         yield batch
 
-async def processFile(fileName, msg_q):
-    global _out_hash_sha256
-    global _data_block_size
-    global _file_block_sequence_nr
-    
-    _event_file_ready_for_backup.clear()    
+async def processFile(fileName, mqtt_link):
     print("Starting backup single file...")
             
-    if file_exist(fileName):
-        fo = open(fileName, "rb")
-        file_properties = os.stat(fileName)
-        file_size = file_properties[6]
+    if (file_exist(fileName) == False):
+        print("file %s not found" % fileName)
+        return True
         
-        await send_header(fileName, file_size, msg_q)
+    file_properties = os.stat(fileName)
+    file_size = file_properties[6]
+    file_mtime = file_properties[8]
+    entry = _manifest.get(fileName)
+    
+    if (entry != None and entry["Size"] == file_size and entry["Mtime"] == file_mtime):
+        print("file %s unchanged" % fileName)
+        return True
         
-        print("file opened...%s" % fileName)
-        run_flag = True
-        _out_hash_sha256 = uhashlib.sha256()
-        _file_block_sequence_nr = 1
-        nr_bytes_read = 0
+    # The End check is worked out in the same pass as the manifest hashes
+    integrity = None if (_integrity == 'sha256') else file_integrity.new(_integrity)
+    blocks, file_hash = file_manifest.hash_blocks(fileName, integrity = integrity)
+    integrity_hash = None if (integrity == None) else file_integrity.b64digest(integrity)
+    session = SendSession(fileName, file_size, file_hash, _compression, _integrity, integrity_hash)
+    ranges = [(0, file_size)]
+    
+    # A copy can not be truncated, so files that shrank are sent in full
+    if (entry != None and file_size >= entry["Size"]):
+        if (entry["Hash"] == file_hash):
+            print("file %s touched but unchanged" % fileName)
+            entry["Mtime"] = file_mtime
+            file_manifest.append(_manifest_file, fileName, entry)
+            return True
+            
+        session.base_hash = entry["Hash"]
+        ranges = file_manifest.changed_ranges(entry["Blocks"], blocks, file_size)
+
+    result = await sendFile(session, ranges, mqtt_link)
+    restarts = 0
+    
+    while ((result == 'Full' or result == 'Unknown' or result == False) and restarts < _max_restarts):
+        restarts += 1
+        compression = session.compression
+        integrity = session.integrity
+        integrity_hash = session.integrity_hash
+        base_hash = session.base_hash
         
-        while run_flag:
-            file_block = fo.read(_data_block_size)
-            nr_bytes_read += len(file_block)
+        if (result == 'Full'):
+            # The receiver's copy is not the one the delta was made against
+            print("file %s needs a full copy" % fileName)
+            receiver_compression = session.receiver_compression or []
+            base_hash = None
+            ranges = [(0, file_size)]
             
-            if file_block:
-                await send_file_block(fileName, file_block, file_size, nr_bytes_read, _file_block_sequence_nr, msg_q)
-                _file_block_sequence_nr += 1                    
+            if (compression not in receiver_compression):
+                # Every receiver with compression support has the pure Python lz
+                compression = 'lz' if 'lz' in receiver_compression else None
+                
+            if (integrity not in (session.receiver_integrity or ['sha256'])):
+                integrity = 'sha256'
+                integrity_hash = None
+        else:
+            # The receiver lost the transfer, e.g. it was reset, or the copy
+            # failed its check: start over, it continues from its last
+            # checkpoint if it has one
+            print("file %s restarting" % fileName)
+            
+        session = SendSession(fileName, file_size, file_hash, compression, integrity, integrity_hash)
+        session.base_hash = base_hash
+        result = await sendFile(session, ranges, mqtt_link)
+        
+    if (result == 'Reject'):
+        return False
+        
+    if (result == True):
+        _manifest[fileName] = {"Size": file_size, "Mtime": file_mtime, "Hash": file_hash, "Blocks": blocks}
+        file_manifest.append(_manifest_file, fileName, _manifest[fileName])
+    elif (fileName in _manifest):
+        del _manifest[fileName]
+        file_manifest.append(_manifest_file, fileName, None)
+    
+    return True
+
+async def sendFile(session, ranges, mqtt_link):
+    # Returns True or False from the receiver's Done, its Reject, Full or
+    # Unknown reply, or None if it did not answer
+    fo = open(session.file_name, "rb")
+    window = session.window
+    ranges = [r for r in ranges if r[1] > 0]
+    _sessions[session.file_id] = session
+    
+    try:
+        await send_header(session, mqtt_link)
+        print("file opened...%s" % session.file_name)
+        
+        if (session.base_hash == None):
+            # Full copies may continue where an interrupted one stopped, the
+            # receiver answers every one with Resume once it knows where
+            timeout = utime.ticks_add(utime.ticks_ms(), _resume_timeout)
+            
+            while (session.resume_offset == None and session.reply == None and utime.ticks_diff(timeout, utime.ticks_ms()) > 0):
+                await window.wait()
+                
+            if (session.resume_offset == None and session.reply == None):
+                print("no resume offset for %s" % session.file_name)
+                return 'Unknown'
+                
+            if (session.resume_offset != None and session.resume_offset > 0):
+                print("resuming %s at %d" % (session.file_name, session.resume_offset))
+                ranges = [(session.resume_offset, session.file_size - session.resume_offset)]
+                ranges = [r for r in ranges if r[1] > 0]
+        
+        # Keep up to window.window blocks unacknowledged, resending only the
+        # blocks the receiver reports missing or that time out
+        while (session.reply == None and (len(ranges) > 0 or window.done() == False)):
+            for seq, frame in window.due():
+                await mqtt_link.publish(_topic_files, frame, False, _frame_qos)
+                window.sent(seq, frame)
+                
+            if (len(ranges) > 0 and window.can_send() == True):
+                offset, length = ranges[0]
+                block_size = min(window.block_size, length)
+                
+                if (offset != session.offset):
+                    fo.seek(offset)
+                    session.offset = offset
+                
+                # Read the block straight into the frame that gets published
+                frame, file_block = file_frame.new_frame(block_size)
+                flags = 0
+                
+                if (fo.readinto(file_block) != block_size):
+                    print("file %s changed while sending" % session.file_name)
+                    break
+                
+                if (session.compression != None):
+                    packed = file_compress.compress(session.compression, file_block)
+                    
+                    # Blocks that do not shrink, e.g. of .mpy files, go as they are
+                    if (len(packed) < block_size):
+                        frame, file_block = file_frame.new_frame(len(packed))
+                        file_block[:] = packed
+                        flags = file_frame.FRAME_COMPRESSED
+                
+                await send_file_block(session, frame, block_size, flags, mqtt_link)
+                
+                if (block_size == length):
+                    ranges.pop(0)
+                else:
+                    ranges[0] = (offset + block_size, length - block_size)
             else:
-                await send_end(fileName, msg_q)
-                run_flag = False
-                fo.close()
-    else:
-        print("file %s not found" % fileName)
+                await window.wait()
+
+        if (session.reply != None):
+            return session.reply
+            
+        print("window: " + str(window.get_status()))
+        await send_end(session, mqtt_link)
+        timeout = utime.ticks_add(utime.ticks_ms(), _done_timeout)
+        
+        while (session.done == None and utime.ticks_diff(timeout, utime.ticks_ms()) > 0):
+            await window.wait()
+            
+        return session.done
+    finally:
+        del _sessions[session.file_id]
+        fo.close()
 
 def file_exist(filename):
     try:
@@ -197,7 +365,7 @@ def file_exist(filename):
         exists = False
     return exists
 
-async def send_start(msg_q):
+async def send_start(mqtt_link):
     print("Sending start...")
     msgId = get_msg_id()
     
@@ -210,10 +378,10 @@ async def send_start(msg_q):
                 }
     
     payload = ujson.dumps(file_operation)
-    await msg_q.put(payload)
-    print("Start added to queue...")    
+    await mqtt_link.publish(_topic_files, payload, False, _qos)
+    print("Start sent...")    
 
-async def send_header(fileName, fileSize, msg_q):
+async def send_header(session, mqtt_link):
     print("Preparing header...")
     msgId = get_msg_id()
     
@@ -222,44 +390,35 @@ async def send_header(fileName, fileSize, msg_q):
                     "Step": 'Header',                                        
                     "Category": 'Files',                        
                     "Operation": 'Backup',
-                    "FileName":fileName,
-                    "FileSize":fileSize,
+                    "FileName":session.file_name,
+                    "FileSize":session.file_size,
+                    "FileId":session.file_id,
+                    "FileHash":session.file_hash,
+                    "Integrity":session.integrity,
                     "RspReceivedOK": False                    
                 }
     
-    payload = ujson.dumps(file_operation)
-    await msg_q.put(payload)
-    print("Header added to queue...")    
-
-async def send_file_block(file_name, file_content, file_size, nr_bytes_read, _file_block_sequence_nr, msg_q):
-    global _out_hash_sha256
-    
-    print("Preparing block...")        
-    _out_hash_sha256.update(file_content)    
-    base64_data = ubinascii.b2a_base64(file_content)
-    percentage = ((nr_bytes_read) / file_size) * 100
-    msgId = get_msg_id()
-    
-    file_operation = {
-                    "Id": msgId,
-                    "Step": 'Content',                            
-                    "Category": 'Files',
-                    "Operation": 'Backup',                    
-                    "FileName":file_name,        
-                    "FileData":base64_data,
-                    "FileBlockSequenceNumber": _file_block_sequence_nr,
-                    "ProgressPercentage": str(percentage),
-                    "RspReceivedOK": False                    
-                 }
+    if (session.base_hash != None):
+        # Only changed blocks follow, to be written over the copy with this hash
+        file_operation["BaseHash"] = session.base_hash
+        
+    if (session.compression != None):
+        file_operation["Compression"] = session.compression
     
     payload = ujson.dumps(file_operation)
-    await msg_q.put(payload)
+    await mqtt_link.publish(_topic_files, payload, False, _qos)
+    print("Header sent...")    
 
-async def send_end(filename, msg_q):
-    global _out_hash_sha256
-    
+async def send_file_block(session, frame, block_size, flags, mqtt_link):
+    file_frame.pack_frame(frame, session.file_id, session.seq, session.offset, flags)
+    await mqtt_link.publish(_topic_files, frame, False, _frame_qos)
+    session.window.sent(session.seq, frame)
+    session.offset += block_size
+    session.seq += 1
+
+async def send_end(session, mqtt_link):
     print("Preparing end...")        
-    base64_hash_data = ubinascii.b2a_base64(_out_hash_sha256.digest())[:-1]
+    base64_hash_data = session.integrity_hash
     msgId = get_msg_id()
     
     file_operation = {
@@ -267,13 +426,14 @@ async def send_end(filename, msg_q):
                     "Step": 'End',                                    
                     "Category": 'Files',
                     "Operation": 'Backup',                    
-                    "FileName":filename,
+                    "FileName":session.file_name,
+                    "FileId":session.file_id,
                     "HashData":base64_hash_data,
                     "RspReceivedOK": False
                 }
     
     payload = ujson.dumps(file_operation)
-    await msg_q.put(payload)
+    await mqtt_link.publish(_topic_files, payload, False, _qos)
 
 def cbnet(state, _):  # Show WiFi state. Discard mqtt_link arg.
     print('cbnet: network is ', 'up' if state else 'down')
@@ -287,58 +447,40 @@ def free(full=False):
   if not full: return P
   else : return ('Total:{0} Free:{1} ({2})'.format(T,F,P))
 
-async def monitorQueueLength(msg_q):
+async def monitorMemory():
     while True:
-        if (msg_q.qsize() > 10):        
-            _event_send_q_ready.clear()            
-        else:
-            _event_send_q_ready.set()            
-
         print("Memory status..." + free(True))
         await asyncio.sleep(5)
 
-async def fileQueueProducer():
+async def fileQueueConsumer(mqtt_link):
+    # _max_transfers of these run, so that many files are sent at once and
+    # at most that many are open
     while True:
-        await _event_file_backup_completed.wait()
-
-        _event_file_backup_completed.clear()        
         fileName = await _file_wait_q.get()
-        await _file_in_progress_q.put(fileName)
-        _event_file_ready_for_backup.set()
-        await asyncio.sleep(1)
-
-async def fileQueueConsumer(msg_q):
-    while True:
-        await _event_file_ready_for_backup.wait()
-        await _event_send_q_ready.wait()
 
-        _event_file_backup_completed.clear()
-        _event_file_ready_for_backup.clear()
-        fileName = await _file_in_progress_q.get()
+        # Receiver is busy, try again once another transfer has finished. Not
+        # put back in the queue: that can be full with the walk waiting on it
+        while (await processFile(fileName, mqtt_link) == False):
+            print("receiver busy, retrying: " + fileName)
+            await asyncio.sleep(2)
 
-        await processFile(fileName, msg_q)
         gc.collect()
 
-        _event_file_backup_completed.set()        
-        await asyncio.sleep(.5)
-
-async def main(mqtt_link, send_q):
+async def main(mqtt_link):
     await mqtt_link.connect()
     
     if (_do_test_messages == True):
         asyncio.create_task(publish_test(mqtt_link))
 
     if (_do_file_backup == True):
-        await get_all_files(send_q)
+        await get_all_files(mqtt_link)
 
-    asyncio.create_task(sender(mqtt_link, send_q))
-    
     print("main running...")
     
     while True:
         await asyncio.sleep(5)
 
-#config['subs_cb'] = callback
+config['subs_cb'] = callback
 config['connect_coro'] = conn_han
 config['server'] = SERVER
 config['ssid'] = 'Cudy24G'
@@ -348,9 +490,11 @@ client = MQTTClient(config)
 
 try:
     time.sleep(5)
-    asyncio.create_task(monitorQueueLength(_send_q))
-    asyncio.create_task(fileQueueProducer())            
-    asyncio.create_task(fileQueueConsumer(_send_q))
-    asyncio.run(main(client, _send_q))        
+    asyncio.create_task(monitorMemory())
+    
+    for i in range(_max_transfers):
+        asyncio.create_task(fileQueueConsumer(client))
+        
+    asyncio.run(main(client))        
 finally:
     asyncio.new_event_loop()
@@ -1,10 +1,9 @@
 from Asset import Asset
-import json
 
 class AssetController:
-    def __init__(self, mqttConnectionPool, dao, topics, assetTaskController):
+    def __init__(self, publisher, dao, topics, assetTaskController):
         self.assetDao = dao
-        self.mqttConnectionPool = mqttConnectionPool
+        self.publisher = publisher
         self.topics = topics
         self.assetTaskController = assetTaskController
         
@@ -24,7 +23,7 @@ class AssetController:
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(asset_data))
+                await self.publisher.PublishEvent(topic, asset_data)
                 print("published not found asset add...")
                 
             return                
@@ -34,11 +33,11 @@ class AssetController:
                             "ClientId": post["clientId"],                                                                        
                             "EntityType":"Asset",
                             "Operation":"Create",                        
-                            "Entity" : json.dumps(asset)                            
+                            "Entity" : asset                            
                          }
             
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(asset_data))
+                await self.publisher.PublishEvent(topic, asset_data)
             
         return asset            
 
@@ -63,11 +62,11 @@ class AssetController:
                             "ClientId": savedAsset["clientId"],                                                                        
                             "EntityType":"Asset",
                             "Operation":"Update",                        
-                            "Entity" : json.dumps(result)                            
+                            "Entity" : result                            
                           }
             
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(asset_data))
+                await self.publisher.PublishEvent(topic, asset_data)
         
             return result            
 
@@ -105,7 +104,7 @@ class AssetController:
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(asset_data))
+                await self.publisher.PublishEvent(topic, asset_data)
                 print("published not found asset delete...")
             return                
         else:
@@ -118,11 +117,11 @@ class AssetController:
                             "ClientId": id,                                                                            
                             "EntityType":"Asset",
                             "Operation":"Delete",                        
-                            "Entity" : json.dumps(savedAsset)                                                                                                            
+                            "Entity" : savedAsset                                                                                                            
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(asset_data))
+                await self.publisher.PublishEvent(topic, asset_data)
                 print("published asset delete...")
             
             return result
@@ -3,6 +3,7 @@ import json
 from Asset import Asset
 from btree_hybrid_disk_cache import BTree
 import time
+from EntityVersions import bump_version
 
 class AssetDaoBT:
     def __init__(self, treeDepth, dir):
@@ -12,6 +13,7 @@ class AssetDaoBT:
         db = self.db
         asset["id"] = str(time.time_ns())                        
         db.insert((asset["id"], asset))                
+        bump_version("Asset")
         newAsset = await self.GetAssetById(asset["id"])
         
         return newAsset
@@ -19,6 +21,7 @@ class AssetDaoBT:
     async def UpdateAsset(self, id, asset):
         db = self.db
         db.update_value(id, asset)
+        bump_version("Asset")
         
         updatedAsset = await self.GetAssetById(id)
         return updatedAsset
@@ -50,6 +53,7 @@ class AssetDaoBT:
 
         if (db.find(id) != None):
             db.delete(db.root, (id,))            
+            bump_version("Asset")
             result = "Asset deleted..."            
 
         return result                    
@@ -57,6 +61,7 @@ class AssetDaoBT:
     async def DeleteAllAssets(self):
         db = self.db
         db.delete_all()
+        bump_version("Asset")
         
         result = "All Assets deleted..."            
         return result                    
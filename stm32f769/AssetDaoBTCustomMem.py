@@ -2,6 +2,7 @@ import os
 import json
 from Asset import Asset
 import time
+from EntityVersions import bump_version
 
 class AssetDaoBT:
     def __init__(self, btree):
@@ -11,6 +12,7 @@ class AssetDaoBT:
         db = self.db
         asset["id"] = str(time.time_ns())        
         db.insert((asset["id"], asset))
+        bump_version("Asset")
         
         newAsset = await self.GetAssetById(asset["id"])
         
@@ -19,6 +21,7 @@ class AssetDaoBT:
     async def UpdateAsset(self, id, asset):
         db = self.db
         db.update_value(id, asset)
+        bump_version("Asset")
         
         updatedAsset = await self.GetAssetById(id)
         return updatedAsset
@@ -50,6 +53,7 @@ class AssetDaoBT:
 
         if (db.find(id) != None):
             db.delete(id)                
+            bump_version("Asset")
             result = "Asset deleted..."            
             
         return result                    
@@ -57,6 +61,7 @@ class AssetDaoBT:
     async def DeleteAllAssets(self):
         db = self.db
         db.delete_all()
+        bump_version("Asset")
         
         result = "All Assets deleted..."            
         return result                    
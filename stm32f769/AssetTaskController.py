@@ -1,10 +1,9 @@
 from AssetTask import AssetTask
-import json
 
 class AssetTaskController:
-    def __init__(self, mqttConnectionPool, dao, topics):
+    def __init__(self, publisher, dao, topics):
         self.assetTaskDao = dao
-        self.mqttConnectionPool = mqttConnectionPool
+        self.publisher = publisher
         self.topics = topics
         
     async def AddAssetTask(self, mqttSessionId, post):
@@ -23,7 +22,7 @@ class AssetTaskController:
                          }
             
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(asset_task_data))
+                await self.publisher.PublishEvent(topic, asset_task_data)
                 
             return                
         else:            
@@ -33,11 +32,11 @@ class AssetTaskController:
                             "ClientId": post["clientId"],                                                                        
                             "EntityType":"AssetTask",
                             "Operation":"Create",                        
-                            "Entity" : json.dumps(assetTask)                            
+                            "Entity" : assetTask                            
                          }
             
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(asset_task_data))
+                await self.publisher.PublishEvent(topic, asset_task_data)
           
             return assetTask            
 
@@ -62,11 +61,11 @@ class AssetTaskController:
                             "ClientId": savedAssetTask["clientId"],                                                                        
                             "EntityType":"AssetTask",
                             "Operation":"Update",                        
-                            "Entity" : json.dumps(result)                            
+                            "Entity" : result                            
                           }
             
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(asset_task_data))
+                await self.publisher.PublishEvent(topic, asset_task_data)
                 
             return result            
 
@@ -105,7 +104,7 @@ class AssetTaskController:
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(asset_task_data))
+                await self.publisher.PublishEvent(topic, asset_task_data)
                 print("published not found asset task delete...")
             return                
         else:            
@@ -117,11 +116,11 @@ class AssetTaskController:
                             "ClientId": id,                                                                            
                             "EntityType":"AssetTask",
                             "Operation":"Delete",                        
-                            "Entity" : json.dumps(savedAssetTask)                                                                                                            
+                            "Entity" : savedAssetTask                                                                                                            
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(task_data))
+                await self.publisher.PublishEvent(topic, task_data)
                 print("published asset task delete...")            
             
             return result
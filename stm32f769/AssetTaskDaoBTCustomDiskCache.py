@@ -3,6 +3,7 @@ import json
 from AssetTask import AssetTask
 from btree_hybrid_disk_cache import BTree
 import time
+from EntityVersions import bump_version
 
 class AssetTaskDaoBT:
     def __init__(self, treeDepth, dir):
@@ -12,6 +13,7 @@ class AssetTaskDaoBT:
         db = self.db
         assetTask["id"] = str(time.time_ns())                
         db.insert((assetTask["id"], assetTask))
+        bump_version("AssetTask")
         newAssetTask = await self.GetAssetTaskById(assetTask["id"])
         
         return newAssetTask
@@ -19,6 +21,7 @@ class AssetTaskDaoBT:
     async def UpdateAssetTask(self, id, assetTask):
         db = self.db
         db.update_value(id, assetTask)
+        bump_version("AssetTask")
         
         updatedAssetTask = await self.GetAssetTaskById(id)
         return updatedAssetTask
@@ -57,6 +60,7 @@ class AssetTaskDaoBT:
 
         if (db.find(id) != None):
             db.delete(db.root, (id,))            
+            bump_version("AssetTask")
             result = "Asset deleted..."            
 
         return result                    
@@ -64,6 +68,7 @@ class AssetTaskDaoBT:
     async def DeleteAllAssetTasks(self):
         db = self.db
         db.delete_all()
+        bump_version("AssetTask")
         
         result = "All Asset Tasks deleted..."            
         return result                    
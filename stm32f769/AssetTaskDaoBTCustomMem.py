@@ -2,6 +2,7 @@ import os
 import json
 from AssetTask import AssetTask
 import time
+from EntityVersions import bump_version
 
 class AssetTaskDaoBT:
     def __init__(self, btree, assetDao):
@@ -17,6 +18,7 @@ class AssetTaskDaoBT:
         else:
             assetTask["id"] = str(time.time_ns())        
             db.insert((assetTask["id"], assetTask))
+            bump_version("AssetTask")
             newAssetTask = await self.GetAssetTaskById(assetTask["id"])
         
         return newAssetTask
@@ -24,6 +26,7 @@ class AssetTaskDaoBT:
     async def UpdateAssetTask(self, id, assetTask):
         db = self.db
         db.update_value(id, assetTask)
+        bump_version("AssetTask")
         
         updatedAssetTask = await self.GetAssetTaskById(id)
         return updatedAssetTask
@@ -62,6 +65,7 @@ class AssetTaskDaoBT:
 
         if (db.find(id) != None):
             db.delete(id)                
+            bump_version("AssetTask")
             result = "Asset Task deleted..."            
             
         return result                    
@@ -69,6 +73,7 @@ class AssetTaskDaoBT:
     async def DeleteAllAssetTasks(self):
         db = self.db
         db.delete_all()
+        bump_version("AssetTask")
         
         result = "All Asset Tasks deleted..."            
         return result                    
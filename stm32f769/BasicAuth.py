@@ -0,0 +1,91 @@
+from ubinascii import a2b_base64
+from ucollections import OrderedDict
+
+def equals(a, b):
+    """Constant time comparison of two byte strings"""
+    diff = len(a) ^ len(b)
+
+    for i in range(len(b)):
+        diff |= (a[i % len(a)] if len(a) > 0 else 0) ^ b[i]
+
+    return diff == 0
+
+class BasicAuth:
+    """HTTP Basic authentication against a username -> password dict.
+
+    Validated Authorization header values are kept in a small LRU cache, so a
+    client that keeps sending the same header is only decoded and checked
+    once. Failed attempts are never cached.
+    """
+    def __init__(self, users, maxEntries = 8):
+        # Also accept the single (username, password) tuple used previously
+        if (isinstance(users, tuple)):
+            users = {users[0]: users[1]}
+
+        self.users = {}
+
+        for user, password in users.items():
+            self.users[user] = password.encode()
+
+        self.maxEntries = maxEntries
+        self.cache = OrderedDict()
+
+    def Authenticate(self, header):
+        """Return the authenticated username, or None"""
+        if (header == None):
+            return None
+
+        principal = self.cache.get(header)
+
+        if (principal != None):
+            del self.cache[header]
+            self.cache[header] = principal
+            return principal
+
+        principal = self.Validate(header)
+
+        if (principal != None):
+            while (len(self.cache) >= self.maxEntries):
+                del self.cache[next(iter(self.cache))]
+
+            self.cache[header] = principal
+
+        return principal
+
+    def Validate(self, header):
+        # Authorization: Basic XXX
+        parts = header.strip().split(' ', 1)
+
+        if (len(parts) != 2 or parts[0] != "Basic"):
+            return None
+
+        try:
+            decoded = a2b_base64(parts[1].strip())
+        except ValueError:
+            return None
+
+        separator = decoded.find(b':')
+
+        if (separator < 0):
+            return None
+
+        try:
+            user = decoded[:separator].decode()
+        except UnicodeError:
+            return None
+
+        password = self.users.get(user)
+
+        # Unknown users are compared against a dummy so that the time taken
+        # does not reveal which usernames exist
+        if (password == None):
+            equals(decoded[separator + 1:], b'\x00' * 8)
+            return None
+
+        if (equals(decoded[separator + 1:], password) == False):
+            return None
+
+        return user
+
+    def Clear(self):
+        self.cache.clear()
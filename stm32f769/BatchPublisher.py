@@ -0,0 +1,134 @@
+import json
+import uasyncio as asyncio
+
+# Short codes used by compact batches in place of the field names and the
+# EntityType / Operation values of change events
+EVENT_KEYS = {
+    "MqttSessionId": "s",
+    "messageId": "m",
+    "ClientId": "c",
+    "EntityType": "t",
+    "Operation": "o",
+    "Entity": "e",
+    "entityId": "i"
+}
+
+ENTITY_TYPES = {
+    "ToDoItem": "T",
+    "Asset": "A",
+    "AssetTask": "K",
+    "Meter": "M",
+    "MeterReading": "R"
+}
+
+OPERATIONS = {
+    "Create": "C",
+    "Update": "U",
+    "Delete": "D"
+}
+
+def _reverse(codes):
+    return dict((code, name) for name, code in codes.items())
+
+_EVENT_NAMES = _reverse(EVENT_KEYS)
+_ENTITY_TYPE_NAMES = _reverse(ENTITY_TYPES)
+_OPERATION_NAMES = _reverse(OPERATIONS)
+
+def compact_event(event):
+    compact = {}
+
+    for key, value in event.items():
+        if (key == "EntityType"):
+            value = ENTITY_TYPES.get(value, value)
+        elif (key == "Operation"):
+            value = OPERATIONS.get(value, value)
+
+        compact[EVENT_KEYS.get(key, key)] = value
+
+    return compact
+
+def expand_event(compact):
+    """Inverse of compact_event, for subscribers"""
+    event = {}
+
+    for key, value in compact.items():
+        key = _EVENT_NAMES.get(key, key)
+
+        if (key == "EntityType"):
+            value = _ENTITY_TYPE_NAMES.get(value, value)
+        elif (key == "Operation"):
+            value = _OPERATION_NAMES.get(value, value)
+
+        event[key] = value
+
+    return event
+
+class BatchPublisher:
+    """Aggregates change events per topic into a single MQTT message.
+
+    A topic's batch is published once it holds maxEvents events, or maxDelay
+    ms after its first event, as {"Events": [...]}. Events are encoded when
+    they are queued, since the entity dicts they hold may be changed in
+    place before the batch goes out. With compact=True events use the short
+    codes above and the batch is sent as {"E": [...]}.
+    """
+    def __init__(self, mqttConnectionPool, maxEvents = 16, maxDelay = 50, compact = False):
+        self.mqttConnectionPool = mqttConnectionPool
+        self.maxEvents = maxEvents
+        self.maxDelay = maxDelay
+        self.compact = compact
+        self.batches = {}
+        self.eventsSent = 0
+        self.batchesSent = 0
+
+    async def PublishEvent(self, topic, event):
+        batch = self.batches.get(topic)
+
+        if (batch == None):
+            batch = []
+            self.batches[topic] = batch
+            asyncio.create_task(self._FlushLater(topic, batch))
+
+        if (self.compact == True):
+            event = compact_event(event)
+
+        batch.append(json.dumps(event))
+
+        if (len(batch) >= self.maxEvents):
+            await self.Flush(topic)
+
+    async def _FlushLater(self, topic, batch):
+        await asyncio.sleep_ms(self.maxDelay)
+
+        # Skip if the batch was already sent because it filled up
+        if (self.batches.get(topic) is batch):
+            await self.Flush(topic)
+
+    async def Flush(self, topic = None):
+        if (topic == None):
+            topics = list(self.batches.keys())
+        else:
+            topics = [topic]
+
+        for topic in topics:
+            batch = self.batches.pop(topic, None)
+
+            if (batch == None or len(batch) == 0):
+                continue
+
+            self.batchesSent += 1
+            self.eventsSent += len(batch)
+            # The events are already JSON, only the list around them is added
+            if (self.compact == True):
+                message = '{"E": [' + ', '.join(batch) + ']}'
+            else:
+                message = '{"Events": [' + ', '.join(batch) + ']}'
+
+            await self.mqttConnectionPool.Publish(topic, message)
+
+    def GetStatus(self):
+        return {
+            "pending": sum(len(batch) for batch in self.batches.values()),
+            "events": self.eventsSent,
+            "batches": self.batchesSent
+        }
@@ -0,0 +1,54 @@
+import uasyncio as asyncio
+
+class ChangeFeed:
+    """Bounded in-RAM ring buffer of change events.
+
+    Every event gets a sequence number. Readers ask for everything after the
+    last sequence number they have seen; if that has already been overwritten
+    the result is flagged as lost and the reader has to resync with a full GET.
+    """
+    def __init__(self, size = 32):
+        self.size = size
+        self.events = [None] * size
+        self.seq = 0
+        self._evt = asyncio.Event()
+
+    def Append(self, topic, message):
+        self.seq += 1
+        self.events[self.seq % self.size] = (self.seq, topic, message)
+
+        # Waiters hold on to the old event, so swapping before set() wakes
+        # all of them exactly once
+        evt = self._evt
+        self._evt = asyncio.Event()
+        evt.set()
+
+    def OldestSeq(self):
+        return max(1, self.seq - self.size + 1)
+
+    def Since(self, since):
+        """Return (events, lost) for all events with seq > since"""
+        if (since > self.seq):
+            # Sequence numbers from before a reset
+            since = 0
+
+        lost = since + 1 < self.OldestSeq()
+        start = max(since + 1, self.OldestSeq())
+        events = []
+
+        for seq in range(start, self.seq + 1):
+            events.append(self.events[seq % self.size])
+
+        return events, lost
+
+    async def Wait(self, since, timeout_ms):
+        """Wait until there is an event after since, or timeout_ms expires"""
+        if (self.seq > since):
+            return True
+
+        try:
+            await asyncio.wait_for_ms(self._evt.wait(), timeout_ms)
+        except asyncio.TimeoutError:
+            return False
+
+        return True
@@ -0,0 +1,173 @@
+import json
+import uasyncio as asyncio
+from ucollections import OrderedDict
+from BatchPublisher import expand_event
+
+# Controller methods per entity type for Create, Update and Delete
+COMMANDS = {
+    "ToDoItem": ("AddItem", "UpdateItem", "DeleteItem"),
+    "Asset": ("AddAsset", "UpdateAsset", "DeleteAsset"),
+    "AssetTask": ("AddAssetTask", "UpdateAssetTask", "DeleteAssetTask"),
+    "Meter": ("AddMeter", "UpdateMeter", "DeleteMeter"),
+    "MeterReading": ("AddMeterReading", "UpdateMeterReading", "DeleteMeterReading")
+}
+
+class CommandProcessor:
+    """Executes create/update/delete commands received over MQTT.
+
+    A command has the same fields as a change event: MqttSessionId,
+    messageId, EntityType, Operation, Entity and, for updates and deletes,
+    entityId. Compact commands are accepted as well. Commands from one
+    session run in order, different sessions run on up to `workers` tasks.
+    The outcome is published to resultTopic + "/" + MqttSessionId.
+    """
+    def __init__(self, mqttConnectionPool, controllers, resultTopic, workers = 2, maxPending = 32):
+        self.mqttConnectionPool = mqttConnectionPool
+        self.controllers = controllers
+        self.resultTopic = resultTopic
+        self.maxPending = maxPending
+        self.pending = {}
+        self.pendingCount = 0
+        self.ready = []
+        self.active = set()
+        self.recent = OrderedDict()
+        self._evt = asyncio.Event()
+        self.executed = 0
+        self.rejected = 0
+        self.duplicates = 0
+
+        for i in range(workers):
+            asyncio.create_task(self._Worker())
+
+    def OnMessage(self, topic, message):
+        # Called from the MQTT receive loop, so only queue the command here
+        try:
+            command = json.loads(message)
+        except ValueError:
+            self.rejected += 1
+            return
+
+        if (type(command) != dict):
+            self.rejected += 1
+            return
+
+        if ("t" in command):
+            command = expand_event(command)
+
+        session = command.get("MqttSessionId")
+        key = (session, command.get("messageId"))
+
+        # The same command can arrive through more than one broker
+        if (key in self.recent):
+            self.duplicates += 1
+            return
+
+        if (self.pendingCount >= self.maxPending):
+            self.rejected += 1
+            asyncio.create_task(self._PublishResult(command, 503, "Too many pending commands"))
+            return
+
+        if (key[1] != None):
+            self.recent[key] = True
+
+            while (len(self.recent) > 4 * self.maxPending):
+                del self.recent[next(iter(self.recent))]
+
+        commands = self.pending.get(session)
+
+        if (commands == None):
+            commands = []
+            self.pending[session] = commands
+
+        commands.append(command)
+        self.pendingCount += 1
+
+        if (session not in self.active and session not in self.ready):
+            self.ready.append(session)
+            self._evt.set()
+
+    async def _Worker(self):
+        while True:
+            while (len(self.ready) == 0):
+                self._evt.clear()
+                await self._evt.wait()
+
+            session = self.ready.pop(0)
+            self.active.add(session)
+            commands = self.pending[session]
+            command = commands.pop(0)
+            self.pendingCount -= 1
+
+            try:
+                statusCode, result = await self.Execute(command)
+            except Exception as e:
+                statusCode, result = 500, str(e)
+
+            self.executed += 1
+
+            try:
+                await self._PublishResult(command, statusCode, result)
+            finally:
+                self.active.discard(session)
+
+                if (len(commands) > 0):
+                    self.ready.append(session)
+                    self._evt.set()
+                else:
+                    del self.pending[session]
+
+    async def Execute(self, command):
+        entityType = command.get("EntityType")
+        operation = command.get("Operation")
+        controller = self.controllers.get(entityType)
+
+        if (controller == None or entityType not in COMMANDS):
+            return 400, "Unknown entity type"
+
+        add, update, delete = COMMANDS[entityType]
+        session = command.get("MqttSessionId")
+        entity = command.get("Entity")
+
+        # The controllers read messageId from the entity as sent over HTTP
+        if (type(entity) == dict and "messageId" not in entity):
+            entity["messageId"] = command.get("messageId")
+
+        if (operation == "Create"):
+            result = await getattr(controller, add)(session, entity)
+            statusCode = 201
+        elif (operation == "Update"):
+            result = await getattr(controller, update)(session, command.get("entityId"), entity)
+            statusCode = 200
+        elif (operation == "Delete"):
+            result = await getattr(controller, delete)(session, command.get("entityId"), command.get("messageId"))
+            statusCode = 200
+        else:
+            return 400, "Unknown operation"
+
+        if (type(result) == dict and result.get("statusCode") == 404):
+            statusCode = 404
+        elif (result == None):
+            statusCode = 400 if operation == "Create" else 404
+
+        return statusCode, result
+
+    async def _PublishResult(self, command, statusCode, result):
+        topic = self.resultTopic + "/" + str(command.get("MqttSessionId"))
+        message = json.dumps({
+            "messageId": command.get("messageId"),
+            "EntityType": command.get("EntityType"),
+            "Operation": command.get("Operation"),
+            "statusCode": statusCode,
+            "Result": result
+        })
+
+        await self.mqttConnectionPool.Publish(topic, message, feed = False)
+
+    def GetStatus(self):
+        return {
+            "pending": self.pendingCount,
+            "active": len(self.active),
+            "executed": self.executed,
+            "rejected": self.rejected,
+            "duplicates": self.duplicates
+        }
@@ -0,0 +1,19 @@
+import time
+
+# Per entity type write counters. The DAOs bump the counter of their entity
+# type on every insert/update/delete so that readers (e.g. the response cache)
+# can tell whether anything changed without traversing the trees.
+_versions = {}
+
+# Versions restart at 0 after a reset, the boot id keeps ETags built from
+# them from colliding with ones handed out before the reset.
+_boot_id = (time.ticks_ms() ^ int(time.time())) & 0xFFFFFF
+
+def bump_version(entityType):
+    _versions[entityType] = _versions.get(entityType, 0) + 1
+
+def get_version(entityType):
+    return _versions.get(entityType, 0)
+
+def get_boot_id():
+    return _boot_id
@@ -1,11 +1,10 @@
 from Meter import Meter
-import json
 
 class MeterController:
-    def __init__(self, mqttConnectionPool, dao, topics,
+    def __init__(self, publisher, dao, topics,
                  meterReadingController):
         self.meterDao = dao
-        self.mqttConnectionPool = mqttConnectionPool
+        self.publisher = publisher
         self.topics = topics
         self.meterReadingController = meterReadingController
         
@@ -26,7 +25,7 @@ class MeterController:
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(meter_data))
+                await self.publisher.PublishEvent(topic, meter_data)
                 print("published not found meter add...")
                 
             return                                
@@ -37,11 +36,11 @@ class MeterController:
                             "ClientId": post["clientId"],                                                                                                    
                             "EntityType":"Meter",
                             "Operation":"Create",
-                            "Entity" : json.dumps(meter)                                                        
+                            "Entity" : meter                                                        
                          }
             
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(meter_data))
+                await self.publisher.PublishEvent(topic, meter_data)
             
         return meter            
 
@@ -66,11 +65,11 @@ class MeterController:
                             "ClientId": savedMeter["clientId"],                                                                                                    
                             "EntityType":"Meter",
                             "Operation":"Update",                        
-                            "Entity" : json.dumps(result)                                                        
+                            "Entity" : result                                                        
                           }
             
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(meter_data))
+                await self.publisher.PublishEvent(topic, meter_data)
             
             return result            
 
@@ -120,7 +119,7 @@ class MeterController:
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(meter_data))
+                await self.publisher.PublishEvent(topic, meter_data)
 
             return                
         else:
@@ -133,11 +132,11 @@ class MeterController:
                             "ClientId": id,                                                                            
                             "EntityType":"Meter",
                             "Operation":"Delete",                        
-                            "Entity" : json.dumps(savedMeter)                                                                                                            
+                            "Entity" : savedMeter                                                                                                            
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(meter_data))
+                await self.publisher.PublishEvent(topic, meter_data)
             
             return result
 
@@ -2,6 +2,7 @@ import json
 from Meter import Meter
 from btree_hybrid_disk_cache import BTree
 import time
+from EntityVersions import bump_version
 
 class MeterDaoBT:
     def __init__(self, treeDepth, dir):
@@ -11,6 +12,7 @@ class MeterDaoBT:
         db = self.db
         meter["id"] = str(time.time_ns())                        
         db.insert((meter["id"], meter))
+        bump_version("Meter")
         newMeter = await self.GetMeterById(meter["id"])
         
         return newMeter
@@ -18,6 +20,7 @@ class MeterDaoBT:
     async def UpdateMeter(self, id, meter):
         db = self.db
         db.update_value(id, meter)
+        bump_version("Meter")
         
         updatedMeter = await self.GetMeterById(id)
         return updatedMeter
@@ -47,6 +50,7 @@ class MeterDaoBT:
 
         if (db.find(id) != None):
             db.delete(db.root, (id,))            
+            bump_version("Meter")
             result = "Meter deleted..."            
 
         return result                    
@@ -54,6 +58,7 @@ class MeterDaoBT:
     async def DeleteAllMeters(self):
         db = self.db        
         db.delete_all()
+        bump_version("Meter")
         
         result = "All Meters deleted..."            
         return result                    
@@ -1,6 +1,7 @@
 import json
 from Meter import Meter
 import time
+from EntityVersions import bump_version
 
 class MeterDaoBT:
     def __init__(self, btree):
@@ -10,6 +11,7 @@ class MeterDaoBT:
         db = self.db
         meter["id"] = str(time.time_ns())                
         db.insert((meter["id"], meter))
+        bump_version("Meter")
         newMeter = await self.GetMeterById(meter["id"])
         
         return newMeter
@@ -17,6 +19,7 @@ class MeterDaoBT:
     async def UpdateMeter(self, id, meter):
         db = self.db
         db.update_value(id, meter)
+        bump_version("Meter")
         
         updatedMeter = await self.GetMeterById(id)
         return updatedMeter
@@ -46,6 +49,7 @@ class MeterDaoBT:
 
         if (db.find(id) != None):
             db.delete(id)                
+            bump_version("Meter")
             result = "Meter deleted..."            
             
         return result                    
@@ -53,6 +57,7 @@ class MeterDaoBT:
     async def DeleteAllMeters(self):
         db = self.db
         db.delete_all()
+        bump_version("Meter")
         
         result = "All Meters deleted..."            
         return result                    
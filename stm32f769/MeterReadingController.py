@@ -1,10 +1,9 @@
 from MeterReading import MeterReading
-import json
 
 class MeterReadingController:
-    def __init__(self, mqttConnectionPool, dao, topics):
+    def __init__(self, publisher, dao, topics):
         self.meterReadingDao = dao
-        self.mqttConnectionPool = mqttConnectionPool
+        self.publisher = publisher
         self.topics = topics
         
     async def AddMeterReading(self, mqttSessionId, post):
@@ -23,7 +22,7 @@ class MeterReadingController:
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(reading_data))
+                await self.publisher.PublishEvent(topic, reading_data)
                 
             return                
         else:        
@@ -33,11 +32,11 @@ class MeterReadingController:
                             "ClientId": post["clientId"],                                                                        
                             "EntityType":"MeterReading",
                             "Operation":"Create",                        
-                            "Entity" : json.dumps(meterReading)                            
+                            "Entity" : meterReading                            
                          }
             
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(meterReading_data))
+                await self.publisher.PublishEvent(topic, meterReading_data)
             
         return meterReading            
 
@@ -61,12 +60,12 @@ class MeterReadingController:
                             "ClientId": savedMeterReading["clientId"],                                                                        
                             "EntityType":"MeterReading",
                             "Operation":"Update",                        
-                            "Entity" : json.dumps(result)                                                        
+                            "Entity" : result                                                        
                           }
 
             
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(meter_reading_data))
+                await self.publisher.PublishEvent(topic, meter_reading_data)
                 
             result = "Meter reading updated..."            
             
@@ -110,7 +109,7 @@ class MeterReadingController:
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(meter_reading_data))
+                await self.publisher.PublishEvent(topic, meter_reading_data)
 
             return                
         else:
@@ -122,11 +121,11 @@ class MeterReadingController:
                             "ClientId": id,                                                                            
                             "EntityType":"MeterReading",
                             "Operation":"Delete",                        
-                            "Entity" : json.dumps(savedMeterReading)                                                                                                            
+                            "Entity" : savedMeterReading                                                                                                            
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(meter_reading_data))
+                await self.publisher.PublishEvent(topic, meter_reading_data)
             
             return result
 
@@ -3,6 +3,7 @@ from MeterReading import MeterReading
 from btree_hybrid_disk_cache import BTree
 import time, utime
 from AdrHelperNew import AdrHelper
+from EntityVersions import bump_version
 
 class MeterReadingDaoBT:
     def __init__(self, treeDepth, dir):
@@ -13,6 +14,7 @@ class MeterReadingDaoBT:
         db = self.db
         meterReading["id"] = str(time.time_ns())                
         db.insert((meterReading["id"], meterReading))
+        bump_version("MeterReading")
         newMeterReading = await self.GetMeterReadingById(meterReading["id"])
         
         return newMeterReading
@@ -20,6 +22,7 @@ class MeterReadingDaoBT:
     async def UpdateMeterReading(self, id, meterReading):
         db = self.db
         db.update_value(id, meterReading)        
+        bump_version("MeterReading")
         
         updatedMeterReading = await self.GetMeterReadingById(id)
         
@@ -50,6 +53,7 @@ class MeterReadingDaoBT:
 
         if (db.find(id) != None):
             db.delete(db.root, (id,))                            
+            bump_version("MeterReading")
             result = "MeterReading deleted..."            
 
         return result                    
@@ -57,6 +61,7 @@ class MeterReadingDaoBT:
     async def DeleteAllMeterReadings(self):
         db = self.db        
         db.delete_all()
+        bump_version("MeterReading")
         
         result = "All MeterReadings deleted..."            
         return result
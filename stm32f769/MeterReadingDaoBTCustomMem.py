@@ -3,6 +3,7 @@ from MeterReading import MeterReading
 import time
 import utime
 from AdrHelper import AdrHelper
+from EntityVersions import bump_version
 
 class MeterReadingDaoBT:
     def __init__(self, btree, meterDao):
@@ -19,6 +20,7 @@ class MeterReadingDaoBT:
             newMeterReading = None
         else:            
             db.insert((meterReading["id"], meterReading))
+            bump_version("MeterReading")
             newMeterReading = await self.GetMeterReadingById(meterReading["id"])
         
         return newMeterReading
@@ -26,6 +28,7 @@ class MeterReadingDaoBT:
     async def UpdateMeterReading(self, id, meterReading):
         db = self.db
         db.update_value(id, meterReading)        
+        bump_version("MeterReading")
         
         updatedMeterReading = await self.GetMeterReadingById(id)
         
@@ -56,6 +59,7 @@ class MeterReadingDaoBT:
 
         if (db.find(id) != None):
             db.delete(id)                
+            bump_version("MeterReading")
             result = "MeterReading deleted..."            
             
         return result                    
@@ -63,6 +67,7 @@ class MeterReadingDaoBT:
     async def DeleteAllMeterReadings(self):
         db = self.db
         db.delete_all()
+        bump_version("MeterReading")
         
         result = "All MeterReadings deleted..."            
         return result
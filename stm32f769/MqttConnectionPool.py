@@ -1,23 +1,316 @@
 from mqtt_as_latest import MQTTClient, config
-import random
+import json
+import uasyncio as asyncio
+from time import ticks_ms, ticks_diff, ticks_add
+from OutboundQueue import OutboundQueue, BLOCK
+
+class BrokerHealth:
+    def __init__(self, broker):
+        self.broker = broker
+        self.inFlight = 0
+        self.latencyEwma = 0
+        self.published = 0
+        self.failures = 0
+        self.suspectUntil = ticks_ms()
 
 class MqttConnectionPool:
-    def __init__(self, mqttBrokers):
+    def __init__(self, mqttBrokers, changeFeed = None, publishTimeout = 5000, suspectPeriod = 10000,
+                 queueSize = 0, queuePolicy = BLOCK, window = 4, mqttv5 = False,
+                 spool = None, replayRate = 0, cleanSession = False, sessionExpiry = 3600):
         self.mqttBrokers = mqttBrokers
         self.mqttConnectionPool = {}
+        self.health = {}
+        self.changeFeed = changeFeed
+        self.publishTimeout = publishTimeout
+        self.suspectPeriod = suspectPeriod
+        self.nextIndex = 0
+        self.attempted = 0
+        # With a queue, Publish returns as soon as the message is queued and
+        # one sender task per broker drains it
+        self.queue = OutboundQueue(queueSize, queuePolicy) if queueSize > 0 else None
+        # QoS 1 publishes awaiting PUBACK per connection, and the number of
+        # senders per broker needed to keep that window full
+        self.window = window
+        # MQTT 5 lets mqtt_as_latest replace repeated topics by topic aliases
+        self.mqttv5 = mqttv5
+        # Optional PublishSpool that takes publishes while no broker is
+        # healthy, replayed in order on reconnect. Replay runs as fast as the
+        # brokers take it, a replayRate > 0 caps it at that many messages/s
+        # and must stay above the steady publish rate or the spool never drains
+        self.spool = spool
+        self.replayRate = replayRate
+        self.subscriptions = {}  # topic -> (handler, qos)
+        # A persistent session lets a reconnect resume in-flight publishes
+        # and subscriptions instead of starting over
+        self.cleanSession = cleanSession
+        self.sessionExpiry = sessionExpiry
 
     async def Initialise(self):
         for broker in self.mqttBrokers:
             config['server'] = broker
-            mqtt_client = MQTTClient(config)
-            await mqtt_client.connect()
-            print("Connected to broker: " + str(broker))
-            self.mqttConnectionPool[broker] = mqtt_client
-                        
-    async def Publish(self, topic, message):
-        brokerIndex = random.randint(0, len(self.mqttBrokers) - 1)
-        mqttClient = self.mqttConnectionPool[self.mqttBrokers[brokerIndex]]
-        await mqttClient.publish(topic, message, qos = 1)            
+            config['max_inflight'] = self.window
+            config['mqttv5'] = self.mqttv5
+            config['subs_cb'] = self._OnMessage
+            config['connect_coro'] = self._OnConnect
+            config['clean'] = self.cleanSession
+
+            if (self.mqttv5 == True and self.cleanSession == False):
+                # MQTT 5 ends the session on disconnect unless it has an expiry
+                config['mqttv5_con_props'] = {0x11: self.sessionExpiry}
+
+            self.mqttConnectionPool[broker] = MQTTClient(config)
+            self.health[broker] = BrokerHealth(broker)
+
+        # Connect to all brokers in parallel and return as soon as one is up,
+        # brokers that are down keep retrying in the background
+        for broker in self.mqttBrokers:
+            asyncio.create_task(self._ConnectLoop(broker))
+
+            if (self.queue != None):
+                for i in range(self.window):
+                    asyncio.create_task(self._Sender(broker))
+
+        if (self.spool != None):
+            asyncio.create_task(self._Replay())
+
+        while (self._SelectBroker([]) == None and self.attempted < len(self.mqttBrokers)):
+            await asyncio.sleep_ms(100)
+
+    async def _ConnectLoop(self, broker):
+        mqttClient = self.mqttConnectionPool[broker]
+        delay = 1
+        first = True
+
+        # Only needed until the first connect succeeds, after that mqtt_as
+        # reconnects by itself
+        while True:
+            try:
+                await mqttClient.connect()
+                print("Connected to broker: " + str(broker))
+                break
+            except OSError as e:
+                print("Failed to connect to broker: " + str(broker) + " " + str(e))
+
+            if (first == True):
+                first = False
+                self.attempted += 1
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+        if (first == True):
+            self.attempted += 1
+
+    def _IsHealthy(self, broker):
+        mqttClient = self.mqttConnectionPool[broker]
+
+        if (mqttClient._has_connected == False or mqttClient.isconnected() == False):
+            return False
+
+        return ticks_diff(ticks_ms(), self.health[broker].suspectUntil) >= 0
+
+    def Subscribe(self, topic, handler, qos = 1):
+        """Call handler(topic, message) for messages on topic from any broker"""
+        self.subscriptions[topic] = (handler, qos)
+
+        # Suspect brokers still deliver messages, only a client that is not
+        # connected is left to _OnConnect
+        for broker, mqttClient in self.mqttConnectionPool.items():
+            if (mqttClient._has_connected == True and mqttClient.isconnected() == True):
+                asyncio.create_task(mqttClient.subscribe(topic, qos))
+
+    async def _OnConnect(self, mqttClient):
+        # Once subscribed mqtt_as renews subscriptions itself when the broker
+        # lost the session, this only covers clients that were not yet up
+        # when Subscribe was called
+        for topic, (handler, qos) in self.subscriptions.items():
+            if (topic not in mqttClient._subs):
+                await mqttClient.subscribe(topic, qos)
+
+    def _OnMessage(self, topic, message, retained, properties = None):
+        subscription = self.subscriptions.get(topic.decode())
+
+        if (subscription != None):
+            subscription[0](topic, message)
+
+    def _AnyHealthy(self):
+        for broker in self.mqttBrokers:
+            if (self._IsHealthy(broker) == True):
+                return True
+
+        return False
+
+    def _SelectBroker(self, exclude):
+        # Least loaded healthy broker: in-flight publishes weighted by the
+        # latency EWMA. Starting the scan at a rotating index spreads ties.
+        selected = None
+        selectedScore = 0
+        count = len(self.mqttBrokers)
+
+        for i in range(count):
+            broker = self.mqttBrokers[(self.nextIndex + i) % count]
+
+            if (broker in exclude or self._IsHealthy(broker) == False):
+                continue
+
+            health = self.health[broker]
+            score = (health.inFlight + 1) * (health.latencyEwma + 1)
+
+            if (selected == None or score < selectedScore):
+                selected = broker
+                selectedScore = score
+
+        self.nextIndex = (self.nextIndex + 1) % count
+        return selected
+
+    async def _PublishOn(self, broker, topic, message, qos, done):
+        mqttClient = self.mqttConnectionPool[broker]
+        health = self.health[broker]
+        health.inFlight += 1
+        start = ticks_ms()
+
+        try:
+            await mqttClient.publish(topic, message, qos = qos)
+        finally:
+            health.inFlight -= 1
+
+        latency = ticks_diff(ticks_ms(), start)
+        health.latencyEwma += (latency - health.latencyEwma) // 4
+        health.published += 1
+
+        if (done != None):
+            done.set()
+
+    async def _Sender(self, broker):
+        # A slow broker only holds up its own sender, the others keep
+        # draining the queue
+        while True:
+            if (self._IsHealthy(broker) == False):
+                await asyncio.sleep_ms(200)
+                continue
+
+            item = await self.queue.Get()
+
+            if (self._IsHealthy(broker) == False):
+                self.queue.Requeue(item)
+                continue
+
+            topic, message, qos, key, enqueued = item
+
+            try:
+                await self._PublishOn(broker, topic, message, qos, None)
+            except Exception as e:
+                # Hand the message to the other senders and keep this broker
+                # out of rotation for a while
+                print("Sender for broker failed: " + str(broker) + " " + str(e))
+                self.queue.Requeue(item)
+                health = self.health[broker]
+                health.failures += 1
+                health.suspectUntil = ticks_add(ticks_ms(), self.suspectPeriod)
+
+    async def Publish(self, topic, message, qos = 1, key = None, feed = True):
+        """Publish via the least loaded healthy broker
+
+        When the pool has an outbound queue this only waits for the message
+        to be queued (or, with the BLOCK policy, for room in the queue).
+        Queued messages with the same topic and `key` are coalesced. With
+        feed=False the message is not added to the change feed.
+        """
+        # Recorded before publishing so HTTP change feed readers see the
+        # event even when the broker is slow or unreachable
+        if (self.changeFeed != None and feed == True):
+            self.changeFeed.Append(topic, message)
+
+        # Once anything is spooled, later messages go to the spool as well
+        # so that replay keeps them in order
+        if (self.spool != None and (self.spool.Pending() == True or self._AnyHealthy() == False)):
+            self.spool.Append(topic, message)
+            return
+
+        if (self.queue != None):
+            await self.queue.Put(topic, message, qos, key)
+            return
+
+        await self._PublishNow(topic, message, qos)
+
+    async def _PublishNow(self, topic, message, qos):
+        tried = []
+
+        while True:
+            broker = self._SelectBroker(tried)
+
+            if (broker == None):
+                # Every healthy broker has been tried, wait for one to
+                # (re)connect and start over
+                tried = []
+                await asyncio.sleep_ms(200)
+                continue
+
+            # mqtt_as publishes must not be cancelled half way through a
+            # packet, so wait on an event instead. On timeout the publish
+            # stays queued on its own client and completes after its
+            # reconnect - a duplicate, which QoS 1 allows.
+            done = asyncio.Event()
+            asyncio.create_task(self._PublishOn(broker, topic, message, qos, done))
+
+            try:
+                await asyncio.wait_for_ms(done.wait(), self.publishTimeout)
+                return
+            except asyncio.TimeoutError:
+                health = self.health[broker]
+                health.failures += 1
+                health.suspectUntil = ticks_add(ticks_ms(), self.suspectPeriod)
+                tried.append(broker)
+                print("Publish to broker timed out, failing over: " + str(broker))
+
+    async def _Replay(self):
+        delay = 1000 // self.replayRate if self.replayRate > 0 else 0
+
+        while True:
+            if (self.spool.Pending() == False or self._AnyHealthy() == False):
+                await asyncio.sleep_ms(500)
+                continue
+
+            record = self.spool.Peek()
+
+            if (record == None):
+                continue
+
+            topic, message = record
+
+            if (self.queue != None):
+                await self.queue.Put(topic, message)
+            else:
+                await self._PublishNow(topic, message, 1)
+
+            self.spool.Advance()
+            await asyncio.sleep_ms(delay)
+
+    async def PublishEvent(self, topic, event):
+        # Unbatched counterpart of BatchPublisher.PublishEvent
+        await self.Publish(topic, json.dumps(event))
 
     def GetConnection(self, broker):
         return self.mqttConnectionPool[broker]
+
+    def GetStatus(self):
+        brokers = []
+
+        for broker in self.mqttBrokers:
+            health = self.health[broker]
+            brokers.append({
+                "broker": broker,
+                "healthy": self._IsHealthy(broker),
+                "inFlight": health.inFlight,
+                "latencyMs": health.latencyEwma,
+                "published": health.published,
+                "failures": health.failures,
+                "outages": self.mqttConnectionPool[broker].outages,
+                "recoveryMs": self.mqttConnectionPool[broker].last_recovery_ms
+            })
+
+        return {
+            "brokers": brokers,
+            "queue": self.queue.GetStatus() if self.queue != None else None,
+            "spool": self.spool.GetStatus() if self.spool != None else None
+        }
@@ -0,0 +1,88 @@
+import uasyncio as asyncio
+from time import ticks_ms, ticks_diff
+
+# Policies applied when Put finds the queue full
+DROP_OLDEST = 0
+DROP_NEWEST = 1
+BLOCK = 2
+
+class OutboundQueue:
+    """Bounded queue of outbound MQTT publishes.
+
+    Items are (topic, message, qos, key, enqueuedTicks). A Put with a key
+    replaces the message of a queued item with the same topic and key, so
+    only the latest state is sent.
+    """
+    def __init__(self, maxSize = 64, policy = BLOCK):
+        self.maxSize = maxSize
+        self.policy = policy
+        self.items = []
+        self._evput = asyncio.Event()  # Triggered by put, tested by get
+        self._evget = asyncio.Event()  # Triggered by get, tested by put
+        self.enqueued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.maxDepth = 0
+        self.lagEwma = 0
+        self.maxLag = 0
+
+    async def Put(self, topic, message, qos = 1, key = None):
+        if (key != None):
+            for i in range(len(self.items)):
+                item = self.items[i]
+
+                if (item[3] == key and item[0] == topic):
+                    self.items[i] = (topic, message, qos, key, item[4])
+                    self.coalesced += 1
+                    return True
+
+        while (len(self.items) >= self.maxSize):
+            if (self.policy == DROP_NEWEST):
+                self.dropped += 1
+                return False
+            elif (self.policy == DROP_OLDEST):
+                self.items.pop(0)
+                self.dropped += 1
+            else:
+                self._evget.clear()
+                await self._evget.wait()
+
+        self.items.append((topic, message, qos, key, ticks_ms()))
+        self.enqueued += 1
+        self.maxDepth = max(self.maxDepth, len(self.items))
+        self._evput.set()
+        return True
+
+    async def Get(self):
+        while (len(self.items) == 0):
+            self._evput.clear()
+            await self._evput.wait()
+
+        item = self.items.pop(0)
+        self._evget.set()
+
+        lag = ticks_diff(ticks_ms(), item[4])
+        self.lagEwma += (lag - self.lagEwma) // 4
+        self.maxLag = max(self.maxLag, lag)
+
+        return item
+
+    def Requeue(self, item):
+        # Put an item taken by Get back at the head, e.g. when its sender's
+        # connection went down in the meantime
+        self.items.insert(0, item)
+        self._evput.set()
+
+    def qsize(self):
+        return len(self.items)
+
+    def GetStatus(self):
+        return {
+            "depth": len(self.items),
+            "maxDepth": self.maxDepth,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "lagMs": self.lagEwma,
+            "maxLagMs": self.maxLag
+        }
@@ -0,0 +1,224 @@
+import os
+import struct
+
+RECORD_HEADER = "<HI"
+RECORD_HEADER_SIZE = 6
+
+class PublishSpool:
+    """Disk-backed FIFO of publishes made while no broker is reachable.
+
+    Records (topic, message) are appended to numbered segment files in
+    directory. A cursor file remembers how far replay got, so a reboot does
+    not resend everything. Replayed segments are deleted, and once the spool
+    is drained it starts again from an empty segment. When more than
+    maxSegments segments exist the oldest one is dropped.
+    """
+    def __init__(self, directory, segmentSize = 16384, maxSegments = 8, syncEvery = 16):
+        self.directory = directory
+        self.segmentSize = segmentSize
+        self.maxSegments = maxSegments
+        self.syncEvery = syncEvery
+        self.writer = None
+        self.reader = None
+        self.peeked = 0
+        self.unsynced = 0
+        self.appended = 0
+        self.replayed = 0
+        self.droppedSegments = 0
+
+        try:
+            os.mkdir(directory)
+        except OSError:
+            pass
+
+        self.segments = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith(".seg"))
+
+        if (len(self.segments) == 0):
+            self.segments.append(0)
+
+        self.writeSegment = self.segments[-1]
+        self.writeOffset = self._SegmentSize(self.writeSegment)
+        self.readSegment, self.readOffset = self._LoadCursor()
+
+        # The last record before a reset may be torn, never append after it
+        if (self.writeOffset > 0):
+            self._Rotate()
+
+    def _Path(self, segment):
+        return "%s/%08d.seg" % (self.directory, segment)
+
+    def _Remove(self, segment):
+        try:
+            os.remove(self._Path(segment))
+        except OSError:
+            pass
+
+    def _SegmentSize(self, segment):
+        try:
+            return os.stat(self._Path(segment))[6]
+        except OSError:
+            return 0
+
+    def _LoadCursor(self):
+        try:
+            with open(self.directory + "/cursor", "r") as f:
+                segment, offset = f.read().split()
+                segment = int(segment)
+                offset = int(offset)
+
+            if (segment in self.segments):
+                return segment, offset
+        except (OSError, ValueError):
+            pass
+
+        return self.segments[0], 0
+
+    def _SaveCursor(self):
+        with open(self.directory + "/cursor", "w") as f:
+            f.write("%d %d" % (self.readSegment, self.readOffset))
+
+        self.unsynced = 0
+
+    def Pending(self):
+        return self.readSegment != self.writeSegment or self.readOffset < self.writeOffset
+
+    def Append(self, topic, message):
+        if (isinstance(topic, str)):
+            topic = topic.encode()
+
+        if (isinstance(message, str)):
+            message = message.encode()
+
+        if (self.writeOffset >= self.segmentSize):
+            self._Rotate()
+
+        if (self.writer == None):
+            self.writer = open(self._Path(self.writeSegment), "ab")
+
+        self.writer.write(struct.pack(RECORD_HEADER, len(topic), len(message)))
+        self.writer.write(topic)
+        self.writer.write(message)
+        self.writer.flush()
+        self.writeOffset += RECORD_HEADER_SIZE + len(topic) + len(message)
+        self.appended += 1
+
+    def _Rotate(self):
+        if (self.writer != None):
+            self.writer.close()
+            self.writer = None
+
+        self.writeSegment += 1
+        self.writeOffset = 0
+        self.segments.append(self.writeSegment)
+
+        while (len(self.segments) > self.maxSegments):
+            oldest = self.segments.pop(0)
+            self.droppedSegments += 1
+
+            if (oldest == self.readSegment):
+                self._CloseReader()
+                self.readSegment = self.segments[0]
+                self.readOffset = 0
+                self._SaveCursor()
+
+            self._Remove(oldest)
+
+    def _CloseReader(self):
+        if (self.reader != None):
+            self.reader.close()
+            self.reader = None
+
+    def Peek(self):
+        """Return the oldest unreplayed (topic, message), or None"""
+        while (self.Pending() == True):
+            fresh = False
+
+            if (self.readSegment != self.writeSegment and self.readOffset >= self._SegmentSize(self.readSegment)):
+                # Segment fully replayed
+                self._CloseReader()
+                self._Remove(self.readSegment)
+                self.segments.remove(self.readSegment)
+                self.readSegment = self.segments[0]
+                self.readOffset = 0
+                self._SaveCursor()
+                continue
+
+            if (self.reader == None):
+                self.reader = open(self._Path(self.readSegment), "rb")
+                fresh = True
+
+            self.reader.seek(self.readOffset)
+            header = self.reader.read(RECORD_HEADER_SIZE)
+
+            if (len(header) < RECORD_HEADER_SIZE):
+                # Torn write at the end of a segment
+                self._ShortRead(fresh)
+                continue
+
+            topicLength, messageLength = struct.unpack(RECORD_HEADER, header)
+            topic = self.reader.read(topicLength)
+            message = self.reader.read(messageLength)
+
+            if (len(topic) < topicLength or len(message) < messageLength):
+                self._ShortRead(fresh)
+                continue
+
+            self.peeked = RECORD_HEADER_SIZE + topicLength + messageLength
+            return topic.decode(), message
+
+        return None
+
+    def _ShortRead(self, fresh):
+        # A FAT handle keeps the size the file had when it was opened, so
+        # records appended since, while this was the write segment, are cut
+        # short. Reopen to see them, only a short read on a fresh handle is a
+        # torn write.
+        if (fresh == False):
+            self._CloseReader()
+        else:
+            self._SkipSegment()
+
+    def _SkipSegment(self):
+        if (self.readSegment == self.writeSegment):
+            self._Rotate()
+
+        self.readOffset = self._SegmentSize(self.readSegment)
+
+    def Advance(self):
+        """Mark the record returned by Peek as replayed"""
+        self.readOffset += self.peeked
+        self.peeked = 0
+        self.replayed += 1
+        self.unsynced += 1
+
+        if (self.Pending() == False):
+            self._Compact()
+        elif (self.unsynced >= self.syncEvery):
+            self._SaveCursor()
+
+    def _Compact(self):
+        # Drained: drop what is left and continue in a fresh segment
+        self._CloseReader()
+
+        if (self.writer != None):
+            self.writer.close()
+            self.writer = None
+
+        for segment in self.segments:
+            self._Remove(segment)
+
+        self.writeSegment += 1
+        self.writeOffset = 0
+        self.segments = [self.writeSegment]
+        self.readSegment = self.writeSegment
+        self.readOffset = 0
+        self._SaveCursor()
+
+    def GetStatus(self):
+        return {
+            "pending": self.Pending(),
+            "segments": len(self.segments),
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "droppedSegments": self.droppedSegments
+        }
@@ -0,0 +1,66 @@
+from ucollections import OrderedDict
+from EntityVersions import get_version, get_boot_id
+
+class ResponseCache:
+    """Small LRU cache of serialised API responses.
+
+    Entries are keyed by url (route + query) and tagged with an ETag built
+    from the versions of the entity types the response depends on, so a
+    write to any of those types invalidates the entry without a sweep.
+    """
+    def __init__(self, maxEntries = 8, maxBodySize = 4096):
+        self.maxEntries = maxEntries
+        self.maxBodySize = maxBodySize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def ETag(self, entityTypes):
+        versions = '.'.join(str(get_version(entityType)) for entityType in entityTypes)
+        return '"%x-%s"' % (get_boot_id(), versions)
+
+    def Matches(self, ifNoneMatch, etag):
+        if (ifNoneMatch == None):
+            return False
+
+        for candidate in ifNoneMatch.split(','):
+            candidate = candidate.strip()
+
+            if (candidate.startswith('W/')):
+                candidate = candidate[2:]
+
+            if (candidate == etag or candidate == '*'):
+                return True
+
+        return False
+
+    def Get(self, key, etag):
+        entry = self.entries.get(key)
+
+        if (entry == None or entry[0] != etag):
+            self.misses += 1
+            return None
+
+        # Re-insert to mark the entry as most recently used
+        del self.entries[key]
+        self.entries[key] = entry
+        self.hits += 1
+
+        return entry[1]
+
+    def Put(self, key, etag, body):
+        if (key in self.entries):
+            del self.entries[key]
+
+        # Large bodies (e.g. GetAll on a big tree) still get an ETag, but are
+        # not kept in RAM
+        if (len(body) > self.maxBodySize):
+            return
+
+        while (len(self.entries) >= self.maxEntries):
+            del self.entries[next(iter(self.entries))]
+
+        self.entries[key] = (etag, body)
+
+    def Clear(self):
+        self.entries.clear()
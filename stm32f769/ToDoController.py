@@ -1,10 +1,9 @@
 from ToDoItem import ToDoItem
-import json
 
 class ToDoController:
-    def __init__(self, mqttConnectionPool, dao, topics):
+    def __init__(self, publisher, dao, topics):
         self.todoDao = dao
-        self.mqttConnectionPool = mqttConnectionPool
+        self.publisher = publisher
         self.topics = topics
         
     async def AddItem(self, mqttSessionId, item):
@@ -23,7 +22,7 @@ class ToDoController:
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(item_data))
+                await self.publisher.PublishEvent(topic, item_data)
                 print("published not found todo add...")
                 
             return                
@@ -34,11 +33,11 @@ class ToDoController:
                             "ClientId": item["clientId"],                                                                        
                             "EntityType":"ToDoItem",
                             "Operation":"Create",
-                            "Entity" : json.dumps(savedItem)                                                                                    
+                            "Entity" : savedItem                                                                                    
                         }
            
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(item_data))
+                await self.publisher.PublishEvent(topic, item_data)
             
         return savedItem
 
@@ -65,12 +64,12 @@ class ToDoController:
                             "ClientId": savedItem["clientId"],                                                                        
                             "EntityType":"ToDoItem",
                             "Operation":"Update",                        
-                            "Entity" : json.dumps(result),
+                            "Entity" : result,
                             "entityId": id                            
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(item_data))
+                await self.publisher.PublishEvent(topic, item_data)
 
             return result            
 
@@ -99,7 +98,7 @@ class ToDoController:
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(item_data))
+                await self.publisher.PublishEvent(topic, item_data)
                 print("published not found todo delete..." + str(id))
             return                
         else:            
@@ -111,11 +110,11 @@ class ToDoController:
                             "ClientId": id,                                                                            
                             "EntityType":"ToDoItem",
                             "Operation":"Delete",
-                            "Entity" : json.dumps(savedItem)                                                                                                            
+                            "Entity" : savedItem                                                                                                            
                          }
 
             for topic in self.topics:
-                await self.mqttConnectionPool.Publish(topic, json.dumps(item_data))
+                await self.publisher.PublishEvent(topic, item_data)
                 print("published todo delete..." + str(id))            
         
         return result
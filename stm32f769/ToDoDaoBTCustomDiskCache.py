@@ -3,6 +3,7 @@ import json
 from ToDoItem import ToDoItem
 from btree_hybrid_disk_cache import BTree
 import time
+from EntityVersions import bump_version
 
 class ToDoDaoBT:
     def __init__(self, treeDepth, dir):
@@ -12,6 +13,7 @@ class ToDoDaoBT:
         db = self.db
         item["id"] = str(time.time_ns())                
         db.insert((item["id"], item))        
+        bump_version("ToDoItem")
         newItem = await self.GetItemById(item["id"])
         
         return newItem
@@ -19,6 +21,7 @@ class ToDoDaoBT:
     async def UpdateItem(self, id, item):
         db = self.db
         db.update_value(id, item)        
+        bump_version("ToDoItem")
         updatedItem = await self.GetItemById(id)
         
         return updatedItem
@@ -49,6 +52,7 @@ class ToDoDaoBT:
 
         if (db.find(id) != None):
             db.delete(db.root, (id,))            
+            bump_version("ToDoItem")
             result = "Item deleted..."            
             
         return result                    
@@ -56,6 +60,7 @@ class ToDoDaoBT:
     async def DeleteAllItems(self):
         db = self.db
         db.delete_all()        
+        bump_version("ToDoItem")
         
         result = "All Items deleted..."            
         return result                    
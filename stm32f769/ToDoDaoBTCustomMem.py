@@ -2,6 +2,7 @@ import os
 import json
 from ToDoItem import ToDoItem
 import time
+from EntityVersions import bump_version
 
 class ToDoDaoBT:
     def __init__(self, btree):
@@ -11,6 +12,7 @@ class ToDoDaoBT:
         db = self.db
         item["id"] = str(time.time_ns())        
         db.insert((item["id"], item))        
+        bump_version("ToDoItem")
         newItem = await self.GetItemById(item["id"])
         
         return newItem
@@ -18,6 +20,7 @@ class ToDoDaoBT:
     async def UpdateItem(self, id, item):
         db = self.db
         db.update_value(id, item)        
+        bump_version("ToDoItem")
         updatedItem = await self.GetItemById(id)
         
         return updatedItem
@@ -48,6 +51,7 @@ class ToDoDaoBT:
 
         if (db.find(id) != None):
             db.delete(id)                
+            bump_version("ToDoItem")
             result = "Item deleted..."            
             
         return result                    
@@ -55,6 +59,7 @@ class ToDoDaoBT:
     async def DeleteAllItems(self):
         db = self.db
         db.delete_all()        
+        bump_version("ToDoItem")
         
         result = "All Items deleted..."            
         return result                    
@@ -0,0 +1,76 @@
+"""
+Benchmark of the file sync integrity checks
+Run on the unix (host) port or on a board to compare the bytes per second
+of each method in file_integrity.py, fed the way file_async_receiver.py
+feeds them: one update per received block.
+
+Every run prints a summary line and a machine readable line
+    RESULT {"method": ..., "block": ..., "bytes_per_s": ..., ...}
+which is also appended to RESULTS_FILE when that can be written.
+"""
+
+import gc
+import json
+import time
+import file_integrity
+
+TOTAL_BYTES = 256 * 1024
+BLOCK_SIZES = (256, 1024, 4096)
+RESULTS_FILE = 'integrity_bench.jsonl'
+
+print("=" * 60)
+print("INTEGRITY CHECK BENCHMARK")
+print("=" * 60)
+
+class Simple32Python(file_integrity.Simple32):
+    """The simple32 checksum without the viper loop, as sha256_simple was"""
+    def update(self, data):
+        self.sum = file_integrity._mix_python(self.sum, data, len(data), 0xFFFFFFFF)
+
+METHODS = dict(file_integrity.METHODS)
+METHODS["simple32-python"] = Simple32Python
+
+def report(result):
+    print("{method:16} block={block:5}: {bytes_per_s} bytes/s ({elapsed_ms}ms)".format(**result))
+    line = json.dumps(result)
+    print("RESULT " + line)
+
+    try:
+        with open(RESULTS_FILE, 'a') as f:
+            f.write(line + '\n')
+    except OSError:
+        pass
+
+def run(method, block):
+    buf = bytearray(block)
+
+    for i in range(block):
+        buf[i] = (i * 7) & 0xFF
+
+    mv = memoryview(buf)
+    blocks = TOTAL_BYTES // block
+    h = METHODS[method]()
+    gc.collect()
+    start = time.ticks_ms()
+
+    for i in range(blocks):
+        h.update(mv)
+
+    h.digest()
+    elapsed = max(1, time.ticks_diff(time.ticks_ms(), start))
+
+    return {
+        "method": method,
+        "block": block,
+        "bytes": blocks * block,
+        "elapsed_ms": elapsed,
+        "bytes_per_s": blocks * block * 1000 // elapsed
+    }
+
+for block in BLOCK_SIZES:
+    for method in METHODS:
+        report(run(method, block))
+
+print("\n" + "=" * 60)
+print("BENCHMARK COMPLETE")
+print("=" * 60)
@@ -0,0 +1,203 @@
+"""
+Benchmark and soak test for the MQTT publish path
+Run on STM32F769 against a local broker (e.g. mosquitto on the LAN) to
+measure mqtt_as_latest and MqttConnectionPool throughput and latency.
+
+Every run prints a summary line and a machine readable line
+    RESULT {"target": ..., "qos": ..., "msgs_per_s": ..., ...}
+which is also appended to RESULTS_FILE when that can be written.
+"""
+
+import gc
+import json
+import time
+import uasyncio as asyncio
+from array import array
+from mqtt_as_latest import MQTTClient, config
+from MqttConnectionPool import MqttConnectionPool
+
+BROKERS = ['192.168.10.124', '192.168.10.135']
+TOPIC = 'bench/publish'
+MESSAGES = 500
+QOS_LEVELS = (0, 1)
+PAYLOAD_SIZES = (16, 256, 1024)
+WINDOWS = (1, 4, 8)
+POOL_SIZES = (1, 2)
+SOAK_SECONDS = 0  # > 0 runs a soak test after the benchmark
+SOAK_INTERVAL = 60
+RESULTS_FILE = '/sd/mqtt_bench.jsonl'
+
+print("=" * 60)
+print("MQTT PUBLISH BENCHMARK")
+print("=" * 60)
+
+class Stats:
+    """Latencies of one run plus heap and GC tracking"""
+    def __init__(self, count):
+        self.latencies = array('I', [0] * count)
+        self.count = 0
+        self.gcCount = 0
+        self.lastAlloc = 0
+
+    def Start(self):
+        gc.collect()
+        self.memStart = gc.mem_free()
+        self.lastAlloc = gc.mem_alloc()
+        self.startTime = time.ticks_ms()
+
+    def Add(self, latency):
+        if (self.count < len(self.latencies)):
+            self.latencies[self.count] = latency
+            self.count += 1
+
+        # MicroPython has no GC counter: a drop in allocated memory means a
+        # collection ran since the last sample
+        alloc = gc.mem_alloc()
+
+        if (alloc < self.lastAlloc):
+            self.gcCount += 1
+
+        self.lastAlloc = alloc
+
+    def Stop(self):
+        self.elapsed = max(1, time.ticks_diff(time.ticks_ms(), self.startTime))
+        gc.collect()
+        self.memEnd = gc.mem_free()
+
+    def Percentile(self, sortedLatencies, p):
+        if (len(sortedLatencies) == 0):
+            return 0
+
+        return sortedLatencies[min(len(sortedLatencies) - 1, len(sortedLatencies) * p // 100)]
+
+    def Result(self, **params):
+        latencies = sorted(self.latencies[:self.count])
+        result = dict(params)
+        result.update({
+            "messages": self.count,
+            "elapsed_ms": self.elapsed,
+            "msgs_per_s": self.count * 1000 // self.elapsed,
+            "p50_ms": self.Percentile(latencies, 50),
+            "p99_ms": self.Percentile(latencies, 99),
+            "max_ms": latencies[-1] if len(latencies) > 0 else 0,
+            "heap_delta": self.memStart - self.memEnd,
+            "gc_count": self.gcCount
+        })
+
+        return result
+
+def report(result):
+    print("{target:6} qos={qos} payload={payload:5} pool={pool} window={window}: "
+          "{msgs_per_s} msg/s p50={p50_ms}ms p99={p99_ms}ms heap={heap_delta} gc={gc_count}".format(**result))
+    line = json.dumps(result)
+    print("RESULT " + line)
+
+    try:
+        with open(RESULTS_FILE, 'a') as f:
+            f.write(line + '\n')
+    except OSError:
+        pass
+
+async def run(publish, stats, messages, window, payload, qos):
+    # `window` tasks publish concurrently, each waiting for its own publish
+    # to complete before sending the next one
+    perTask = messages // window
+
+    async def worker():
+        for i in range(perTask):
+            start = time.ticks_ms()
+            await publish(TOPIC, payload, qos)
+            stats.Add(time.ticks_diff(time.ticks_ms(), start))
+
+    stats.Start()
+    await asyncio.gather(*[worker() for i in range(window)])
+    stats.Stop()
+
+async def benchmark_client():
+    config['server'] = BROKERS[0]
+    config['client_id'] = b'bench-client'
+    config['clean'] = True
+    client = MQTTClient(config)
+    await client.connect()
+
+    async def publish(topic, payload, qos):
+        await client.publish(topic, payload, qos = qos)
+
+    for qos in QOS_LEVELS:
+        for size in PAYLOAD_SIZES:
+            payload = bytes(size)
+
+            for window in WINDOWS:
+                if (qos == 0 and window > 1):
+                    continue
+
+                client._max_inflight = window
+                stats = Stats(MESSAGES)
+                await run(publish, stats, MESSAGES, window, payload, qos)
+                report(stats.Result(target = "client", qos = qos, payload = size, pool = 1, window = window))
+
+    await client.disconnect()
+
+async def benchmark_pool():
+    config['client_id'] = b'bench-pool'
+
+    for poolSize in POOL_SIZES:
+        if (poolSize > len(BROKERS)):
+            continue
+
+        for window in WINDOWS:
+            pool = MqttConnectionPool(BROKERS[:poolSize], window = window, cleanSession = True)
+            await pool.Initialise()
+
+            async def publish(topic, payload, qos):
+                await pool.Publish(topic, payload, qos)
+
+            for size in PAYLOAD_SIZES:
+                payload = bytes(size)
+                stats = Stats(MESSAGES)
+                # Concurrent callers, as with several HTTP requests at once
+                await run(publish, stats, MESSAGES, window * poolSize, payload, 1)
+                report(stats.Result(target = "pool", qos = 1, payload = size, pool = poolSize, window = window))
+
+            for broker in BROKERS[:poolSize]:
+                await pool.GetConnection(broker).disconnect()
+
+async def soak():
+    # Fixed load for SOAK_SECONDS, one result per SOAK_INTERVAL to spot
+    # latency creep, heap leaks or reconnects over time
+    config['client_id'] = b'bench-soak'
+    pool = MqttConnectionPool(BROKERS, window = 4, cleanSession = True)
+    await pool.Initialise()
+    payload = bytes(256)
+    end = time.ticks_add(time.ticks_ms(), SOAK_SECONDS * 1000)
+    interval = 0
+
+    while (time.ticks_diff(end, time.ticks_ms()) > 0):
+        stats = Stats(SOAK_INTERVAL * 100)
+        stats.Start()
+        intervalEnd = time.ticks_add(time.ticks_ms(), SOAK_INTERVAL * 1000)
+
+        while (time.ticks_diff(intervalEnd, time.ticks_ms()) > 0):
+            start = time.ticks_ms()
+            await pool.Publish(TOPIC, payload, 1)
+            stats.Add(time.ticks_diff(time.ticks_ms(), start))
+
+        stats.Stop()
+        interval += 1
+        result = stats.Result(target = "soak", qos = 1, payload = len(payload), pool = len(BROKERS), window = 4)
+        result["interval"] = interval
+        result["outages"] = sum(broker["outages"] for broker in pool.GetStatus()["brokers"])
+        report(result)
+
+async def main():
+    await benchmark_client()
+    await benchmark_pool()
+
+    if (SOAK_SECONDS > 0):
+        await soak()
+
+    print("\n" + "=" * 60)
+    print("BENCHMARK COMPLETE")
+    print("=" * 60)
+
+asyncio.run(main())
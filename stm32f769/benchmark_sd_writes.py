@@ -0,0 +1,115 @@
+"""
+Benchmark of the receiver's writes to a FAT file system
+Counts the block device operations FAT makes while a file arrives in small
+blocks, once written block by block as file_async_receiver.py used to and
+once through file_writer.BufferedWriter. A RAMBlockDevExt stands in for
+/sd so the counts do not depend on the card.
+
+Every run prints a summary line and a machine readable line
+    RESULT {"writer": ..., "block": ..., "reads": ..., "writes": ..., ...}
+which is also appended to RESULTS_FILE when that can be written.
+"""
+
+import gc
+import json
+import os
+import time
+from ramblock import RAMBlockDevExt
+from file_writer import BufferedWriter
+
+ROOT_DIR = '/rb'
+FILE_BYTES = 64 * 1024
+BLOCK_SIZES = (250, 500, 1024)
+WRITE_BUFFER = 8192
+RESULTS_FILE = 'sd_writes_bench.jsonl'
+
+print("=" * 60)
+print("SD WRITE COALESCING BENCHMARK")
+print("=" * 60)
+
+class CountingBlockDev(RAMBlockDevExt):
+    """RAMBlockDevExt that counts the calls and blocks FAT asks for"""
+    def __init__(self, block_size, num_blocks):
+        super().__init__(block_size, num_blocks)
+        self.Reset()
+
+    def Reset(self):
+        self.reads = 0
+        self.writes = 0
+        self.blocksRead = 0
+        self.blocksWritten = 0
+
+    def readblocks(self, block_num, buf, offset=0):
+        self.reads += 1
+        self.blocksRead += len(buf) // self.block_size
+        super().readblocks(block_num, buf, offset)
+
+    def writeblocks(self, block_num, buf, offset=None):
+        self.writes += 1
+        self.blocksWritten += len(buf) // self.block_size
+        super().writeblocks(block_num, buf, offset)
+
+def report(result):
+    print("{writer:8} block={block:5}: reads={reads} writes={writes} "
+          "blocks read={blocks_read} written={blocks_written} ({elapsed_ms}ms)".format(**result))
+    line = json.dumps(result)
+    print("RESULT " + line)
+
+    try:
+        with open(RESULTS_FILE, 'a') as f:
+            f.write(line + '\n')
+    except OSError:
+        pass
+
+def run(bdev, writer, block):
+    data = bytearray(block)
+
+    for i in range(block):
+        data[i] = i & 0xFF
+
+    fileName = ROOT_DIR + '/bench.bin'
+
+    try:
+        os.remove(fileName)
+    except OSError:
+        pass
+
+    gc.collect()
+    bdev.Reset()
+    start = time.ticks_ms()
+    fout = open(fileName, 'wb')
+
+    if (writer == 'buffered'):
+        fout = BufferedWriter(fout, WRITE_BUFFER)
+
+    for i in range(FILE_BYTES // block):
+        fout.write(data)
+
+    fout.close()
+    elapsed = time.ticks_diff(time.ticks_ms(), start)
+
+    return {
+        "writer": writer,
+        "block": block,
+        "bytes": FILE_BYTES // block * block,
+        "elapsed_ms": elapsed,
+        "reads": bdev.reads,
+        "writes": bdev.writes,
+        "blocks_read": bdev.blocksRead,
+        "blocks_written": bdev.blocksWritten
+    }
+
+bdev = CountingBlockDev(512, 500)
+os.VfsFat.mkfs(bdev)
+os.mount(bdev, ROOT_DIR)
+
+try:
+    for block in BLOCK_SIZES:
+        for writer in ('direct', 'buffered'):
+            report(run(bdev, writer, block))
+finally:
+    os.umount(ROOT_DIR)
+
+print("\n" + "=" * 60)
+print("BENCHMARK COMPLETE")
+print("=" * 60)
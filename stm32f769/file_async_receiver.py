@@ -6,6 +6,12 @@ import uhashlib
 import ubinascii
 import machine, pyb
 import os
+import file_frame
+import file_window
+import file_manifest
+import file_compress
+import file_integrity
+import file_writer
 import time
 from ubinascii import hexlify
 from machine import unique_id
@@ -15,13 +21,170 @@ SERVER = '192.168.10.135'
 SERVER = '192.168.10.174' #bbb
 _error_q = {}
 _success_q = {}
-_in_hash_sha256 = uhashlib.sha256()
-fout = None
+_sessions = {}
+_max_sessions = 4
+_max_held_bytes = 65536
+_checkpoint_bytes = 16384
+_session_idle_ms = 60000  # Transfers that get no blocks for this long are dropped
+_write_buffer = 8192  # Per transfer, blocks are written to /sd in whole sectors
+_acks_pending = []
 backupDir = '/sd/backups_new'
+_manifest_file = backupDir + '/manifest.json'
+_manifest = {}
+_topic_ack = 'pico2w_file_sync/ack'
+_event_ack = asyncio.Event()
+
+class ReceiveSession:
+    # State of one file being received, keyed by the FileId of its Header
+    def __init__(self, file_id, file_name, file_size, delta = False, compression = None, file_hash = None, integrity = 'sha256'):
+        self.file_id = file_id
+        self.file_name = file_name
+        self.file_size = file_size
+        self.file_hash = file_hash
+        self.compression = compression
+        self.integrity = integrity
+        self.file_out = copyPath(file_name, True)
+        self.file_part = self.file_out + ".part"
+        self.file_checkpoint = self.file_out + ".ckpt"
+        self.delta = delta
+        self.offset = 0
+        self.checkpoint = 0
+        self.hash = file_integrity.new(integrity)
+        self.window = file_window.ReceiveWindow(_max_held_bytes // _max_sessions)
+        self.fout = None
+        self.closed = False
+        self.last_active = time.ticks_ms()
+        
+        if (delta == True):
+            # A delta only carries changed blocks, which overwrite the existing copy
+            self.fout = file_writer.BufferedWriter(open(self.file_out, "r+b"), _write_buffer)
+        elif (file_hash == None):
+            # A full copy goes to a temp file that replaces the copy once
+            # its hash checks out. Without a FileHash it can not be resumed
+            self.fout = file_writer.BufferedWriter(open(self.file_part, "wb"), _write_buffer)
+
+    async def resume(self):
+        # Carry on with a transfer of the same file that a reset cut short.
+        # Blocks are not written until this has opened the temp file
+        if (self.closed == True):
+            return
+            
+        checkpoint = file_manifest.load(self.file_checkpoint)
+        fout = None
+        
+        if (checkpoint.get("Hash") == self.file_hash and checkpoint.get("Size") == self.file_size):
+            try:
+                fout = open(self.file_part, "r+b")
+            except OSError:
+                pass
+            
+        if (fout != None):
+            # A hash object can not be saved, rebuild it from what was written.
+            # That reads back up to the whole file, so yield after each read
+            buf = bytearray(4096)
+            mv = memoryview(buf)
+            remaining = checkpoint["Offset"]
+            
+            while (remaining > 0):
+                n = fout.readinto(mv[:min(len(buf), remaining)])
+                
+                if (not n):
+                    break
+                    
+                self.hash.update(mv[:n])
+                remaining -= n
+                await asyncio.sleep_ms(0)
+                
+                if (self.closed == True):
+                    fout.close()
+                    return
+                
+            if (remaining > 0):
+                fout.close()
+                fout = None
+                self.hash = file_integrity.new(self.integrity)
+            else:
+                self.offset = checkpoint["Offset"]
+                print("resuming " + self.file_name + " at " + str(self.offset))
+                
+        if (fout == None):
+            fout = open(self.file_part, "wb")
+            
+        self.checkpoint = self.offset
+        self.fout = file_writer.BufferedWriter(fout, _write_buffer, self.offset)
+
+    def restart(self):
+        # The sender started over from 0 instead of resuming
+        print("restarting " + self.file_name)
+        self.fout.seek(0)
+        self.offset = 0
+        self.checkpoint = 0
+        self.hash = file_integrity.new(self.integrity)
+        removeFile(self.file_checkpoint)
+
+    def saveCheckpoint(self):
+        self.fout.flush()
+        file_manifest.save(self.file_checkpoint, {"Hash": self.file_hash, "Size": self.file_size, "Offset": self.offset})
+        self.checkpoint = self.offset
+
+    def commit(self, ok):
+        # Replace the copy with the checked temp file, or drop the temp file
+        self.close()
+        
+        if (self.delta == True):
+            return
+            
+        if (ok == True):
+            removeFile(self.file_out)
+            os.rename(self.file_part, self.file_out)
+        else:
+            removeFile(self.file_part)
+            
+        removeFile(self.file_checkpoint)
+
+    def close(self):
+        self.closed = True
+        
+        if (self.fout != None):
+            self.fout.close()
+            self.fout = None
+
+def copyPath(file_name, make_dirs = False):
+    # Files from a directory sync keep their directories under backupDir
+    head, sep, tail = (backupDir + "/" + file_name.lstrip("/")).rpartition("/")
+    
+    if (make_dirs == True):
+        makeDirs(head)
+        
+    return head + "/copy-" + tail
+
+def makeDirs(path):
+    current = ""
+    
+    for part in path.split("/"):
+        if (part == ""):
+            continue
+            
+        current += "/" + part
+        
+        try:
+            os.mkdir(current)
+        except OSError:
+            pass  # Already there
+
+def removeFile(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
 
 def callback(topic, msg_in, retained):
     global _success_q, _error_q
 #    print((topic, msg_in, retained))
+    if (file_frame.is_frame(msg_in)):
+        processBlock(msg_in, _success_q, _error_q)
+        return
+        
     msg = ujson.loads(msg_in)
     
     if ("Category" in msg.keys()):
@@ -32,6 +195,8 @@ def callback(topic, msg_in, retained):
             
             if (step == 'Start'):
                 print("starting sync...")
+                # Drop the manifest lines superseded since the last sync
+                file_manifest.save(_manifest_file, _manifest)
                 _success_q.clear()
                 _error_q.clear()
             else:
@@ -50,21 +215,158 @@ async def conn_han(client):
     await client.subscribe('pico2w_file_sync', 1)
     print("subscribed to pico2w_file_sync...")
 
+def queueAck(file_id, step = 'Ack', value = None):
+    if ((file_id, step, value) not in _acks_pending):
+        _acks_pending.append((file_id, step, value))
+        
+    _event_ack.set()
+
+def processBlock(msg_in, success_q, error_q):
+    try:
+        file_id, seq, offset, file_data, flags = file_frame.unpack_frame(msg_in)
+    except ValueError as e:
+        # Not acknowledged, so the sender resends it
+        print("bad block: " + str(e))
+        return
+
+    session = _sessions.get(file_id)
+
+    if (session == None):
+        # E.g. after a reset, the sender starts over and resumes
+        print("block for unknown file: " + str(file_id))
+        queueAck(file_id, 'Unknown')
+        return
+        
+    session.last_active = time.ticks_ms()
+    
+    if (session.fout == None):
+        # Still rebuilding the hash to resume, the sender resends it
+        return
+        
+    if (flags & file_frame.FRAME_COMPRESSED):
+        file_data = file_compress.decompress(session.compression, file_data)
+        
+    # Blocks ahead of a missing one are held back until it is resent
+    for offset, file_data in session.window.add(seq, offset, file_data):
+        if (offset == 0 and session.offset > 0 and session.delta == False):
+            session.restart()
+            
+        if (offset != session.offset):
+            if (session.delta == False or offset < session.offset):
+                error_q[session.file_name] = "File copy failed, block at " + str(offset) + " out of order"
+                break
+                
+            # Skip the unchanged blocks of a delta
+            session.fout.seek(offset)
+            session.offset = offset
+    
+        # file_data is a memoryview into the received message, the writer
+        # copies it into its buffer
+        if (session.delta == False):
+            session.hash.update(file_data)
+            
+        session.fout.write(file_data)
+        session.offset += len(file_data)
+        
+    if (session.file_hash != None and session.delta == False and session.offset - session.checkpoint >= _checkpoint_bytes):
+        session.saveCheckpoint()
+        
+    success_q[session.file_name] = 'File copy in progress...' + str(session.offset * 100 // max(1, session.file_size)) + '%'
+    queueAck(file_id)
+
+async def sendAcks(client):
+    # Acks are sent from a task since the callback can not await; blocks that
+    # arrive while one is published are covered by the next
+    while True:
+        await _event_ack.wait()
+        _event_ack.clear()
+        
+        while (len(_acks_pending) > 0):
+            file_id, step, value = _acks_pending.pop(0)
+            ack = {
+                    "Category": 'Files',
+                    "Step": step,
+                    "FileId": file_id
+                }
+            
+            if (step == 'Done'):
+                ack["Ok"] = value
+            elif (step == 'Resume'):
+                ack["Offset"] = value
+            elif (step == 'Full' or step == 'Reject'):
+                # Lets the sender pick a method this side can decompress
+                ack["Compression"] = file_compress.supported()
+                ack["Integrity"] = file_integrity.supported()
+            session = _sessions.get(file_id)
+            
+            if (step == 'Ack'):
+                if (session == None):
+                    continue
+                    
+                ack["Base"], ack["Bitmap"] = session.window.ack()
+                
+            await client.publish(_topic_ack, ujson.dumps(ack), qos = 0)
+
+        await asyncio.sleep_ms(10)
+
 def processFile(msg, success_q, error_q):
-    global _in_hash_sha256, fout
-   
     print("process file...")
     step = msg["Step"]
+    file_id = msg.get("FileId")
 #    print("Msg: " + str(msg))
     
     if (step == "Header"):
         print("Processing header...")        
-        _in_hash_sha256 = uhashlib.sha256()              
         file_name = msg["FileName"]            
-        file_out = backupDir + "/copy-" + file_name
-        print("creating file: " + file_out)        
-        fout = open(file_out, "wb")
-        print("created file: " + file_out)
+        session = _sessions.pop(file_id, None)
+        
+        if (session != None):
+            session.close()
+            
+        dropSessions(file_name)
+            
+        if (len(_sessions) >= _max_sessions):
+            # The sender tries the file again once a transfer has finished
+            print("too many transfers, rejecting: " + file_name)
+            queueAck(file_id, 'Reject')
+            return
+            
+        base_hash = msg.get("BaseHash")
+        compression = msg.get("Compression")
+        # Senders from before the Integrity field check with SHA256
+        integrity = msg.get("Integrity", 'sha256')
+        
+        if (compression != None and compression not in file_compress.supported()):
+            print("unsupported compression " + compression + ": " + file_name)
+            queueAck(file_id, 'Full')
+            return
+            
+        if (integrity not in file_integrity.supported()):
+            print("unsupported integrity check " + integrity + ": " + file_name)
+            queueAck(file_id, 'Full')
+            return
+            
+        if (base_hash != None):
+            entry = _manifest.get(file_name)
+            
+            if (entry == None or entry["Hash"] != base_hash or file_exist(copyPath(file_name)) == False):
+                print("no copy to apply the delta to: " + file_name)
+                queueAck(file_id, 'Full')
+                return
+                
+            # The copy is patched in place: if that is cut short it no longer
+            # matches any hash, so the next attempt must be a full copy
+            del _manifest[file_name]
+            file_manifest.append(_manifest_file, file_name, None)
+                
+        print("creating file: " + file_name)        
+        session = ReceiveSession(file_id, file_name, msg.get("FileSize", 0), base_hash != None, compression, msg.get("FileHash"), integrity)
+        _sessions[file_id] = session
+        print("created file: " + file_name)
+        
+        if (session.file_hash != None and session.delta == False):
+            asyncio.create_task(resumeSession(session))
+            
         success_q[file_name] = 'File copy starting...'
 
         if (file_name in error_q.keys()):
@@ -74,28 +376,75 @@ def processFile(msg, success_q, error_q):
         print("Processing content...")                
         file_name = msg["FileName"]                            
         file_data = ubinascii.a2b_base64(msg["FileData"])
+        
+        if ("Compression" in msg):
+            file_data = file_compress.decompress(msg["Compression"], file_data)
 #        print("File Data: " + str(file_data))
-        _in_hash_sha256.update(file_data)
         progress = msg["ProgressPercentage"]                                    
         success_q[file_name] = 'File copy in progress...' + str(progress) + '%'
+        session = _sessions.get(file_id)
         
-        if (fout != None):
-            fout.write(file_data)
+        if (session != None):
+            session.last_active = time.ticks_ms()
+            session.hash.update(file_data)
+            session.fout.write(file_data)
 
     elif (step == "End"):
         print("Processing end...")
         file_name = msg["FileName"]                        
-        in_hash_final = _in_hash_sha256.digest()
-        base64_hash_data = ubinascii.b2a_base64(in_hash_final)[:-1]
-        base64_hash_data_string = base64_hash_data.decode("utf-8")
+        session = _sessions.pop(file_id, None)
+        
+        if (session == None):
+            queueAck(file_id, 'Unknown')
+            return
+            
+        session.close()
+        
+        if (session.delta == True):
+            # Unchanged blocks were never received, hash the patched copy
+            base64_hash_data_string = file_integrity.hash_file(session.integrity, session.file_out)
+        else:
+            base64_hash_data_string = file_integrity.b64digest(session.hash)
+            
         in_msg_hash = msg["HashData"]
+        ok = base64_hash_data_string == in_msg_hash
     
-        if (base64_hash_data_string == in_msg_hash):
+        if (ok == True):
             success_q[file_name] = "File copy OK"
+            # The manifest keeps the SHA256 whatever the End check was made with
+            file_hash = session.file_hash if (session.file_hash != None) else in_msg_hash
+            _manifest[file_name] = {"Size": session.file_size, "Hash": file_hash}
         else:
             print("msg hash:" + in_msg_hash)
             print("file hash:" + base64_hash_data_string)            
             error_q[file_name] = "File copy failed"                
+            _manifest.pop(file_name, None)
+            
+        session.commit(ok)
+        file_manifest.append(_manifest_file, file_name, _manifest.get(file_name))
+        queueAck(file_id, 'Done', ok)
+    
+def dropSessions(file_name):
+    # Makes room for a new Header: drops an earlier transfer of the same
+    # file and those whose sender went away, e.g. was reset. Their temp
+    # file and checkpoint stay, so the file can still be resumed
+    now = time.ticks_ms()
+    
+    for session in list(_sessions.values()):
+        if (session.file_name == file_name or time.ticks_diff(now, session.last_active) > _session_idle_ms):
+            print("dropping transfer of " + session.file_name)
+            del _sessions[session.file_id]
+            session.close()
+    
+async def resumeSession(session):
+    await session.resume()
+    session.last_active = time.ticks_ms()
+    
+    if (_sessions.get(session.file_id) is session):
+        # Tells the sender where to continue, 0 unless resuming
+        queueAck(session.file_id, 'Resume', session.offset)
+    else:
+        session.close()
     
 def file_exist(filename):
     try:
@@ -108,6 +457,7 @@ def file_exist(filename):
     
 async def main(client):
     await client.connect()
+    asyncio.create_task(sendAcks(client))
     n = 0
     
     while True:
@@ -170,6 +520,8 @@ else:
     os.mkdir(backupDir)
     print("created: " + backupDir)    
 
+_manifest = file_manifest.load(_manifest_file)
+
 MQTTClient.DEBUG = True  # Optional: print diagnostic messages
 mqttClient = MQTTClient(config)
 
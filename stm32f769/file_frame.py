@@ -0,0 +1,50 @@
+# file_frame.py Binary framing of file blocks sent over MQTT
+# Used by mqtt_file_sender.py and file_async_receiver.py.
+
+# A Content block is published as a fixed little endian header followed by
+# the raw file bytes, so nothing is base64 encoded or wrapped in JSON:
+#   magic (1) version (1) file id (2) sequence (4) offset (4) length (2) crc32 (4)
+# The top bit of the version byte flags a block compressed with the method
+# named in the Header, offset is always the uncompressed file offset.
+# The Start, Header and End steps stay JSON. JSON always starts with '{', the
+# magic byte tells the two apart.
+
+import struct
+from binascii import crc32
+
+FRAME_MAGIC = 0xF1
+FRAME_VERSION = 1
+FRAME_COMPRESSED = 0x80
+FRAME_HEADER = "<BBHIIHI"
+FRAME_HEADER_SIZE = 18
+
+
+def is_frame(msg):
+    return len(msg) >= FRAME_HEADER_SIZE and msg[0] == FRAME_MAGIC
+
+
+# Returns the frame for `length` data bytes and a memoryview of its data
+# part, so a file can be read straight into it with readinto.
+def new_frame(length):
+    frame = bytearray(FRAME_HEADER_SIZE + length)
+    return frame, memoryview(frame)[FRAME_HEADER_SIZE:]
+
+
+# Fills in the header once the data part holds the block.
+def pack_frame(frame, file_id, seq, offset, flags=0):
+    data = memoryview(frame)[FRAME_HEADER_SIZE:]
+    struct.pack_into(FRAME_HEADER, frame, 0, FRAME_MAGIC, FRAME_VERSION | flags, file_id, seq, offset, len(data), crc32(data))
+
+
+# Returns (file id, sequence, offset, data, flags) where data is a memoryview
+# into msg. Raises ValueError if the frame is damaged.
+def unpack_frame(msg):
+    magic, version, file_id, seq, offset, length, crc = struct.unpack_from(FRAME_HEADER, msg, 0)
+    if magic != FRAME_MAGIC or version & ~FRAME_COMPRESSED != FRAME_VERSION:
+        raise ValueError("Bad frame header")
+    data = memoryview(msg)[FRAME_HEADER_SIZE : FRAME_HEADER_SIZE + length]
+    if len(data) != length:
+        raise ValueError("Short frame")
+    if crc32(data) != crc:
+        raise ValueError("Bad frame CRC")
+    return file_id, seq, offset, data, version & FRAME_COMPRESSED
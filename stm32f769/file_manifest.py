@@ -0,0 +1,106 @@
+# file_manifest.py Per-file manifests for incremental file sync
+# Used by mqtt_file_sender.py and file_async_receiver.py.
+
+# The sender keeps {name: {"Size", "Mtime", "Hash", "Blocks"}} for every
+# file the receiver confirmed, where Hash is the base64 SHA256 of the whole
+# file and Blocks holds a short hash of each MANIFEST_BLOCK bytes. A file
+# with the same size and mtime is skipped, otherwise only the blocks whose
+# hash changed are sent. The receiver keeps {name: {"Size", "Hash"}} of its
+# copies, so a delta is only applied to the copy it was computed against.
+
+# A manifest file holds one [name, entry] JSON line per file, so it is read
+# and written a line at a time rather than as one string, and a changed
+# entry is appended instead of rewriting the file. The last line of a name
+# wins, an entry of null drops it. save() writes it compacted.
+
+import os
+import ujson
+import uhashlib
+import ubinascii
+
+MANIFEST_BLOCK = 4096
+
+
+def load(path):
+    manifest = {}
+    try:
+        with open(path, "r") as f:
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    item = ujson.loads(line)
+                except ValueError:  # Cut short by a reset
+                    continue
+                if isinstance(item, dict):  # Manifests from before the lines
+                    manifest.update(item)
+                elif item[1] is None:
+                    manifest.pop(item[0], None)
+                else:
+                    manifest[item[0]] = item[1]
+    except OSError:
+        pass
+    return manifest
+
+
+def save(path, manifest):
+    # Write a new file and rename it, a reset never leaves half a manifest
+    with open(path + ".tmp", "w") as f:
+        for item in manifest.items():
+            f.write(ujson.dumps(item))
+            f.write("\n")
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    os.rename(path + ".tmp", path)
+
+
+# Records the entry of one file, None if it was dropped.
+def append(path, name, entry):
+    with open(path, "a") as f:
+        f.write(ujson.dumps([name, entry]))
+        f.write("\n")
+
+
+def _b64(digest):
+    return ubinascii.b2a_base64(digest)[:-1].decode()
+
+
+# Reads the file once and returns (block hashes, base64 SHA256 of the file).
+# Every block is also fed to integrity, a file_integrity hash, when given.
+def hash_blocks(file_name, buf=None, integrity=None):
+    if buf is None:
+        buf = bytearray(MANIFEST_BLOCK)
+    mv = memoryview(buf)
+    blocks = []
+    file_hash = uhashlib.sha256()
+    with open(file_name, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            file_hash.update(mv[:n])
+            if integrity is not None:
+                integrity.update(mv[:n])
+            block_hash = uhashlib.sha256()
+            block_hash.update(mv[:n])
+            blocks.append(ubinascii.hexlify(block_hash.digest()[:8]).decode())
+    return blocks, _b64(file_hash.digest())
+
+
+# Returns [(offset, length)] of the byte ranges to send so a copy matching
+# old_blocks ends up as the file described by new_blocks and size.
+def changed_ranges(old_blocks, new_blocks, size):
+    ranges = []
+    for i in range(len(new_blocks)):
+        if i < len(old_blocks) and old_blocks[i] == new_blocks[i]:
+            continue
+        offset = i * MANIFEST_BLOCK
+        length = min(MANIFEST_BLOCK, size - offset)
+        if ranges and ranges[-1][0] + ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+        else:
+            ranges.append((offset, length))
+    return ranges
@@ -9,6 +9,7 @@ import ujson
 import framebuf
 import os
 import uhashlib
+import file_compress
 from mqtt_as import MQTTClient, MQTTException, config
 import network
 import uasyncio as asyncio
@@ -24,6 +25,10 @@ class MQTTFileServerAsync:
     topic_file_delete_rsp = b'file_delete_rsp'
     test_topic=b'filetest'
     topic_file_pub = b'file_recv_ack'
+    # Pull mode: a backup request with "Credit": n lets n blocks go out, the
+    # receiver grants more with {"Credit": n} on this topic as it writes them.
+    # Without it blocks are pushed as fast as the broker takes them.
+    topic_file_credit = b'file_credit'
 
     qos=1
     data_block_size=2000
@@ -33,12 +38,16 @@ class MQTTFileServerAsync:
     file_busy = False
     backup_in_progress = False
     file_block_sequence_nr = 0
+    compression = None
+    credit = None
+    credit_timeout = 30
     SERVER = '192.168.10.125'    
     
     def __init__(self, address=SERVER, port=80):
         self.mqtt_server = address
         self.port = port
         self.address = address
+        self.credit_event = asyncio.Event()
     
     def sub_cb(self, topic, msg, retained):
         print("topic received... " + str(topic))
@@ -47,6 +56,14 @@ class MQTTFileServerAsync:
         if (self.client_ready == False):
             return
         
+        if (topic == self.topic_file_credit):
+            # Grants arrive while a backup is in progress
+            try:
+                self.grant_credit(ujson.loads(msg)["Credit"])
+            except (ValueError, KeyError):
+                print("credit parsing error")
+            return
+        
         if (self.backup_in_progress == True):
             return
         
@@ -90,16 +107,34 @@ class MQTTFileServerAsync:
 
             print("files_topic...message parsed%s" % parsed)                
             operation = parsed["Operation"]        
+            
+            if ((operation == 'backup_all' or operation == 'backup_single') and self.file_busy == True):
+                # The credit and compression belong to the running backup
+                print("backup already running, request ignored...")
+                return
+                
+            # The requester names the compression it can undo, if any
+            self.compression = parsed.get("Compression")
+            
+            if (self.compression not in file_compress.COMPRESS):
+                self.compression = None
+                
+            if (operation == 'backup_all' or operation == 'backup_single'):
+                # The first grant of a pull mode backup, None pushes
+                self.credit = parsed.get("Credit")
+                
             if (operation == 'backup_all'):
                 print("backup all files...")
-                self.backup_all_files()
+                self.backup_in_progress = True
+                asyncio.create_task(self.backup_all_files())
                 
             if (operation == 'backup_single'):
                 print("backup single file...")                        
                 try:
                     filename = parsed["FileName"]
-                    backup_file(filename)
-                except (ValueError, TypeError):
+                    self.backup_in_progress = True
+                    asyncio.create_task(self.backup_single_file(filename))
+                except (KeyError, TypeError):
                     print("json parsing error")
 
             if (operation == 'file_create'):
@@ -143,86 +178,98 @@ class MQTTFileServerAsync:
         print(data_out)
         self.client.publish(self.topic_files, data_out, qos)
 
-    def backup_file(self, filename):
-        
+    def grant_credit(self, blocks):
+        if (self.credit == None):
+            self.credit = 0
+            
+        self.credit += blocks
+        self.credit_event.set()
+
+    async def take_credit(self):
+        # Push mode always goes on, pull mode waits for the receiver to grant
+        # another block. False if it has not for credit_timeout seconds.
+        if (self.credit == None):
+            return True
+            
+        while (self.credit <= 0):
+            self.credit_event.clear()
+            
+            try:
+                await asyncio.wait_for(self.credit_event.wait(), self.credit_timeout)
+            except asyncio.TimeoutError:
+                return False
+                
+        self.credit -= 1
+        return True
+
+    async def backup_file(self, filename):
+        # Returns False if the backup was stopped
         if (self.file_busy == True):
             print("still busy...%s" % filename)        
-            return;
+            return False
         
         print("Received single file backup...%s" % filename)        
            
-        if file_exist(filename):
-            fo = open(filename, "rb")
-            file_busy = True;
-            self.send_header(filename)                    
+        if (self.file_exist(filename) == False):
+            print("file %s not found" % filename)
+            return True
+            
+        fo = open(filename, "rb")
+        self.file_busy = True
+        
+        try:
+            await self.send_header(filename)                    
             print("file opened...%s" % filename)
-            self.run_flag = True
             self.out_hash_md5 = uhashlib.sha256()
             self.file_block_sequence_nr = 1
             
-            while self.run_flag:
-                file_block = fo.read(data_block_size)
+            while True:
+                file_block = fo.read(self.data_block_size)
                 
-                if file_block:
-                    self.send_file_block(filename, file_block, file_block_sequence_nr)
-                    self.file_block_sequence_nr += 1
-                else:
-                    self.send_end(filename)
-                    self.run_flag=False
-                    fo.close()
-                    self.file_busy = False;              
-        else:
-            print("file %s not found" % filename)
+                if not file_block:
+                    await self.send_end(filename)
+                    return True
+                    
+                if (await self.take_credit() == False):
+                    print("no credit granted, backup stopped...%s" % filename)
+                    await self.send_abort(filename, "No credit")
+                    return False
+                    
+                await self.send_file_block(filename, file_block, self.file_block_sequence_nr)
+                self.file_block_sequence_nr += 1
+        finally:
+            fo.close()
+            self.file_busy = False
 
-    def backup_all_files(self):
-        global run_flag
-        global out_hash_md5
-        global file_busy
-        global backup_in_progress
-        global file_block_sequence_nr
-        print("Received all files backup...")        
-        filenames = []
-        backup_in_progress = True
+    async def backup_single_file(self, filename):
+        # backup_in_progress is set by sub_cb before the task starts
+        try:
+            await self.backup_file(filename)
+        finally:
+            self.backup_in_progress = False
 
-        for filename in os.listdir():
-            filenames.append(filename)        
+    async def backup_all_files(self):
+        print("Received all files backup...")        
 
-        for i in range(0, len(filenames)):
-            filename = filenames[i]
-            
-            if file_exist(filename):
-                fo = open(filename, "rb")
-                file_busy = True;
-                send_header(filename)                    
-                print("file opened...%s" % filename)
-                run_flag = True
-                out_hash_md5 = uhashlib.sha256()
-                file_block_sequence_nr = 1
-                
-                while run_flag:
-                    file_block = fo.read(data_block_size)
-                    
-                    if file_block:
-                        send_file_block(filename, file_block, file_block_sequence_nr)
-                        file_block_sequence_nr += 1                    
-                    else:
-                        send_end(filename)
-                        run_flag = False
-                        fo.close()
-                        file_busy = False;              
-            else:
-                print("file %s not found" % filename)
-                
-            backup_in_progress = False            
+        try:
+            for entry in os.ilistdir():
+                if (entry[1] == 0x8000 and await self.backup_file(entry[0]) == False):
+                    break
+        finally:
+            self.backup_in_progress = False
     
-    def send_header(self, filename):
+    async def send_header(self, filename):
         print("Preparing header...")    
         file_data = {"FileName":filename}
+        
+        if (self.compression != None):
+            file_data["Compression"] = self.compression
+            
         file_data_json = ujson.dumps(file_data)
         header = "header"+",," + file_data_json + ",,"
         header = bytearray(header,"utf-8")
         print(header)
-        self.client.publish(self.topic_files, header, qos)
+        await self.client.publish(self.topic_files, header, qos = self.qos)
         print("Header published...")    
 
     def send_file_block_test(self, file_name, file_content):
@@ -238,22 +285,35 @@ class MQTTFileServerAsync:
         print(data_out)
         self.client.publish(self.topic_files, data_out, qos)
 
-    def send_file_block(self, file_name, file_content, file_block_sequence_nr):
+    async def send_file_block(self, file_name, file_content, file_block_sequence_nr):
         self.out_hash_md5.update(file_content)    
+        compressed = None
+        
+        if (self.compression != None):
+            compressed = file_compress.compress(self.compression, file_content)
+            
+            if (len(compressed) < len(file_content)):
+                file_content = compressed
+            else:
+                compressed = None
+                
         base64_data = ubinascii.b2a_base64(file_content)
         file_content_msg = {
                         "FileName":file_name,        
                         "FileData":base64_data,
                         "FileBlockSequenceNumber": file_block_sequence_nr
                      }
+        
+        if (compressed != None):
+            file_content_msg["Compression"] = self.compression
         file_content_msg_json = ujson.dumps(file_content_msg)
         data_out = "file_content"+",," + file_content_msg_json + ",,"
         data_out = bytearray(data_out,"utf-8")
         print(data_out)
-        self.client.publish(self.topic_files, data_out, qos)
+        await self.client.publish(self.topic_files, data_out, qos = self.qos)
 
-    def send_end(self, filename):
-        base64_hash_data = ubinascii.b2a_base64(out_hash_md5.digest())[:-1]    
+    async def send_end(self, filename):
+        base64_hash_data = ubinascii.b2a_base64(self.out_hash_md5.digest())[:-1]    
         hash_data = {
                         "FileName":filename,
                         "HashData":base64_hash_data
@@ -264,7 +324,19 @@ class MQTTFileServerAsync:
         end = "eof" + ",," + hash_data_json + ",,"
         end=bytearray(end,"utf-8")
         print(end)
-        self.client.publish(self.topic_files, end, qos)
+        await self.client.publish(self.topic_files, end, qos = self.qos)
+
+    async def send_abort(self, filename, reason):
+        # Tells the receiver to drop what it has of the file, no eof follows
+        abort_data = {
+                        "FileName":filename,
+                        "Reason":reason
+                    }
+        abort_data_json = ujson.dumps(abort_data)
+        abort = "abort" + ",," + abort_data_json + ",,"
+        abort = bytearray(abort,"utf-8")
+        print(abort)
+        await self.client.publish(self.topic_files, abort, qos = self.qos)
 
     def send_test_file_data(self, filedata):
         print("clearing hash lib...")
@@ -295,6 +367,8 @@ class MQTTFileServerAsync:
         print('Connected to %s MQTT broker...' % self.mqtt_server)        
         await client.subscribe(self.topic_files, 1)
         print('Subscribed to %s topic...' % self.topic_files)                
+        await client.subscribe(self.topic_file_credit, 1)
+        print('Subscribed to %s topic...' % self.topic_file_credit)                
 
     def restart_and_reconnect(self):
       print('Failed to connect to MQTT broker. Reconnecting...')
@@ -334,4 +408,7 @@ class MQTTFileServerAsync:
                 msg = b'Hello from stm32f769'
                 self.last_message = time.time()
           except OSError as e:
-            self.restart_and_reconnect()   
\ No newline at end of file
+            self.restart_and_reconnect()
+            
+          # Lets mqtt_as, sub_cb and the backup tasks run
+          await asyncio.sleep(1)   
\ No newline at end of file
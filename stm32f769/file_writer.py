@@ -0,0 +1,58 @@
+# file_writer.py Coalesced, sector aligned writes of received file blocks
+# Used by file_async_receiver.py.
+
+# Blocks arrive in whatever size the sender picked, often a few hundred
+# bytes. Written as they come, FAT on /sd turns most of them into a
+# read-modify-write of a partly written sector. BufferedWriter collects them
+# in one preallocated buffer and writes whole sectors only, so only a seek
+# or the final flush writes a partial one.
+
+import os
+
+SECTOR_SIZE = 512
+
+
+class BufferedWriter:
+    def __init__(self, fout, size=8192, offset=0):
+        self.fout = fout
+        self.buf = bytearray(size - size % SECTOR_SIZE)
+        self.mv = memoryview(self.buf)
+        self.length = 0
+        self.offset = offset  # File offset of buf[0]
+
+    def write(self, data):
+        data = memoryview(data)
+        n = len(data)
+        i = 0
+        while i < n:
+            k = min(n - i, len(self.buf) - self.length)
+            self.mv[self.length : self.length + k] = data[i : i + k]
+            self.length += k
+            i += k
+            if self.length == len(self.buf):
+                self.flush(False)
+
+    # Writes up to the last sector boundary, the rest stays buffered.
+    # sync writes everything and flushes the file.
+    def flush(self, sync=True):
+        length = self.length
+        if not sync:
+            length -= (self.offset + length) % SECTOR_SIZE
+        if length > 0:
+            self.fout.write(self.mv[:length])
+            self.length -= length
+            self.offset += length
+            self.mv[: self.length] = self.mv[length : length + self.length]
+        if sync:
+            self.fout.flush()
+
+    def seek(self, offset):
+        self.flush()
+        self.fout.seek(offset)
+        self.offset = offset
+
+    def close(self):
+        self.flush()
+        self.fout.close()
+        if hasattr(os, "sync"):
+            os.sync()
@@ -20,6 +20,7 @@ import asyncio
 
 gc.collect()
 from time import ticks_ms, ticks_diff
+from random import getrandbits
 from errno import EINPROGRESS, ETIMEDOUT
 
 gc.collect()
@@ -35,6 +36,9 @@ VERSION = (0, 8, 3)
 # Default initial size for input messge buffer. Increase this if large messages
 # are expected, but rarely, to avoid big runtime allocations
 IBUFSIZE = 50
+# Initial size of the buffer holding a publish header: fixed header, topic,
+# PID and properties. Grown if a longer topic is published.
+OBUFSIZE = 64
 # By default the callback interface returns and incoming message as bytes.
 # For performance reasons with large messages it may return a memoryview.
 MSG_BYTES = True
@@ -88,6 +92,67 @@ class MsgQueue:
         return r
 
 
+# Copies incoming topics and messages into one preallocated byte ring instead
+# of allocating bytes objects, and yields memoryviews into it. These are only
+# valid until the ring wraps round: copy anything kept across an await.
+class RingMsgQueue(MsgQueue):
+    def __init__(self, size, nbytes, props=False):
+        super().__init__(size)
+        self._buf = bytearray(nbytes)
+        self._mv = memoryview(self._buf)
+        self._bw = 0  # Next free byte
+        self._props = props
+        # [offset, topic length, message length, retained, properties]
+        self._slots = [[0, 0, 0, False, None] for _ in range(max(size, 4))]
+
+    def _overlaps(self, start, end):
+        i = self._ri
+        while i != self._wi:
+            s = self._slots[i]
+            if s[0] < end and start < s[0] + s[1] + s[2]:
+                return True
+            i = (i + 1) % self._size
+        return False
+
+    def put(self, topic, msg, retained, props=None):
+        tl = len(topic)
+        n = tl + len(msg)
+        if n > len(self._buf):
+            self.discards += 1
+            return
+        bw = self._bw
+        if bw + n > len(self._buf):
+            bw = 0
+        while self._ri != self._wi and self._overlaps(bw, bw + n):
+            self._ri = (self._ri + 1) % self._size  # Discard oldest unread
+            self.discards += 1
+        self._mv[bw : bw + tl] = topic
+        self._mv[bw + tl : bw + n] = msg
+        s = self._slots[self._wi]
+        s[0] = bw
+        s[1] = tl
+        s[2] = n - tl
+        s[3] = retained
+        s[4] = props
+        self._bw = bw + n
+        self._evt.set()
+        self._wi = (self._wi + 1) % self._size
+        if self._wi == self._ri:  # Would indicate empty
+            self._ri = (self._ri + 1) % self._size  # Discard a message
+            self.discards += 1
+
+    async def __anext__(self):
+        if self._ri == self._wi:  # Empty
+            self._evt.clear()
+            await self._evt.wait()
+        offs, tl, ml, retained, props = self._slots[self._ri]
+        self._ri = (self._ri + 1) % self._size
+        mv = self._mv
+        if self._props:
+            return mv[offs : offs + tl], mv[offs + tl : offs + tl + ml], retained, props
+        return mv[offs : offs + tl], mv[offs + tl : offs + tl + ml], retained
+
+
 config = {
     "client_id": hexlify(unique_id()),
     "server": None,
@@ -102,6 +167,11 @@ config = {
     "clean_init": True,
     "clean": True,
     "max_repubs": 4,
+    "max_inflight": 8,  # QoS 1 publishes awaiting PUBACK at any one time
+    "reconnect_min_ms": 500,  # Reconnect backoff: first delay, doubled per failure
+    "reconnect_max_ms": 30000,  # up to this, each delay +/- 25% jitter
+    "quick_reconnect": True,  # Skip the Wi-Fi stability check on reconnect
+    "recovery_cb": None,  # Called with (outage ms, attempts, session resumed)
     "will": None,
     "subs_cb": lambda *_: None,
     "wifi_coro": eliza,
@@ -109,6 +179,7 @@ config = {
     "ssid": None,
     "wifi_pw": None,
     "queue_len": 0,
+    "queue_bytes": 0,  # With queue_len: size of a RingMsgQueue, 0 for a MsgQueue
     "gateway": False,
     "mqttv5": False,
     "mqttv5_con_props": None,
@@ -135,10 +206,26 @@ def qos_check(qos):
 # offs: start offset. x the value. Returns the end offset.
 # 1-4 bytes allowed, encoding up to 268,435,455 (V3.1.1 table 2.4). No point trapping this.
 def vbi(buf: bytearray, offs: int, x: int):
-    buf[offs] = x & 0x7F
-    if x := x >> 7:
+    while True:
+        buf[offs] = x & 0x7F
+        x >>= 7
+        if not x:
+            return offs + 1
         buf[offs] |= 0x80
-    return vbi(buf, offs + 1, x) if x else (offs + 1)
+        offs += 1
+
+
+# Decode a Variable Byte Integer held in a buffer. Returns (value, end offset).
+def vbi_decode(buf, offs: int):
+    n = 0
+    sh = 0
+    while True:
+        b = buf[offs]
+        offs += 1
+        n |= (b & 0x7F) << sh
+        if not b & 0x80:
+            return n, offs
+        sh += 7
 
 
 encode_properties = None
@@ -160,8 +247,11 @@ class MQTT_base:
             raise ValueError("invalid keepalive time")
         self._response_time = config["response_time"] * 1000  # Repub if no PUBACK received (ms).
         self._max_repubs = config["max_repubs"]
+        self._max_inflight = config.get("max_inflight", 8)
         self._clean_init = config["clean_init"]  # clean_session state on first connection
         self._clean = config["clean"]  # clean_session state on reconnect
+        self._session_present = False  # From the last CONNACK
+        self._session = 0  # Incremented whenever broker session state is lost
         will = config["will"]
         if will is None:
             self._lw_topic = False
@@ -176,7 +266,10 @@ class MQTT_base:
         if self._events:
             self.up = asyncio.Event()
             self.down = asyncio.Event()
-            self.queue = MsgQueue(config["queue_len"])
+            if config.get("queue_bytes", 0) > 0:
+                self.queue = RingMsgQueue(config["queue_len"], config["queue_bytes"], config.get("mqttv5"))
+            else:
+                self.queue = MsgQueue(config["queue_len"])
             self._cb = self.queue.put
         else:  # Callbacks
             self._cb = config["subs_cb"]
@@ -205,19 +298,29 @@ class MQTT_base:
             self._espnow.active(True)
 
         self.newpid = pid_gen()
-        self.rcv_pids = set()  # PUBACK and SUBACK pids awaiting ACK response
+        self.rcv_pids = {}  # PUBACK and SUBACK pids awaiting ACK response: pid -> Event
+        self._window = asyncio.Event()  # Set when a pid is released
         self.last_rx = ticks_ms()  # Time of last communication from broker
         self.lock = asyncio.Lock()
         self._ibuf = bytearray(IBUFSIZE)
         self._mvbuf = memoryview(self._ibuf)
+        self._zero_copy = self._events and isinstance(self.queue, RingMsgQueue)
+        # Publish header scratch buffer, only used with .lock held
+        self._obuf = bytearray(OBUFSIZE)
+        self._mvobuf = memoryview(self._obuf)
+        self._last_topic = None
+        self._topic_bytes = b""
+        self._puback = bytearray(b"\x40\x02\0\0")
 
         self.mqttv5 = config.get("mqttv5")
         self.mqttv5_con_props = config.get("mqttv5_con_props")
         self.topic_alias_maximum = 0
+        self._topic_aliases = {}  # topic bytes -> alias for this connection
+        self._alias_props = {}  # alias -> {0x23: alias}, for publishes without properties
 
         if self.mqttv5:
             global encode_properties, decode_properties
-            from .mqtt_v5_properties import encode_properties, decode_properties  # noqa
+            from mqtt_v5_properties import encode_properties, decode_properties  # noqa
 
     def _set_last_will(self, topic, msg, retain=False, qos=0):
         qos_check(qos)
@@ -371,9 +474,10 @@ class MQTT_base:
         # Only read the first 2 bytes, as properties have their own length
         connack_resp = await self._as_read(2)
 
-        # Connect ack flags
-        if connack_resp[0] != 0:
+        # Connect ack flags: only Session Present may be set
+        if connack_resp[0] & 0xFE:
             raise OSError(-1, "CONNACK flags not 0")
+        self._session_present = bool(connack_resp[0] & 1)
         # Reason code
         if connack_resp[1] != 0:
             # On MQTTv5 Reason codes below 128 may need to be handled
@@ -386,6 +490,7 @@ class MQTT_base:
             # If we are not on MQTTv5 we can stop here
             return
 
+        self.topic_alias_maximum = 0
         connack_props_length, _ = await self._recv_len()
         if connack_props_length > 0:
             connack_props = await self._as_read(connack_props_length)
@@ -465,42 +570,93 @@ class MQTT_base:
 
     async def _await_pid(self, pid):
         t = ticks_ms()
+        ev = self.rcv_pids.get(pid)
         while pid in self.rcv_pids:  # local copy
             if self._timeout(t) or not self.isconnected():
                 break  # Must repub or bail out
-            await asyncio.sleep_ms(100)
+            try:  # Woken by kill_pid, timeout only to re-check the link
+                await asyncio.wait_for_ms(ev.wait(), 100)
+            except asyncio.TimeoutError:
+                pass
         else:
             return True  # PID received. All done.
         return False
 
-    # qos == 1: coro blocks until wait_msg gets correct PID.
-    # If WiFi fails completely subclass re-publishes with new PID.
-    async def publish(self, topic, msg, retain, qos, properties=None):
+    def _release_pid(self, pid):
+        ev = self.rcv_pids.pop(pid, None)
+        if ev is not None:
+            ev.set()
+        self._window.set()
+
+    # Waits for a free in-flight slot and returns a new PID, registered for
+    # its PUBACK when qos is 1.
+    async def _new_pid(self, qos):
+        if qos:
+            while len(self.rcv_pids) >= self._max_inflight:
+                self._window.clear()
+                await self._window.wait()
         pid = next(self.newpid)
         if qos:
-            self.rcv_pids.add(pid)
-        async with self.lock:
-            await self._publish(topic, msg, retain, qos, 0, pid, properties)
-        if qos == 0:
-            return
+            self.rcv_pids[pid] = asyncio.Event()
+        return pid
 
-        count = 0
-        while 1:  # Await PUBACK, republish on timeout
-            if await self._await_pid(pid):
-                return
-            # No match
-            if count >= self._max_repubs or not self.isconnected():
-                raise OSError(-1)  # Subclass to re-publish with new PID
+    # qos == 1: coro blocks until wait_msg gets correct PID. Up to max_inflight
+    # publishes from different tasks can await their PUBACKs concurrently, in
+    # any order. A PID lost with the broker session is re-published here with
+    # a new PID, OSError is left for link failures: the subclass reconnects.
+    async def publish(self, topic, msg, retain, qos, properties=None):
+        pid = await self._new_pid(qos)
+        session = self._session
+        try:
             async with self.lock:
-                # Add pid
-                await self._publish(topic, msg, retain, qos, dup=1, pid=pid, properties=properties)
-            count += 1
-            self.REPUB_COUNT += 1
+                await self._publish(topic, msg, retain, qos, 0, pid, properties)
+            if qos == 0:
+                return
+
+            count = 0
+            while 1:  # Await PUBACK, republish on timeout
+                if await self._await_pid(pid):
+                    if self._session == session:
+                        return
+                # No match
+                if self._session != session or (not self._clean and not self.isconnected()):
+                    # Persistent session: once reconnected resend with the
+                    # same PID and DUP set (MQTT 3.1.1 section 4.4)
+                    while not self._isconnected:
+                        await asyncio.sleep_ms(100)
+                    if self._session != session:
+                        # Session not resumed, the broker never saw this PID:
+                        # send it again as a new message on this connection
+                        session = self._session
+                        pid = await self._new_pid(qos)
+                        async with self.lock:
+                            await self._publish(topic, msg, retain, qos, 0, pid, properties)
+                        count = 0
+                        continue
+                    count = 0
+                elif count >= self._max_repubs or not self.isconnected():
+                    raise OSError(-1)  # Subclass to re-publish with new PID
+                async with self.lock:
+                    # Add pid
+                    await self._publish(topic, msg, retain, qos, dup=1, pid=pid, properties=properties)
+                count += 1
+                self.REPUB_COUNT += 1
+        except OSError:
+            self._release_pid(pid)
+            raise
 
+    # Everything up to the payload is encoded into the reused ._obuf and sent
+    # in one write, the payload is then written straight from the caller's
+    # buffer. Caller holds .lock.
     async def _publish(self, topic, msg, retain, qos, dup, pid, properties=None):
-        pkt = bytearray(b"\x30\0\0\0")
-        pkt[0] |= qos << 1 | retain | dup << 3
-        sz = 2 + len(topic) + len(msg)
+        if topic is not self._last_topic:  # Usually the same topic every time
+            self._last_topic = topic
+            self._topic_bytes = topic.encode() if isinstance(topic, str) else topic
+        topic = self._topic_bytes
+        if self.mqttv5 and self.topic_alias_maximum:
+            topic, properties = self._alias(topic, properties)
+        tl = len(topic)
+        sz = 2 + tl + len(msg)
         if qos > 0:
             sz += 2
 
@@ -508,15 +664,50 @@ class MQTT_base:
             properties = encode_properties(properties)
             sz += len(properties)
 
-        await self._as_write(pkt, vbi(pkt, 1, sz))  # Encode size as VBI
-        await self._send_str(topic)
+        hdr = 5 + 2 + tl + 2 + (len(properties) if self.mqttv5 else 0)
+        if hdr > len(self._obuf):
+            self._obuf = bytearray(hdr + 16)
+            self._mvobuf = memoryview(self._obuf)
+        pkt = self._obuf
+        mv = self._mvobuf
+        pkt[0] = 0x30 | qos << 1 | retain | dup << 3
+        offs = vbi(pkt, 1, sz)  # Encode size as VBI
+        struct.pack_into("!H", pkt, offs, tl)
+        offs += 2
+        mv[offs : offs + tl] = topic
+        offs += tl
         if qos > 0:
-            struct.pack_into("!H", pkt, 0, pid)
-            await self._as_write(pkt, 2)
+            struct.pack_into("!H", pkt, offs, pid)
+            offs += 2
         if self.mqttv5:
-            await self._as_write(properties)
+            mv[offs : offs + len(properties)] = properties
+            offs += len(properties)
+        await self._as_write(pkt, offs)
         await self._as_write(msg)
 
+    # MQTT 5 topic alias (spec 3.3.2.3.4). The first publish on a topic sends
+    # the topic with a new alias, later ones only the alias. Aliases last for
+    # one connection and the broker's CONNACK sets how many there can be.
+    def _alias(self, topic, properties):
+        alias = self._topic_aliases.get(topic)
+        if alias is None:
+            if len(self._topic_aliases) >= self.topic_alias_maximum:
+                return topic, properties
+            alias = len(self._topic_aliases) + 1
+            self._topic_aliases[topic] = alias
+            send = topic
+        else:
+            send = b""
+        if properties:
+            properties = dict(properties)
+            properties[0x23] = alias
+        else:
+            properties = self._alias_props.get(alias)
+            if properties is None:
+                properties = {0x23: alias}
+                self._alias_props[alias] = properties
+        return send, properties
+
     async def subscribe(self, topic, qos, properties=None):
         await self._usub(topic, qos, properties)
 
@@ -530,7 +721,7 @@ class MQTT_base:
         pkt = bytearray(7)
         pkt[0] = 0x82 if sub else 0xA2
         pid = next(self.newpid)
-        self.rcv_pids.add(pid)
+        self.rcv_pids[pid] = asyncio.Event()
         # 2 bytes of PID + 2 bytes of topic length + len(topic)
         sz = 2 + 2 + len(topic) + (1 if sub else 0)
         if self.mqttv5:
@@ -540,24 +731,30 @@ class MQTT_base:
         offs = vbi(pkt, 1, sz)  # Store size as variable byte integer
         struct.pack_into("!H", pkt, offs, pid)
 
-        async with self.lock:
-            await self._as_write(pkt, offs + 2)
-            if self.mqttv5:
-                await self._as_write(properties)
-            await self._send_str(topic)
-            if sub:
-                # Only QoS is supported other features such as:
-                # (NL) No Local, (RAP) Retain As Published and Retain Handling.
-                # Are not supported.
-                await self._as_write(qos.to_bytes(1, "little"))
-
-        if not await self._await_pid(pid):
-            raise OSError(-1)
+        try:
+            async with self.lock:
+                await self._as_write(pkt, offs + 2)
+                if self.mqttv5:
+                    await self._as_write(properties)
+                await self._send_str(topic)
+                if sub:
+                    # Only QoS is supported other features such as:
+                    # (NL) No Local, (RAP) Retain As Published and Retain Handling.
+                    # Are not supported.
+                    await self._as_write(qos.to_bytes(1, "little"))
+
+            if not await self._await_pid(pid):
+                raise OSError(-1)
+        except OSError:
+            # A resumed session keeps rcv_pids, a leaked PID would hold a
+            # publish window slot for good
+            self._release_pid(pid)
+            raise
 
     # Remove a pending pid after a successful receive.
     def kill_pid(self, pid, msg):
         if pid in self.rcv_pids:
-            self.rcv_pids.discard(pid)
+            self._release_pid(pid)
         else:
             raise OSError(-1, f"Invalid pid in {msg} packet")
 
@@ -652,33 +849,34 @@ class MQTT_base:
             return
 
         sz, _ = await self._recv_len()
-        topic_len = await self._as_read(2)
-        topic_len = (topic_len[0] << 8) | topic_len[1]
-        topic = await self._as_read(topic_len)
-        topic = bytes(topic)  # Copy before re-using the read buffer
-        sz -= topic_len + 2
+        # Read the rest of the packet in one go: topic and message are then
+        # slices of the input buffer.
+        data = await self._as_read(sz)
+        topic_len = (data[0] << 8) | data[1]
+        offs = 2 + topic_len
+        topic = data[2:offs]
         # MQTT V3.1.1 section 2.3.1 non-normative comment. Get server PID.
         if op & 6:  # This is distinct from client PIDs.
-            pid = await self._as_read(2)
-            pid = pid[0] << 8 | pid[1]
-            sz -= 2
+            pid = data[offs] << 8 | data[offs + 1]
+            offs += 2
 
         decoded_props = None
         if mqttv5:
-            pub_props_sz, pub_props_sz_len = await self._recv_len()
-            sz -= pub_props_sz_len
-            sz -= pub_props_sz
+            pub_props_sz, offs = vbi_decode(data, offs)
             if pub_props_sz > 0:
-                pub_props = await self._as_read(pub_props_sz)
-                decoded_props = decode_properties(pub_props, pub_props_sz)
+                decoded_props = decode_properties(data[offs : offs + pub_props_sz], pub_props_sz)
+            offs += pub_props_sz
 
-        msg = await self._as_read(sz)
-        # In event mode we must copy the message otherwise .queue contents will be wrong:
+        msg = data[offs:]
+        # A RingMsgQueue copies topic and message into its own buffer.
+        # Otherwise in event mode we must copy the message otherwise .queue contents will be wrong:
         # every entry would contain the same message.
         # In callback mode not copying the message is OK so long as the callback is purely
         # synchronous. Overruns can't occur because of the lock.
-        if self._events or MSG_BYTES:
-            msg = bytes(msg)
+        if not self._zero_copy:
+            topic = bytes(topic)
+            if self._events or MSG_BYTES:
+                msg = bytes(msg)
         retained = op & 0x01
         args = [topic, msg, bool(retained)]
         if mqttv5:
@@ -686,7 +884,7 @@ class MQTT_base:
         self._cb(*args)
 
         if op & 6 == 2:  # qos 1
-            pkt = bytearray(b"\x40\x02\0\0")  # Send PUBACK
+            pkt = self._puback  # Send PUBACK
             struct.pack_into("!H", pkt, 2, pid)
             await self._as_write(pkt)
         elif op & 6 == 4:  # qos 2 not supported
@@ -708,6 +906,14 @@ class MQTTClient(MQTT_base):
         self._in_connect = False
         self._has_connected = False  # Define 'Clean Session' value to use.
         self._tasks = []
+        self._subs = {}  # topic -> (qos, properties), renewed if the session is lost
+        self._reconnect_min = config.get("reconnect_min_ms", 500)
+        self._reconnect_max = config.get("reconnect_max_ms", 30000)
+        self._quick_reconnect = config.get("quick_reconnect", True)
+        self._recovery_cb = config.get("recovery_cb")
+        self._down_at = ticks_ms()
+        self.outages = 0
+        self.last_recovery_ms = 0
         if ESP8266:
             import esp
 
@@ -809,7 +1015,16 @@ class MQTTClient(MQTT_base):
             self._close()
             self._in_connect = False  # Caller may run .isconnected()
             raise
-        self.rcv_pids.clear()
+        resumed = not is_clean and self._session_present
+        if not resumed:
+            # Unacknowledged PIDs died with the old session: their publishers
+            # re-publish with new PIDs
+            self._session += 1
+            for ev in self.rcv_pids.values():
+                ev.set()
+            self.rcv_pids.clear()
+        self._topic_aliases.clear()  # Aliases are per connection
+        self._window.set()  # Wake publishers waiting for a free slot
         # If we get here without error broker/LAN must be up.
         self._isconnected = True
         self._in_connect = False  # Low level code can now check connectivity.
@@ -821,6 +1036,8 @@ class MQTTClient(MQTT_base):
             # Runs forever unless user issues .disconnect()
 
         asyncio.create_task(self._handle_msg())  # Task quits on connection fail.
+        if not resumed and self._subs:
+            asyncio.create_task(self._resubscribe())
         self._tasks.append(asyncio.create_task(self._keep_alive()))
         if self.DEBUG:
             self._tasks.append(asyncio.create_task(self._memory()))
@@ -885,6 +1102,8 @@ class MQTTClient(MQTT_base):
     def _reconnect(self):  # Schedule a reconnection if not underway.
         if self._isconnected:
             self._isconnected = False
+            self._down_at = ticks_ms()
+            self.outages += 1
             asyncio.create_task(self._kill_tasks(True))  # Shut down tasks and socket
             if self._events:  # Signal an outage
                 self.down.set()
@@ -898,28 +1117,50 @@ class MQTTClient(MQTT_base):
 
     # Scheduled on 1st successful connection. Runs forever maintaining wifi and
     # broker connection. Must handle conditions at edge of WiFi range.
+    # Reconnect delay: exponential backoff with +/- 25% jitter so that many
+    # clients do not hit the broker at the same moment.
+    def _backoff(self, attempts):
+        delay = min(self._reconnect_min << min(attempts, 16), self._reconnect_max)
+        return delay - delay // 4 + (delay // 2) * getrandbits(8) // 255
+
+    async def _resubscribe(self):
+        for topic, (qos, properties) in list(self._subs.items()):
+            try:
+                await super().subscribe(topic, qos, properties)
+            except OSError:
+                return  # Connection lost again, the next connect retries
+
     async def _keep_connected(self):
+        attempts = 0
         while self._has_connected:
             if self.isconnected():  # Pause for 1 second
+                attempts = 0
                 await asyncio.sleep(1)
                 gc.collect()
             else:  # Link is down, socket is closed, tasks are killed
-                try:
-                    self._sta_if.disconnect()
-                except OSError:
-                    self.dprint("Wi-Fi not started, unable to disconnect interface")
-                await asyncio.sleep(1)
-                try:
-                    await self.wifi_connect()
-                except OSError:
-                    continue
+                await asyncio.sleep_ms(self._backoff(attempts))
+                attempts += 1
+                # Quick path: if only the broker connection dropped the
+                # interface is still associated, so go straight to the broker
+                if not self._sta_if.isconnected():
+                    try:
+                        self._sta_if.disconnect()
+                    except OSError:
+                        self.dprint("Wi-Fi not started, unable to disconnect interface")
+                    try:
+                        await self.wifi_connect(self._quick_reconnect)
+                    except OSError:
+                        continue
                 if not self._has_connected:  # User has issued the terminal .disconnect()
                     self.dprint("Disconnected, exiting _keep_connected")
                     break
                 try:
                     await self.connect()
                     # Now has set ._isconnected and scheduled _connect_handler().
-                    self.dprint("Reconnect OK!")
+                    self.last_recovery_ms = ticks_diff(ticks_ms(), self._down_at)
+                    self.dprint("Reconnect OK! %dms", self.last_recovery_ms)
+                    if self._recovery_cb is not None:
+                        self._recovery_cb(self.last_recovery_ms, attempts, self._session_present)
                 except OSError as e:
                     self.dprint("Error in reconnect. %s", e)
                     # Can get ECONNABORTED or -1. The latter signifies no or bad CONNACK received.
@@ -933,7 +1174,9 @@ class MQTTClient(MQTT_base):
         while 1:
             await self._connection()
             try:
-                return await super().subscribe(topic, qos, properties)
+                await super().subscribe(topic, qos, properties)
+                self._subs[topic] = (qos, properties)
+                return
             except OSError:
                 pass
             self._reconnect()  # Broker or WiFi fail.
@@ -942,7 +1185,9 @@ class MQTTClient(MQTT_base):
         while 1:
             await self._connection()
             try:
-                return await super().unsubscribe(topic, properties)
+                await super().unsubscribe(topic, properties)
+                self._subs.pop(topic, None)
+                return
             except OSError:
                 pass
             self._reconnect()  # Broker or WiFi fail.
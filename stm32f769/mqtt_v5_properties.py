@@ -0,0 +1,139 @@
+# mqtt_v5_properties.py Encode and decode MQTT 5 properties (spec section 2.2.2)
+# Used by mqtt_as_latest.py when config["mqttv5"] is set.
+
+# Properties are passed around as a dict keyed by property identifier, e.g.
+# {0x23: 1} for topic alias 1. User properties (0x26) are a dict of str -> str.
+
+import struct
+
+BYTE = 0
+TWO_BYTE_INT = 1
+FOUR_BYTE_INT = 2
+VBI = 3
+UTF8 = 4
+BINARY = 5
+STRING_PAIR = 6
+
+PROPERTY_TYPES = {
+    0x01: BYTE,  # Payload Format Indicator
+    0x02: FOUR_BYTE_INT,  # Message Expiry Interval
+    0x03: UTF8,  # Content Type
+    0x08: UTF8,  # Response Topic
+    0x09: BINARY,  # Correlation Data
+    0x0B: VBI,  # Subscription Identifier
+    0x11: FOUR_BYTE_INT,  # Session Expiry Interval
+    0x12: UTF8,  # Assigned Client Identifier
+    0x13: TWO_BYTE_INT,  # Server Keep Alive
+    0x15: UTF8,  # Authentication Method
+    0x16: BINARY,  # Authentication Data
+    0x17: BYTE,  # Request Problem Information
+    0x18: FOUR_BYTE_INT,  # Will Delay Interval
+    0x19: BYTE,  # Request Response Information
+    0x1A: UTF8,  # Response Information
+    0x1C: UTF8,  # Server Reference
+    0x1F: UTF8,  # Reason String
+    0x21: TWO_BYTE_INT,  # Receive Maximum
+    0x22: TWO_BYTE_INT,  # Topic Alias Maximum
+    0x23: TWO_BYTE_INT,  # Topic Alias
+    0x24: BYTE,  # Maximum QoS
+    0x25: BYTE,  # Retain Available
+    0x26: STRING_PAIR,  # User Property
+    0x27: FOUR_BYTE_INT,  # Maximum Packet Size
+    0x28: BYTE,  # Wildcard Subscription Available
+    0x29: BYTE,  # Subscription Identifier Available
+    0x2A: BYTE,  # Shared Subscription Available
+}
+
+
+def _vbi(x):
+    out = bytearray()
+    while True:
+        b = x & 0x7F
+        x >>= 7
+        if x:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return out
+
+
+def _str(s):
+    if isinstance(s, str):
+        s = s.encode()
+    return struct.pack("!H", len(s)) + s
+
+
+# Returns the properties preceded by their length as a VBI. No properties
+# encode as a single zero byte.
+def encode_properties(properties):
+    if not properties:
+        return b"\0"
+    out = bytearray()
+    for pid, value in properties.items():
+        ptype = PROPERTY_TYPES[pid]
+        if ptype == STRING_PAIR:
+            for k, v in value.items():
+                out.append(pid)
+                out += _str(k)
+                out += _str(v)
+            continue
+        out.append(pid)
+        if ptype == BYTE:
+            out.append(value)
+        elif ptype == TWO_BYTE_INT:
+            out += struct.pack("!H", value)
+        elif ptype == FOUR_BYTE_INT:
+            out += struct.pack("!I", value)
+        elif ptype == VBI:
+            out += _vbi(value)
+        else:  # UTF8 and BINARY share the length prefixed encoding
+            out += _str(value)
+    return bytes(_vbi(len(out)) + out)
+
+
+# props holds properties_length bytes, the length prefix already removed.
+def decode_properties(props, properties_length):
+    decoded = {}
+    i = 0
+    while i < properties_length:
+        pid = props[i]
+        i += 1
+        ptype = PROPERTY_TYPES.get(pid)
+        if ptype is None:
+            raise OSError(-1, "Unknown property 0x%x" % pid)
+        if ptype == BYTE:
+            value = props[i]
+            i += 1
+        elif ptype == TWO_BYTE_INT:
+            value = props[i] << 8 | props[i + 1]
+            i += 2
+        elif ptype == FOUR_BYTE_INT:
+            value = props[i] << 24 | props[i + 1] << 16 | props[i + 2] << 8 | props[i + 3]
+            i += 4
+        elif ptype == VBI:
+            value = 0
+            sh = 0
+            while True:
+                b = props[i]
+                i += 1
+                value |= (b & 0x7F) << sh
+                if not b & 0x80:
+                    break
+                sh += 7
+        elif ptype == STRING_PAIR:
+            n = props[i] << 8 | props[i + 1]
+            k = bytes(props[i + 2 : i + 2 + n]).decode()
+            i += 2 + n
+            n = props[i] << 8 | props[i + 1]
+            v = bytes(props[i + 2 : i + 2 + n]).decode()
+            i += 2 + n
+            decoded.setdefault(pid, {})[k] = v
+            continue
+        else:
+            n = props[i] << 8 | props[i + 1]
+            value = bytes(props[i + 2 : i + 2 + n])
+            if ptype == UTF8:
+                value = value.decode()
+            i += 2 + n
+        decoded[pid] = value
+    return decoded
@@ -5,8 +5,7 @@ import time
 import sys
 import uasyncio as asyncio
 import gc
-from nanoweb import HttpError, Nanoweb, send_file
-from ubinascii import a2b_base64 as base64_decode
+from nanoweb import HttpError, Nanoweb, send_file, send_file_range, parse_range
 import uhashlib
 import ubinascii
 import machine
@@ -49,12 +48,28 @@ else:
     from MeterReadingDaoBTCustomDiskCache import MeterReadingDaoBT
 
 from MqttConnectionPool import MqttConnectionPool
+from BatchPublisher import BatchPublisher
+from PublishSpool import PublishSpool
+from CommandProcessor import CommandProcessor
+from ResponseCache import ResponseCache
+from ChangeFeed import ChangeFeed
+from BasicAuth import BasicAuth
 import pyb
 
 _treeDepth = 5
-CREDENTIALS = ('foo', 'bar')
+CREDENTIALS = {'foo': 'bar'}
 EXAMPLE_ASSETS_DIR = './example-assets/'
 MQTT_BROKERS = ['192.168.10.124', '192.168.10.135']
+MQTT_QUEUE_SIZE = 64
+MQTT_BATCH_EVENTS = 16
+MQTT_BATCH_DELAY_MS = 50
+MQTT_V5 = True
+MQTT_COMPACT_EVENTS = True
+MQTT_SPOOL_SEGMENTS = 16
+MQTT_REPLAY_RATE = 0  # Messages/s, 0 replays as fast as the brokers take them
+MQTT_COMMAND_TOPIC = '/entities/cmd'
+MQTT_RESULT_TOPIC = '/entities/cmd/result'
+MQTT_COMMAND_WORKERS = 2
 #MQTT_BROKERS = ['192.168.10.174']
 sdDir = "/sd"
 rbDir = "/rb"
@@ -62,6 +77,9 @@ rbDir = "/rb"
 toDoController = None
 assetController = None
 meterController = None
+mqttConnectionPool = None
+batchPublisher = None
+commandProcessor = None
 dbName = None
 toDoDao = None
 assetDao = None
@@ -70,6 +88,12 @@ _error_q = {}
 _success_q = {}
 _in_hash_md5 = uhashlib.sha256()
 fout = None
+responseCache = ResponseCache()
+changeFeed = ChangeFeed()
+basicAuth = BasicAuth(CREDENTIALS)
+CHANGE_FEED_KEEPALIVE_MS = 15000
+CHANGE_FEED_MAX_POLL_S = 60
+TRANSFER_SEGMENT = 1024
 
 async def Init(backupDir):
     global toDoController
@@ -78,6 +102,9 @@ async def Init(backupDir):
     global meterReadingController        
     global assetTaskController    
     global dbName
+    global mqttConnectionPool
+    global batchPublisher
+    global commandProcessor
 
     if ((useMem == True) | (useRAMDisk == True) | (useSDDisk == True)):
         if ((useRAMDisk == True) | (useSDDisk == True)):
@@ -115,13 +142,30 @@ async def Init(backupDir):
         meterReadingDao = MeterReadingDaoBT(_treeDepth, backupDir)                        
         
     topics = ['/entities']
-    mqttConnectionPool = MqttConnectionPool(MQTT_BROKERS)
+    spool = None
+
+    # Only spool to disk when there is one mounted
+    if (useMem == False):
+        spool = PublishSpool(backupDir + '/mqtt_spool', maxSegments = MQTT_SPOOL_SEGMENTS)
+
+    mqttConnectionPool = MqttConnectionPool(MQTT_BROKERS, changeFeed, queueSize = MQTT_QUEUE_SIZE, mqttv5 = MQTT_V5,
+                                            spool = spool, replayRate = MQTT_REPLAY_RATE)
     await mqttConnectionPool.Initialise()
-    toDoController = ToDoController(mqttConnectionPool, toDoDao, topics)
-    assetTaskController = AssetTaskController(mqttConnectionPool, assetTaskDao, topics)        
-    assetController = AssetController(mqttConnectionPool, assetDao, topics, assetTaskController)
-    meterReadingController = MeterReadingController(mqttConnectionPool, meterReadingDao, topics)            
-    meterController = MeterController(mqttConnectionPool, meterDao, topics, meterReadingController)
+    batchPublisher = BatchPublisher(mqttConnectionPool, MQTT_BATCH_EVENTS, MQTT_BATCH_DELAY_MS, MQTT_COMPACT_EVENTS)
+    toDoController = ToDoController(batchPublisher, toDoDao, topics)
+    assetTaskController = AssetTaskController(batchPublisher, assetTaskDao, topics)        
+    assetController = AssetController(batchPublisher, assetDao, topics, assetTaskController)
+    meterReadingController = MeterReadingController(batchPublisher, meterReadingDao, topics)            
+    meterController = MeterController(batchPublisher, meterDao, topics, meterReadingController)
+
+    commandProcessor = CommandProcessor(mqttConnectionPool, {
+                                            "ToDoItem": toDoController,
+                                            "Asset": assetController,
+                                            "AssetTask": assetTaskController,
+                                            "Meter": meterController,
+                                            "MeterReading": meterReadingController
+                                        }, MQTT_RESULT_TOPIC, MQTT_COMMAND_WORKERS)
+    mqttConnectionPool.Subscribe(MQTT_COMMAND_TOPIC, commandProcessor.OnMessage)
 
 async def get_time():
     uptime_s = int(time.ticks_ms() / 1000)
@@ -130,18 +174,63 @@ async def get_time():
     uptime_m = uptime_m % 60
     uptime_s = uptime_s % 60
     freemem = free(True)
-    itemCount = await toDoController.GetItemCount()
-    assetCount = await assetController.GetAssetCount()    
+    itemCount = await get_cached_count('/api/todoitems/count', ("ToDoItem",), toDoController.GetItemCount)
+    assetCount = await get_cached_count('/api/assets/count', ("Asset",), assetController.GetAssetCount)
     return (
         '{}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}'.format(*time.localtime()),
         '{:02d}h {:02d}:{:02d}'.format(uptime_h, uptime_m, uptime_s),
         free(True), itemCount, assetCount)
 
+async def get_cached_count(key, entityTypes, getCount):
+    # Shares the cache entry of the matching /count route, so the status
+    # page only traverses a tree after it has been written to
+    etag = responseCache.ETag(entityTypes)
+    body = responseCache.Get(key, etag)
+
+    if (body == None):
+        body = json.dumps(await getCount())
+        responseCache.Put(key, etag, body)
+
+    return json.loads(body)
+
 async def api_send_response(request, code=200, message="OK"):
     await request.write("HTTP/1.1 %i %s\r\n" % (code, message))
     await request.write("Content-Type: application/json\r\n\r\n")
     await request.write('{"status": true}')
 
+async def api_send_cached(request, entityTypes):
+    """Answer a GET from the response cache if possible
+
+    Returns True when a 304 or a cached body was sent, in which case the
+    handler must not touch the trees at all.
+    """
+    etag = responseCache.ETag(entityTypes)
+
+    if (responseCache.Matches(request.headers.get('If-None-Match'), etag)):
+        await request.write("HTTP/1.1 304 Not Modified\r\n")
+        await request.write("ETag: %s\r\n\r\n" % etag)
+        return True
+
+    body = responseCache.Get(request.url, etag)
+
+    if (body == None):
+        return False
+
+    await api_send_json(request, etag, body)
+    return True
+
+async def api_send_cacheable(request, entityTypes, result):
+    etag = responseCache.ETag(entityTypes)
+    body = json.dumps(result)
+    responseCache.Put(request.url, etag, body)
+    await api_send_json(request, etag, body)
+
+async def api_send_json(request, etag, body):
+    await request.write("HTTP/1.1 200 OK\r\n")
+    await request.write("Content-Type: application/json\r\n")
+    await request.write("ETag: %s\r\n\r\n" % etag)
+    await request.write(body)
+
 def authenticate(credentials):
     async def fail(request):
         await request.write("HTTP/1.1 401 Unauthorized\r\n")
@@ -155,17 +244,11 @@ def authenticate(credentials):
                 print("Auth: no header")
                 return await fail(request)
 
-            # Authorization: Basic XXX
-            kind, authorization = header.strip().split(' ', 1)
-            if kind != "Basic":
-                print("Auth: Non-basic auth")                
-                return await fail(request)
-
-            authorization = base64_decode(authorization.strip()) \
-                .decode('ascii') \
-                .split(':')
+            # Decoded and checked once per distinct header value, repeat
+            # requests are answered from the BasicAuth cache
+            request.principal = credentials.Authenticate(header)
 
-            if list(credentials) != list(authorization):
+            if request.principal is None:
                 print("Auth: Credentials invalid")                                
                 return await fail(request)
 
@@ -173,7 +256,7 @@ def authenticate(credentials):
         return wrapper
     return decorator
 
-@authenticate(credentials=CREDENTIALS)
+@authenticate(credentials=basicAuth)
 async def api_status(request):
     """API status endpoint"""
     await request.write("HTTP/1.1 200 OK\r\n")
@@ -186,6 +269,9 @@ async def api_status(request):
         "freemem": free_mem,
         "item_count": item_count,
         "asset_count": asset_count,        
+        "mqtt": mqttConnectionPool.GetStatus(),
+        "batches": batchPublisher.GetStatus(),
+        "commands": commandProcessor.GetStatus(),
         'python': '{} {} {}'.format(
             sys.implementation.name,
             '.'.join(
@@ -196,8 +282,80 @@ async def api_status(request):
         'platform': str(sys.platform),
     }))
 
+def get_query_param(url, name, default = None):
+    if ('?' not in url):
+        return default
+
+    for pair in url.split('?', 1)[1].split('&'):
+        key, _, value = pair.partition('=')
+
+        if (key == name):
+            return value
+
+    return default
 
-@authenticate(credentials=CREDENTIALS)
+async def write_change_event(request, seq, topic, message, sse):
+    if (sse == True):
+        await request.write("id: %d\nevent: change\ndata: %s\n\n" % (seq, message))
+    else:
+        await request.write('{"seq": %d, "topic": %s, "data": %s}' % (seq, json.dumps(topic), message))
+
+@authenticate(credentials=basicAuth)
+async def api_changes(request):
+    """Change feed: /api/changes?since=<seq>
+
+    Served as Server-Sent Events when the client accepts text/event-stream,
+    otherwise as a long-poll that returns as soon as there is an event after
+    `since` or after `timeout` seconds.
+    """
+    if request.method != "GET":
+        raise HttpError(request, 501, "Not Implemented")
+
+    try:
+        since = int(request.headers.get('Last-Event-ID', get_query_param(request.url, 'since', '0')))
+        timeout = min(int(get_query_param(request.url, 'timeout', '25')), CHANGE_FEED_MAX_POLL_S)
+    except ValueError:
+        raise HttpError(request, 400, "Bad Request")
+
+    if ('text/event-stream' in request.headers.get('Accept', '')):
+        await request.write("HTTP/1.1 200 OK\r\n")
+        await request.write("Content-Type: text/event-stream\r\n")
+        await request.write("Cache-Control: no-cache\r\n\r\n")
+
+        try:
+            while True:
+                events, lost = changeFeed.Since(since)
+
+                if (lost == True):
+                    await request.write("event: resync\ndata: {}\n\n")
+
+                for seq, topic, message in events:
+                    await write_change_event(request, seq, topic, message, True)
+                    since = seq
+
+                if (await changeFeed.Wait(since, CHANGE_FEED_KEEPALIVE_MS) == False):
+                    await request.write(": keepalive\n\n")
+        except OSError:
+            # Client closed the stream
+            return
+
+    await changeFeed.Wait(since, timeout * 1000)
+    events, lost = changeFeed.Since(since)
+
+    await request.write("HTTP/1.1 200 OK\r\n")
+    await request.write("Content-Type: application/json\r\n\r\n")
+    await request.write('{"seq": %d, "lost": %s, "events": [' % (changeFeed.seq, json.dumps(lost)))
+
+    for i in range(len(events)):
+        if (i > 0):
+            await request.write(", ")
+
+        seq, topic, message = events[i]
+        await write_change_event(request, seq, topic, message, False)
+
+    await request.write("]}")
+
+@authenticate(credentials=basicAuth)
 async def api_ls(request):
     await request.write("HTTP/1.1 200 OK\r\n")
     await request.write("Content-Type: application/json\r\n\r\n")
@@ -205,16 +363,38 @@ async def api_ls(request):
         '"' + f + '"' for f in sorted(os.listdir('.'))
     ))
 
-@authenticate(credentials=CREDENTIALS)
+@authenticate(credentials=basicAuth)
 async def api_download(request):
-    await request.write("HTTP/1.1 200 OK\r\n")
     filename = request.url[len(request.route.rstrip("*")) - 1:].strip("/")        
+
+    try:
+        size = os.stat(filename)[6]
+    except OSError:
+        raise HttpError(request, 404, "File Not Found")
+
+    try:
+        byteRange = parse_range(request.headers.get('Range'), size)
+    except ValueError:
+        await request.write("HTTP/1.1 416 Range Not Satisfiable\r\n")
+        await request.write("Content-Range: bytes */%d\r\n\r\n" % size)
+        return
+
+    if (byteRange == None):
+        start, end = 0, size - 1
+        await request.write("HTTP/1.1 200 OK\r\n")
+    else:
+        start, end = byteRange
+        await request.write("HTTP/1.1 206 Partial Content\r\n")
+        await request.write("Content-Range: bytes %d-%d/%d\r\n" % (start, end, size))
+
     await request.write("Content-Type: application/octet-stream\r\n")
+    await request.write("Accept-Ranges: bytes\r\n")
+    await request.write("Content-Length: %d\r\n" % (end - start + 1))
     await request.write("Content-Disposition: attachment; filename=%s\r\n\r\n"
                         % filename)
-    await send_file(request, filename)
+    await send_file_range(request, filename, start, end - start + 1, TRANSFER_SEGMENT)
 
-@authenticate(credentials=CREDENTIALS)
+@authenticate(credentials=basicAuth)
 async def api_download_all(request):
     await request.write("HTTP/1.1 200 OK\r\n")
     print("api_download_all...")    
@@ -233,7 +413,7 @@ async def api_download_all(request):
                             % filename)
         await send_file(request, filename)
 
-@authenticate(credentials=CREDENTIALS)
+@authenticate(credentials=basicAuth)
 async def api_delete(request):
     if request.method != "DELETE":
         raise HttpError(request, 501, "Not Implemented")
@@ -248,30 +428,87 @@ async def api_delete(request):
     await api_send_response(request)
 
 
-@authenticate(credentials=CREDENTIALS)
+@authenticate(credentials=basicAuth)
 async def upload(request):
+    """File upload, optionally resumable
+
+    A plain PUT replaces the file in one go. For resumable uploads the client
+    sends each chunk as a PUT with an `Upload-Offset` header (and the total
+    size in `Upload-Length`); a HEAD returns the offset to resume from after
+    a dropped connection. `Upload-Checksum: sha256 <base64>` is verified
+    before the file is moved into place.
+    """
+    output_file = request.url[len(request.route.rstrip("*")) - 1:].strip("\/")
+    tmp_file = output_file + '.tmp'
+
+    if request.method == "HEAD":
+        await request.write("HTTP/1.1 200 OK\r\n")
+        await request.write("Upload-Offset: %d\r\n\r\n" % get_file_size(tmp_file))
+        return
+
     if request.method != "PUT":
         raise HttpError(request, 501, "Not Implemented")
 
-    bytesleft = int(request.headers.get('Content-Length', 0))
+    try:
+        bytesleft = int(request.headers.get('Content-Length', 0))
+        offset = request.headers.get('Upload-Offset')
+        offset = None if offset == None else int(offset)
+        total = int(request.headers.get('Upload-Length', -1))
+    except ValueError:
+        raise HttpError(request, 400, "Bad Request")
+
+    if offset == None:
+        if not bytesleft:
+            await request.write("HTTP/1.1 204 No Content\r\n\r\n")
+            return
+
+        mode = 'wb'
+        total = bytesleft
+    else:
+        received = get_file_size(tmp_file)
 
-    if not bytesleft:
-        await request.write("HTTP/1.1 204 No Content\r\n\r\n")
-        return
+        if offset != received:
+            await request.write("HTTP/1.1 409 Conflict\r\n")
+            await request.write("Upload-Offset: %d\r\n\r\n" % received)
+            return
 
-    output_file = request.url[len(request.route.rstrip("*")) - 1:].strip("\/")
-    tmp_file = output_file + '.tmp'
+        mode = 'wb' if offset == 0 else 'ab'
+
+        if total < 0:
+            total = offset + bytesleft
+
+    buf = bytearray(TRANSFER_SEGMENT)
+    mv = memoryview(buf)
 
     try:
-        with open(tmp_file, 'wb') as o:
+        with open(tmp_file, mode) as o:
             while bytesleft > 0:
-                chunk = await request.read(min(bytesleft, 64))
-                o.write(chunk)
-                bytesleft -= len(chunk)
+                n = await request.readinto(mv[:min(bytesleft, TRANSFER_SEGMENT)])
+
+                if not n:
+                    # Connection dropped, what arrived so far is kept for a resume
+                    break
+
+                o.write(mv[:n])
+                bytesleft -= n
             o.flush()
     except OSError as e:
         raise HttpError(request, 500, "Internal error")
 
+    received = get_file_size(tmp_file)
+
+    if received < total:
+        await request.write("HTTP/1.1 204 No Content\r\n")
+        await request.write("Upload-Offset: %d\r\n\r\n" % received)
+        return
+
+    checksum = request.headers.get('Upload-Checksum')
+
+    if checksum != None and checksum != "sha256 " + get_file_sha256(tmp_file, mv):
+        os.remove(tmp_file)
+        await request.write("HTTP/1.1 460 Checksum Mismatch\r\n\r\n")
+        return
+
     try:
         os.remove(output_file)
     except OSError as e:
@@ -285,7 +522,27 @@ async def upload(request):
     await api_send_response(request, 201, "Created")
 
 
-@authenticate(credentials=CREDENTIALS)
+def get_file_size(filename):
+    try:
+        return os.stat(filename)[6]
+    except OSError:
+        return 0
+
+def get_file_sha256(filename, mv):
+    file_hash = uhashlib.sha256()
+
+    with open(filename, 'rb') as f:
+        while True:
+            n = f.readinto(mv)
+
+            if not n:
+                break
+
+            file_hash.update(mv[:n])
+
+    return ubinascii.b2a_base64(file_hash.digest())[:-1].decode()
+
+@authenticate(credentials=basicAuth)
 async def file_assets(request):
     await request.write("HTTP/1.1 200 OK\r\n")
 
@@ -304,7 +561,7 @@ async def file_assets(request):
     )
 
 
-@authenticate(credentials=CREDENTIALS)
+@authenticate(credentials=basicAuth)
 async def index(request):
     await request.write(b"HTTP/1.1 200 Ok\r\n\r\n")
 
@@ -313,7 +570,7 @@ async def index(request):
         './%s/index.html' % EXAMPLE_ASSETS_DIR,
     )
 
-@authenticate(credentials=CREDENTIALS)
+@authenticate(credentials=basicAuth)
 async def todo_items(request):
     payload = request.body
     dataKey = "itemData"
@@ -330,6 +587,9 @@ async def todo_items(request):
         await request.write("Content-Type: application/json\r\n\r\n")        
         await request.write(json.dumps(result))
     elif request.method == "GET":
+        if (await api_send_cached(request, ("ToDoItem",))):
+            return
+
         urlParts = request.url.split('/')
         id = urlParts[3]        
 
@@ -343,9 +603,7 @@ async def todo_items(request):
             id = id.replace("%22", "'")
             result = await toDoController.GetItemById(id, True)
             
-        await request.write("HTTP/1.1 200 OK\r\n")
-        await request.write("Content-Type: application/json\r\n\r\n")
-        await request.write(json.dumps(result))
+        await api_send_cacheable(request, ("ToDoItem",), result)
     elif request.method == "PUT":
         urlParts = request.url.split('/')
         #print("len urlparts = " + str(len(urlParts)))
@@ -385,7 +643,7 @@ async def todo_items(request):
     else:
         raise HttpError(request, 501, "Not Implemented")
 
-@authenticate(credentials=CREDENTIALS)
+@authenticate(credentials=basicAuth)
 async def assets(request):
     payload = request.body
     dataKey = "assetData"
@@ -402,6 +660,9 @@ async def assets(request):
         await request.write("Content-Type: application/json\r\n\r\n")        
         await request.write(json.dumps(result))        
     elif request.method == "GET":
+        if (await api_send_cached(request, ("Asset",))):
+            return
+
         urlParts = request.url.split('/')
         id = urlParts[3]                
 
@@ -415,9 +676,7 @@ async def assets(request):
             id = id.replace("%22", "'")
             result = await assetController.GetAssetById(id, True)
             
-        await request.write("HTTP/1.1 200 OK\r\n")
-        await request.write("Content-Type: application/json\r\n\r\n")
-        await request.write(json.dumps(result))
+        await api_send_cacheable(request, ("Asset",), result)
     elif request.method == "PUT":
         urlParts = request.url.split('/')
         
@@ -451,7 +710,7 @@ async def assets(request):
     else:
         raise HttpError(request, 501, "Not Implemented")
 
-@authenticate(credentials=CREDENTIALS)
+@authenticate(credentials=basicAuth)
 async def meters(request):
     payload = request.body
     dataKey = "meterData"
@@ -468,6 +727,9 @@ async def meters(request):
         await request.write("Content-Type: application/json\r\n\r\n")        
         await request.write(json.dumps(result))        
     elif request.method == "GET":
+        if (await api_send_cached(request, ("Meter", "MeterReading"))):
+            return
+
         urlParts = request.url.split('/')
         print("url: " + request.url)
         print("url parts: " + str(urlParts))                
@@ -493,9 +755,7 @@ async def meters(request):
                 id = id.replace("%22", "'")
                 result = await meterController.GetMeterById(id, True)
             
-        await request.write("HTTP/1.1 200 OK\r\n")
-        await request.write("Content-Type: application/json\r\n\r\n")
-        await request.write(json.dumps(result))
+        await api_send_cacheable(request, ("Meter", "MeterReading"), result)
     elif request.method == "PUT":
         urlParts = request.url.split('/')
         
@@ -529,7 +789,7 @@ async def meters(request):
     else:
         raise HttpError(request, 501, "Not Implemented")
 
-@authenticate(credentials=CREDENTIALS)
+@authenticate(credentials=basicAuth)
 async def asset_tasks(request):
     payload = request.body
     dataKey = "assetTaskData"
@@ -546,6 +806,9 @@ async def asset_tasks(request):
         await request.write("Content-Type: application/json\r\n\r\n")        
         await request.write(json.dumps(result))        
     elif request.method == "GET":
+        if (await api_send_cached(request, ("AssetTask",))):
+            return
+
         urlParts = request.url.split('/')
         id = urlParts[3]        
         
@@ -558,9 +821,7 @@ async def asset_tasks(request):
             id = id.replace("%22", "'")
             result = await assetTaskController.GetAssetTaskById(id, True)
             
-        await request.write("HTTP/1.1 200 OK\r\n")
-        await request.write("Content-Type: application/json\r\n\r\n")
-        await request.write(json.dumps(result))
+        await api_send_cacheable(request, ("AssetTask",), result)
     elif request.method == "PUT":
         urlParts = request.url.split('/')
         
@@ -594,7 +855,7 @@ async def asset_tasks(request):
     else:
         raise HttpError(request, 501, "Not Implemented")
 
-@authenticate(credentials=CREDENTIALS)
+@authenticate(credentials=basicAuth)
 async def meter_readings(request):
     payload = request.body
     dataKey = "meterReadingData"
@@ -611,6 +872,9 @@ async def meter_readings(request):
         await request.write("Content-Type: application/json\r\n\r\n")        
         await request.write(json.dumps(result))        
     elif request.method == "GET":
+        if (await api_send_cached(request, ("MeterReading",))):
+            return
+
         urlParts = request.url.split('/')
         id = urlParts[3]        
 
@@ -623,9 +887,7 @@ async def meter_readings(request):
             id = id.replace("%22", "'")
             result = await meterReadingController.GetMeterReadingById(id, True)
             
-        await request.write("HTTP/1.1 200 OK\r\n")
-        await request.write("Content-Type: application/json\r\n\r\n")
-        await request.write(json.dumps(result))
+        await api_send_cacheable(request, ("MeterReading",), result)
     elif request.method == "PUT":
         urlParts = request.url.split('/')
         
@@ -699,9 +961,16 @@ async def main():
 
 naw = Nanoweb(3002)
 naw.assets_extensions += ('ico',)
+naw.extract_headers += ('If-None-Match', 'Accept', 'Last-Event-ID', 'Range',
+                        'Upload-Offset', 'Upload-Length', 'Upload-Checksum')
+naw.stream_routes += ('/api/upload/*',)
 naw.STATIC_DIR = EXAMPLE_ASSETS_DIR
 
 naw.routes = {
+    '/api/status': api_status,
+    '/api/changes': api_changes,
+    '/api/download/*': api_download,
+    '/api/upload/*': upload,
     '/api/todoitems/': todo_items,
     '/api/assets/': assets,
     '/api/assettasks/': asset_tasks,
@@ -0,0 +1,147 @@
+# file_compress.py Per-block compression for file sync
+# Used by mqtt_file_sender.py, file_sync_sender.py, file_async_receiver.py
+# and file_server_stm32f769_async.py.
+
+# Every block is compressed on its own, so blocks can be resent or arrive
+# out of order. Two methods:
+#   "deflate" raw deflate with a 1 KB window, through the deflate module
+#             (MicroPython 1.21+) or zlib where the port can compress
+#   "lz"      a small LZSS in pure Python for ports without a compressor
+# Decompressing deflate only needs the decompressor, which almost every
+# port has, so a board that can not compress can still receive it.
+
+try:
+    import deflate
+except ImportError:
+    deflate = None
+
+try:
+    import zlib
+except ImportError:
+    try:
+        import uzlib as zlib
+    except ImportError:
+        zlib = None
+
+import io
+
+DEFLATE_WBITS = 10
+LZ_WINDOW = 4096
+LZ_MIN_MATCH = 3
+LZ_MAX_MATCH = 18
+
+
+def _deflate(data):
+    if deflate is not None:
+        buf = io.BytesIO()
+        with deflate.DeflateIO(buf, deflate.RAW, DEFLATE_WBITS) as d:
+            d.write(data)
+        return buf.getvalue()
+    c = zlib.compressobj(wbits=-DEFLATE_WBITS)
+    return c.compress(data) + c.flush()
+
+
+def _inflate(data):
+    if deflate is not None:
+        return deflate.DeflateIO(io.BytesIO(data), deflate.RAW, DEFLATE_WBITS).read()
+    return zlib.decompress(data, -DEFLATE_WBITS)
+
+
+def _can_deflate():
+    try:
+        return _inflate(_deflate(b"test")) == b"test"
+    except Exception:  # No compressor on this port
+        return False
+
+
+def _can_inflate():
+    try:
+        # Raw deflate of b"test"
+        return _inflate(b"+I-.\x01\x00") == b"test"
+    except Exception:
+        return False
+
+
+# The data is a flag byte followed by 8 items, repeated. Bit i of the flag
+# byte says whether item i is a literal byte (0) or a match (1) of two bytes:
+# 12 bits distance - 1 and 4 bits length - LZ_MIN_MATCH.
+def lz_compress(data):
+    n = len(data)
+    out = bytearray()
+    table = {}
+    i = 0
+    while i < n:
+        flag_pos = len(out)
+        out.append(0)
+        flags = 0
+        for bit in range(8):
+            if i >= n:
+                break
+            length = 0
+            if i + LZ_MIN_MATCH <= n:
+                key = data[i] | data[i + 1] << 8 | data[i + 2] << 16
+                match = table.get(key)
+                table[key] = i
+                if match is not None and i - match <= LZ_WINDOW:
+                    length = LZ_MIN_MATCH
+                    max_length = min(LZ_MAX_MATCH, n - i)
+                    while length < max_length and data[match + length] == data[i + length]:
+                        length += 1
+            if length:
+                distance = i - match - 1
+                out.append(distance >> 4)
+                out.append((distance & 0xF) << 4 | (length - LZ_MIN_MATCH))
+                flags |= 1 << bit
+                i += length
+            else:
+                out.append(data[i])
+                i += 1
+        out[flag_pos] = flags
+    return out
+
+
+def lz_decompress(data):
+    n = len(data)
+    out = bytearray()
+    i = 0
+    while i < n:
+        flags = data[i]
+        i += 1
+        for bit in range(8):
+            if i >= n:
+                break
+            if flags >> bit & 1:
+                start = len(out) - ((data[i] << 4 | data[i + 1] >> 4) + 1)
+                for k in range((data[i + 1] & 0xF) + LZ_MIN_MATCH):
+                    out.append(out[start + k])
+                i += 2
+            else:
+                out.append(data[i])
+                i += 1
+    return out
+
+
+COMPRESS = {"lz": lz_compress}
+DECOMPRESS = {"lz": lz_decompress}
+
+if _can_deflate():
+    COMPRESS["deflate"] = _deflate
+if _can_inflate():
+    DECOMPRESS["deflate"] = _inflate
+
+
+# The method a sender should offer: deflate when this port can compress.
+def best():
+    return "deflate" if "deflate" in COMPRESS else "lz"
+
+
+def supported():
+    return list(DECOMPRESS)
+
+
+def compress(method, data):
+    return COMPRESS[method](data)
+
+
+def decompress(method, data):
+    return DECOMPRESS[method](data)
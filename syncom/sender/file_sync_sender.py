@@ -10,15 +10,30 @@ import hw_pico as hardware
 import net_local
 from queue import Queue
 import gc
+import file_compress
+import file_walk
 
 _send_q = Queue()
-_file_wait_q = Queue()
+_file_queue_size = 8  # The directory walk waits while this many files are queued
+_file_wait_q = Queue(_file_queue_size)
 _file_in_progress_q = Queue()
 _qos = 1
 _data_block_size = 500
 _out_hash_sha256 = uhashlib.sha256()
 _file_block_sequence_nr = 0
 _topic_files = 'pico1_files'
+_topic_ack = 'pico2w_file_sync/ack'
+_compression = file_compress.best()  # None sends blocks as they are
+_transfer_compression = _compression  # Agreed with the receiver per file
+_reply = None
+_reply_timeout = 5000
+_done = None
+_done_timeout = 10000
+_max_restarts = 3
+_last_sent = None
+_sync_root = ''  # '' is the current directory, e.g. '/sd/btree_storage'
+_sync_include = ['*']  # Globs, see file_walk.py
+_sync_exclude = []
 _event_file_ready_for_backup = asyncio.Event()
 _event_file_backup_completed = asyncio.Event()
 _event_send_q_ready = asyncio.Event()
@@ -70,13 +85,26 @@ async def publish_test(mqtt_link):
         count += 1
         await asyncio.sleep_ms(500)
 
+def callback_ack(topic, msg, retained):
+    global _reply, _done
+    reply = ujson.loads(msg)
+    
+    # Replies to transfers without a FileId are for this sender's file
+    if (reply.get("Category") == 'Files' and reply.get("FileId") == None):
+        if (reply["Step"] == 'Full' or reply["Step"] == 'Reject'):
+            _reply = reply
+        elif (reply["Step"] == 'Done' or reply["Step"] == 'Unknown'):
+            _done = reply
+
 async def sender(mqtt_link, msg_q):
+    global _last_sent
     print("sender start...")
 
     while True:
         if (msg_q.qsize() > 0):
             msg = await msg_q.get()
             await mqtt_link.publish(_topic_files, msg, False, _qos)
+            _last_sent = msg
             await asyncio.sleep_ms(100)
             
         await asyncio.sleep_ms(500)            
@@ -94,7 +122,8 @@ async def get_all_files(msg_q):
     await send_start(msg_q)    
     
     _event_file_ready_for_backup.clear()
-    _event_file_backup_completed.clear()
+    # Lets fileQueueProducer take files while the rest are still queued
+    _event_file_backup_completed.set()
 
     if (_do_selected_files == True):
         filenames = []
@@ -113,49 +142,79 @@ async def get_all_files(msg_q):
         #filenames.append('syncom_test_host.py')
         #filenames.append('syncom_test_host_one_task.py')                                        
     elif (_do_all_files == True):
-        for filename in os.listdir():
-            filenames.append(filename)
+        # A generator: files are queued as the walk finds them, the bounded
+        # queue holds it up while the transfers catch up
+        filenames = file_walk.walk(_sync_root, _sync_include, _sync_exclude)
 
     for filename in filenames:
         await _file_wait_q.put(filename)
 
-    _event_file_backup_completed.set()                
-
 async def processFile(fileName, msg_q):
     global _out_hash_sha256
     global _data_block_size
     global _file_block_sequence_nr
+    global _done
     
     _event_file_ready_for_backup.clear()    
     print("Starting backup single file...")
             
     if file_exist(fileName):
-        fo = open(fileName, "rb")
         file_properties = os.stat(fileName)
         file_size = file_properties[6]
         
-        await send_header(fileName, file_size, msg_q)
-        
-        print("file opened...%s" % fileName)
-        run_flag = True
-        _out_hash_sha256 = uhashlib.sha256()
-        _file_block_sequence_nr = 1
-        nr_bytes_read = 0
-        
-        while run_flag:
-            file_block = fo.read(_data_block_size)
-            nr_bytes_read += len(file_block)
+        for attempt in range(_max_restarts + 1):
+            _done = None
             
-            if file_block:
-                await send_file_block(fileName, file_block, file_size, nr_bytes_read, _file_block_sequence_nr, msg_q)
-                _file_block_sequence_nr += 1                    
-            else:
-                await send_end(fileName, msg_q)
-                run_flag = False
-                fo.close()
+            if (await negotiate_header(fileName, file_size, msg_q) == False):
+                print("file %s refused by receiver" % fileName)
+                return
+                
+            fo = open(fileName, "rb")
+            print("file opened...%s" % fileName)
+            run_flag = True
+            _out_hash_sha256 = uhashlib.sha256()
+            _file_block_sequence_nr = 1
+            nr_bytes_read = 0
+            
+            while run_flag:
+                file_block = fo.read(_data_block_size)
+                nr_bytes_read += len(file_block)
+                
+                if file_block:
+                    await send_file_block(fileName, file_block, file_size, nr_bytes_read, _file_block_sequence_nr, msg_q)
+                    _file_block_sequence_nr += 1                    
+                else:
+                    payload = await send_end(fileName, msg_q)
+                    run_flag = False
+                    fo.close()
+                    
+            if (await wait_done(payload) != False):
+                return
+                
+            # E.g. a Full that came after the Header timed out: the receiver
+            # dropped the blocks and answers the End with Unknown
+            print("file %s not copied, restarting" % fileName)
+            
+        print("file %s failed" % fileName)
     else:
         print("file %s not found" % fileName)
 
+async def wait_done(payload):
+    # True or False from the receiver's Done, False for Unknown, or None
+    # from receivers that do not answer the End
+    while (_last_sent is not payload):
+        await asyncio.sleep_ms(100)
+        
+    timeout = utime.ticks_add(utime.ticks_ms(), _done_timeout)
+    
+    while (_done == None and utime.ticks_diff(timeout, utime.ticks_ms()) > 0):
+        await asyncio.sleep_ms(50)
+        
+    if (_done == None):
+        return None
+        
+    return _done["Step"] == 'Done' and _done.get("Ok") == True
+
 def file_exist(filename):
     try:
         f = open(filename, "r")
@@ -181,6 +240,40 @@ async def send_start(msg_q):
     await msg_q.put(payload)
     print("Start added to queue...")    
 
+async def negotiate_header(fileName, fileSize, msg_q):
+    # Sends the Header and gives the receiver _reply_timeout to refuse the
+    # compression method (Full, with the methods it has) or the transfer
+    # (Reject, too busy). False if it still refuses after _max_restarts.
+    # A refusal that comes later is caught by wait_done.
+    global _reply, _transfer_compression
+    _transfer_compression = _compression
+    
+    for attempt in range(_max_restarts + 1):
+        _reply = None
+        payload = await send_header(fileName, fileSize, msg_q)
+        
+        while (_last_sent is not payload):
+            await asyncio.sleep_ms(100)
+            
+        timeout = utime.ticks_add(utime.ticks_ms(), _reply_timeout)
+        
+        while (_reply == None and utime.ticks_diff(timeout, utime.ticks_ms()) > 0):
+            await asyncio.sleep_ms(50)
+            
+        if (_reply == None):
+            return True
+            
+        if (_reply["Step"] == 'Full'):
+            # Every receiver with compression support has the pure Python lz
+            receiver_compression = _reply.get("Compression") or []
+            _transfer_compression = 'lz' if 'lz' in receiver_compression else None
+            print("file %s compression refused, using %s" % (fileName, _transfer_compression))
+        else:
+            print("receiver busy, retrying: " + fileName)
+            await asyncio.sleep(2)
+            
+    return False
+
 async def send_header(fileName, fileSize, msg_q):
     print("Preparing header...")
     msgId = get_msg_id()
@@ -195,15 +288,31 @@ async def send_header(fileName, fileSize, msg_q):
                     "RspReceivedOK": False                    
                 }
     
+    if (_transfer_compression != None):
+        file_operation["Compression"] = _transfer_compression
+    
     payload = ujson.dumps(file_operation)
     await msg_q.put(payload)
     print("Header added to queue...")    
+    
+    return payload
 
 async def send_file_block(file_name, file_content, file_size, nr_bytes_read, _file_block_sequence_nr, msg_q):
     global _out_hash_sha256
     
     print("Preparing block...")        
     _out_hash_sha256.update(file_content)    
+    compressed = None
+    
+    if (_transfer_compression != None):
+        compressed = file_compress.compress(_transfer_compression, file_content)
+        
+        # Only worth it when the block shrinks
+        if (len(compressed) < len(file_content)):
+            file_content = compressed
+        else:
+            compressed = None
+    
     base64_data = ubinascii.b2a_base64(file_content)
     percentage = ((nr_bytes_read) / file_size) * 100
     msgId = get_msg_id()
@@ -220,6 +329,9 @@ async def send_file_block(file_name, file_content, file_size, nr_bytes_read, _fi
                     "RspReceivedOK": False                    
                  }
     
+    if (compressed != None):
+        file_operation["Compression"] = _transfer_compression
+    
     payload = ujson.dumps(file_operation)
     await msg_q.put(payload)
 
@@ -242,18 +354,22 @@ async def send_end(filename, msg_q):
     
     payload = ujson.dumps(file_operation)
     await msg_q.put(payload)
+    
+    return payload
 
 def cbnet(state, _):  # Show WiFi state. Discard mqtt_link arg.
     print('cbnet: network is ', 'up' if state else 'down')
 
 async def main(mqtt_link, send_q):
+    asyncio.create_task(mqtt_link.subscribe(_topic_ack, 0, callback_ack))
+    # Started first, the Header has to go out before its file is sent
+    asyncio.create_task(sender(mqtt_link, send_q))
+    
     if (_do_test_messages == True):
         asyncio.create_task(publish_test(mqtt_link))
 
     if (_do_file_backup == True):
         await get_all_files(send_q)
-
-    asyncio.create_task(sender(mqtt_link, send_q))
     
     print("main running...")
     
@@ -0,0 +1,83 @@
+# file_walk.py Recursive walk of the files to sync
+# Used by mqtt_file_sender.py and file_sync_sender.py.
+
+# walk() is a generator over os.ilistdir, so a tree with thousands of files,
+# e.g. the node directories under /sd/btree_storage, is never held as a
+# list: only one directory iterator per level is open at a time.
+# Patterns are globs where '*' and '?' stay within one path component and
+# '**' spans directories. A pattern without '/' is matched against the file
+# or directory name, one with '/' against the path below the walked root.
+# Excluded directories are not entered, include only applies to files.
+
+import os
+
+DIR_TYPE = 0x4000
+
+
+def _join(head, tail):
+    if not head:
+        return tail
+    if head.endswith("/"):
+        return head + tail
+    return head + "/" + tail
+
+
+def match(pattern, path):
+    return _match(pattern, 0, path, 0)
+
+
+def _match(p, i, s, j):
+    while i < len(p):
+        c = p[i]
+        if c == "*":
+            if p[i + 1 : i + 2] == "*":
+                i += 2
+                # "**/" also matches no directory at all
+                if p[i : i + 1] == "/" and _match(p, i + 1, s, j):
+                    return True
+                for k in range(j, len(s) + 1):
+                    if _match(p, i, s, k):
+                        return True
+                return False
+            i += 1
+            for k in range(j, len(s) + 1):
+                if _match(p, i, s, k):
+                    return True
+                if k < len(s) and s[k] == "/":
+                    break
+            return False
+        if j >= len(s):
+            return False
+        if c == "?":
+            if s[j] == "/":
+                return False
+        elif c != s[j]:
+            return False
+        i += 1
+        j += 1
+    return j == len(s)
+
+
+def matches(patterns, path, name):
+    for pattern in patterns:
+        if match(pattern, path if "/" in pattern else name):
+            return True
+    return False
+
+
+# Yields the path of every file below root ("" for the current directory)
+# that matches include and none of exclude.
+def walk(root="", include=("*",), exclude=()):
+    yield from _walk(root, "", include, exclude)
+
+
+def _walk(root, rel, include, exclude):
+    for entry in os.ilistdir(_join(root, rel) or "."):
+        name = entry[0]
+        path = _join(rel, name)
+        if matches(exclude, path, name):
+            continue
+        if entry[1] == DIR_TYPE:
+            yield from _walk(root, path, include, exclude)
+        elif matches(include, path, name):
+            yield _join(root, path)